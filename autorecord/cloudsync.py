@@ -0,0 +1,119 @@
+"""
+Incremental copy of a night's output directory to cloud storage.
+
+A manifest in the source directory remembers the size, mtime and BLAKE2b
+hash of every file last copied. A run only copies files that are new,
+changed or missing at the destination. A file whose mtime moved but whose
+content hash did not is just re-recorded in the manifest. Copies run on a
+thread pool, use large buffers, hash while copying, and land with an atomic
+rename, so the synced folder never sees a half-written file. Transient files
+(recordings about to be deleted, scratch files) are never copied.
+"""
+import fnmatch
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# from nfc-processing, which record-nfc.py puts on sys.path
+from manifest import PARTIAL_SUFFIX, load_manifest, save_manifest
+
+MANIFEST_NAME = '.cloudsync.json'
+COPY_BUFFER_BYTES = 8 * 1024 * 1024
+
+# never worth uploading: predetect scratch audio, FLAC seek indexes, interrupted copies
+DEFAULT_TRANSIENT_PATTERNS = ('*-candidates.wav', '*.seekidx', '*' + PARTIAL_SUFFIX, MANIFEST_NAME)
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_BYTES), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def copy_file(src, dest):
+    """Copy `src` to `dest` via a temp file and atomic rename; returns the content hash."""
+    h = hashlib.blake2b(digest_size=16)
+    partial = dest + PARTIAL_SUFFIX
+    try:
+        with open(src, 'rb') as fin, open(partial, 'wb') as fout:
+            for chunk in iter(lambda: fin.read(COPY_BUFFER_BYTES), b''):
+                h.update(chunk)
+                fout.write(chunk)
+        os.replace(partial, dest)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return h.hexdigest()
+
+
+def is_transient(path, transient_files=(), transient_patterns=DEFAULT_TRANSIENT_PATTERNS):
+    name = os.path.basename(path)
+    return os.path.normcase(os.path.abspath(path)) in transient_files or any(
+        fnmatch.fnmatch(name, pattern) for pattern in transient_patterns
+    )
+
+
+def sync_directory(src_directory, dest_directory, workers=4, transient_files=(), flatten=True):
+    """
+    Copy new or changed files under `src_directory` to `dest_directory`.
+
+    With `flatten` every file lands directly in `dest_directory`, as the
+    nightly upload always has; otherwise the relative layout is kept.
+    `transient_files` are paths that must never be copied. Returns
+    (copied, skipped) counts.
+    """
+    os.makedirs(dest_directory, exist_ok=True)
+    manifest_path = os.path.join(src_directory, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    transient_files = {os.path.normcase(os.path.abspath(path)) for path in transient_files}
+
+    to_copy = []
+    skipped = 0
+    for root, dirs, files in os.walk(src_directory):
+        for file in files:
+            src = os.path.join(root, file)
+            if is_transient(src, transient_files):
+                continue
+            rel = os.path.relpath(src, src_directory)
+            dest = os.path.join(dest_directory, file if flatten else rel)
+            stat = os.stat(src)
+            entry = manifest.get(rel)
+
+            if entry and os.path.exists(dest) and os.path.getsize(dest) == stat.st_size:
+                if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    skipped += 1
+                    continue
+                if entry['size'] == stat.st_size and entry['hash'] == file_hash(src):
+                    entry['mtime'] = stat.st_mtime
+                    skipped += 1
+                    continue
+            to_copy.append((rel, src, dest, stat))
+
+    def copy(item):
+        rel, src, dest, stat = item
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        print(f"Copying {rel}")
+        return rel, {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': copy_file(src, dest)}
+
+    copied = 0
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(copy, item) for item in to_copy]
+        for item, future in zip(to_copy, futures):
+            try:
+                rel, entry = future.result()
+            except OSError as exc:
+                failures.append(item[0])
+                print(f"Could not copy {item[1]}: {exc}")
+                continue
+            manifest[rel] = entry
+            copied += 1
+
+    save_manifest(manifest_path, manifest)
+    print(f"Synced {src_directory} to {dest_directory}: {copied} copied, {skipped} unchanged, {len(failures)} failed.")
+    if failures:
+        raise RuntimeError(f"{len(failures)} files failed to copy")
+    return copied, skipped
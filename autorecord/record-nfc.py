@@ -1,13 +1,33 @@
 from configparser import ConfigParser
 import csv
 import os
-import shutil
+import queue
 import subprocess
 from datetime import datetime, timedelta, timezone
 import sys
+import threading
 import time
 import click
 import pytz
+import soundfile as sf
+
+from scheduler import DONE, Job, run_jobs
+
+NFC_PROCESSING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'nfc-processing')
+sys.path.insert(0, NFC_PROCESSING_DIR)
+from cloudsync import sync_directory  # noqa: E402
+import getsnips  # noqa: E402
+import nightstats  # noqa: E402
+import runlog  # noqa: E402
+import shards  # noqa: E402
+from audioreader import verify_flac  # noqa: E402
+from predetect import (  # noqa: E402
+    candidate_filenames,
+    find_candidates,
+    remap_detections,
+    write_candidate_audio,
+    write_timemap,
+)
 
 DEFAULT_CFG = 'record-nfc.ini'
 
@@ -18,10 +38,9 @@ def execute(cmd, dry_run=False, failure_mode="EXIT"):
     errorlevel = 0
 
     if not dry_run:
-        try:
-            p = subprocess.run(cmd, check=True)
-        except subprocess.CalledProcessError as exc:
-            errorlevel = exc.returncode
+        with runlog.stage("execute", command=os.path.basename(str(cmd[0]))) as record:
+            errorlevel = runlog.run_process(cmd, record)
+            record["returncode"] = errorlevel
 
         print(f"execute: Completed with return code {errorlevel}.")
 
@@ -78,6 +97,286 @@ def configure(ctx, param, filename):
     ctx.default_map = options
 
 
+# segments can be shorter than a minute, so their names carry seconds too
+SEGMENT_TIMESTAMP_FORMAT = '%Y-%m-%d %H%M%S%z'
+
+
+def sox_record_cmd(sox_filepath, audio_input_type, audio_input_name, outfile, record_time):
+    return sox_segmented_cmd(sox_filepath, audio_input_type, audio_input_name, outfile, [record_time])
+
+
+def sox_segmented_cmd(sox_filepath, audio_input_type, audio_input_name, outfile, record_times):
+    """
+    One sox run writing consecutive files of `record_times`: each `trim` is its
+    own effects chain and `newfile` starts the next file on the next sample,
+    so no audio is lost between segments. With more than one, sox numbers the
+    files outfile001, outfile002, ...
+    """
+    cmd = [sox_filepath]
+    if audio_input_type:
+        cmd += ['-t', audio_input_type]
+    cmd += ['-c', '1', '-r', '22050', audio_input_name, outfile]
+    for i, record_time in enumerate(record_times):
+        cmd += [':', 'newfile', ':'] if i else []
+        cmd += ['trim', '0', record_time]
+    return cmd
+
+
+def record_time_frames(record_time, samplerate=22050):
+    """Frames sox records for a trim of `record_time` ([[hh:]mm:]ss[.frac])."""
+    secs = 0.0
+    for part in record_time.split(':'):
+        secs = secs * 60 + float(part)
+    return int(round(secs * samplerate))
+
+
+def check_quality(file):
+    """Write <file_base>_quality.csv: per-minute level, rain/wind/silence/clipping flags."""
+    stats = nightstats.night_stats(file)
+    nightstats.write_stats(stats, nightstats.stats_filename(file))
+    summary = nightstats.night_summary(stats)
+    runlog.count(minutes=summary['minutes'], minutes_flagged=sum(1 for m in stats if m.flags))
+    flags = ", ".join(f"{flag} {summary[flag]}" for flag in nightstats.FLAGS if summary[flag])
+    print(f"{file}: {nightstats.bad_fraction(stats):.0%} of {summary['minutes']} minutes flagged ({flags or 'none'})")
+    return stats
+
+
+def worth_detecting(file, max_bad_fraction=1.0):
+    fn = nightstats.stats_filename(file)
+    if max_bad_fraction >= 1.0 or not os.path.exists(fn):
+        return True
+    fraction = nightstats.bad_fraction(nightstats.read_stats(fn))
+    if fraction > max_bad_fraction:
+        print(f"Not running the detector on {file}: {fraction:.0%} of minutes flagged.")
+        return False
+    return True
+
+
+def run_detector(files, predetect=False, max_bad_fraction=1.0, detector_jobs=1):
+    files = [file for file in files if worth_detecting(file, max_bad_fraction)]
+    if not files:
+        runlog.count(recordings_skipped=1)
+        raise RuntimeError("every recording was flagged as rain, wind, silence or worse")
+    if predetect:
+        # nighthawk only sees the candidate regions; detections are mapped back afterwards
+        candidates = []
+        for file in files:
+            with runlog.stage("predetect", file=file):
+                intervals = find_candidates(file)
+                runlog.count(candidates=len(intervals))
+                if not intervals:
+                    print(f"No candidate regions in {file}, nothing for nighthawk.")
+                    continue
+                candidate_file, fn_timemap, _ = candidate_filenames(file)
+                timemap = write_candidate_audio(file, intervals, candidate_file)
+                write_timemap(timemap, fn_timemap)
+            candidates.append((file, candidate_file, timemap))
+        if candidates:
+            execute(['nighthawk', '--audacity-output', *[c for _, c, _ in candidates]], failure_mode="IGNORE")
+        for file, candidate_file, timemap in candidates:
+            _, _, fn_candidate_csv = candidate_filenames(file)
+            if os.path.exists(fn_candidate_csv):
+                remap_detections(
+                    fn_candidate_csv, timemap, f"{os.path.splitext(file)[0]}_detections.csv", file
+                )
+            else:
+                print(f"nighthawk wrote no {fn_candidate_csv}")
+            if os.path.exists(candidate_file):
+                os.remove(candidate_file)
+    elif detector_jobs > 1:
+        # one long recording keeps one core busy; shards of it keep detector_jobs busy
+        for file in files:
+            shards.detect_sharded(file, jobs=detector_jobs)
+    else:
+        execute(['nighthawk', '--audacity-output', *files], failure_mode="IGNORE")
+
+
+def encode_flac(sox_filepath, wav_file, flac_file):
+    execute([sox_filepath, wav_file, flac_file], failure_mode="RAISE")
+    if not os.path.exists(flac_file):
+        raise RuntimeError(f"Could not find flac {flac_file}")
+    # the WAV is deleted once this returns, so the FLAC must be proven whole first
+    verify_flac(flac_file, expected_frames=sf.info(wav_file).frames)
+
+
+def stage_job(stage, file, func, *args, **kwargs):
+    """A Job named "<stage> <file name>" that is logged as a run-log stage."""
+    return Job(f"{stage} {os.path.basename(file)}", runlog.staged(stage, func, file=file), *args, **kwargs)
+
+
+def recording_jobs(
+    file,
+    sox_filepath,
+    file_type,
+    predetect=False,
+    max_bad_fraction=1.0,
+    pack_clips=False,
+    detector_jobs=1,
+    expected_frames=None,
+):
+    """
+    Jobs for one recording: the quality scan, then the detector (unless too
+    much of the recording is flagged), then clip; FLAC encoding alongside
+    them; and deleting the WAV once the FLAC exists and clip is done with it.
+    A recording made straight to FLAC has its integrity (and, given
+    `expected_frames`, its length) checked instead, and is only clipped once
+    that passes. With `pack_clips` the clips go into one indexed pack file per recording;
+    with `detector_jobs` > 1 the detector runs on that many shards at once.
+    """
+    name = os.path.basename(file)
+    clip_deps = [f"detect {name}"] + ([f"verify {name}"] if file_type == 'flac' else [])
+    jobs = [
+        stage_job("quality", file, check_quality, file),
+        stage_job(
+            "detect", file, run_detector, [file], predetect, max_bad_fraction, detector_jobs, after=[f"quality {name}"]
+        ),
+        stage_job("clip", file, getsnips.clip_file, file, pack=pack_clips, deps=clip_deps),
+    ]
+    if file_type == 'wav':
+        jobs += [
+            stage_job("flac", file, encode_flac, sox_filepath, file, f"{os.path.splitext(file)[0]}.flac"),
+            stage_job("delete", file, os.remove, file, deps=[f"flac {name}"], after=[f"clip {name}"]),
+        ]
+    elif file_type == 'flac':
+        jobs.append(stage_job("verify", file, verify_flac, file, expected_frames=expected_frames))
+    return jobs
+
+
+def render_clip_spectrograms(clips_directory):
+    return getsnips.render_spectrograms(getsnips.expand_audio_paths([clips_directory]), renderer='fast')
+
+
+def upload(full_output_directory, cloud_storage_directory, **kwargs):
+    copied, skipped = sync_directory(full_output_directory, cloud_storage_directory, **kwargs)
+    runlog.count(files_copied=copied, files_unchanged=skipped)
+
+
+def night_jobs(jobs, full_output_directory, cloud_storage_directory=None, transient_files=(), upload_workers=4):
+    """
+    Spectrograms once every clip job has finished, then the upload after
+    everything else, provided every FLAC recorded directly passed its verify
+    job. `transient_files` (the night's WAVs) are never uploaded.
+    """
+    clips_directory = os.path.join(full_output_directory, 'clips')
+    spec = Job(
+        "spec",
+        runlog.staged("spec", render_clip_spectrograms, file=clips_directory),
+        clips_directory,
+        after=[job.name for job in jobs if job.name.startswith('clip ')],
+    )
+    night = [spec]
+    if cloud_storage_directory:
+        night.append(
+            Job(
+                "upload",
+                runlog.staged("upload", upload, file=full_output_directory),
+                full_output_directory,
+                cloud_storage_directory,
+                workers=upload_workers,
+                transient_files=transient_files,
+                deps=[job.name for job in jobs if job.name.startswith('verify ')],
+                after=[job.name for job in jobs] + [spec.name],
+            )
+        )
+    return night
+
+
+def segment_files(output_directory, stem, file_type):
+    """The files sox has started so far for `stem` (numbered unless there is just one), in order."""
+    files = []
+    for name in os.listdir(output_directory):
+        number = name[len(stem) : -len(file_type) - 1]
+        if name.startswith(stem) and name.endswith(f".{file_type}") and (number.isdigit() or not number):
+            files.append(os.path.join(output_directory, name))
+    return sorted(files)
+
+
+def record_segmented(
+    start_at,
+    stop_at,
+    segment_length,
+    output_directory,
+    filename_template,
+    file_type,
+    record_cmd,
+    process_segment,
+    poll_secs=1.0,
+):
+    """
+    Record until `stop_at` as back-to-back segments of `segment_length`, in a
+    single sox run so no audio falls between them. A segment is done once sox
+    has started the next one; it is then renamed from the time its first
+    sample was recorded and queued for `process_segment(file, record_time)`
+    on a background thread while the next one records. `record_cmd(outfile, record_times)`
+    gives the sox command. If sox fails, the segments it wrote are still
+    processed. Returns the segments recorded, none if `stop_at` has passed.
+    """
+    started = max(start_at, now())
+    starts, lengths = [], []
+    segment_start = started
+    while segment_start < stop_at:
+        starts.append(segment_start)
+        lengths.append(min(segment_length, stop_at - segment_start))
+        segment_start += lengths[-1]
+    if not lengths:
+        # sox without a trim would record with no end
+        print("Nothing to record: the stop time", stop_at.strftime("%Y-%m-%d %H:%M:%S"), "has passed.")
+        return []
+
+    pending = queue.Queue()
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            file, record_time = item
+            print("Processing segment", file)
+            try:
+                process_segment(file, record_time)
+            except Exception as exc:
+                print(f"Processing {file} failed: {exc}")
+
+    processor = threading.Thread(target=worker, name='segment-processor', daemon=True)
+    processor.start()
+
+    stem = f".recording-{started.strftime('%Y%m%d%H%M%S')}-"
+    record_times = [f"{length.total_seconds():g}" for length in lengths]
+    cmd = record_cmd(os.path.join(output_directory, f"{stem}.{file_type}"), record_times)
+    print("Starting", len(lengths), "segments:", started.strftime("%Y-%m-%d %H:%M:%S"), "Record Time:", stop_at - started)
+    print(sys.argv[0] + ": execute: ", cmd)
+
+    recorded_files = []
+
+    def finish(file):
+        # segments are gapless, so each starts exactly where the ones before it end
+        i = len(recorded_files)
+        segment_start = starts[i]
+        filename = format_filename(segment_start, filename_template, SEGMENT_TIMESTAMP_FORMAT)
+        segment_file = os.path.join(output_directory, f"{filename}.{file_type}")
+        os.replace(file, segment_file)
+        print("Finished segment:", segment_start.strftime("%Y-%m-%d %H:%M:%S"), segment_file)
+        recorded_files.append(segment_file)
+        pending.put((segment_file, record_times[i]))
+
+    with runlog.stage("execute", command=os.path.basename(str(cmd[0]))) as record:
+        p = subprocess.Popen(cmd)
+        while runlog.wait(p, record, timeout=poll_secs) is None:
+            for file in segment_files(output_directory, stem, file_type)[:-1]:
+                finish(file)
+        record["returncode"] = p.returncode
+
+    for file in segment_files(output_directory, stem, file_type):
+        finish(file)
+    if p.returncode:
+        print(f"Recording failed ({p.returncode}) after {len(recorded_files)} of {len(lengths)} segments.")
+
+    print("Waiting for segment processing to finish...")
+    pending.put(None)
+    processor.join()
+    return recorded_files
+
+
 @click.command()
 @click.option(
     '-c',
@@ -91,6 +390,11 @@ def configure(ctx, param, filename):
     show_default=True,
 )
 @click.option('--audio-input-name', default="-d", help='Audio input name.')
+@click.option(
+    '--audio-input-type',
+    default='waveaudio',
+    help="sox input type for the audio input (e.g. 'wav' or 'null' to test without a sound card).",
+)
 @click.option('--sunrise-sunset-filename', default='SunriseSunset.csv', help='SunriseSunset filename.')
 @click.option('--sunset-offset', default=1.5, help='Sunset offset.')
 @click.option('--sunrise-offset', default=-0.5, help='Sunrise offset.')
@@ -100,9 +404,53 @@ def configure(ctx, param, filename):
 @click.option('--sox-filepath', default="sox.exe")
 @click.option('--filename_template', default="recording-location-NFC-{full_timestamp}")
 @click.option('-∞', '-t', '--loop-forever', is_flag=True, help='Run in test mode.')
+@click.option(
+    '--segment-minutes',
+    default=0.0,
+    help='Record in segments of this many minutes, processing each while the next records (0: one PM and one AM file).',
+)
+@click.option(
+    '--max-jobs',
+    default=max(2, (os.cpu_count() or 2) // 2),
+    help='Post-recording steps (detector, FLAC, clip, upload) to run at once.',
+)
+@click.option('--upload-workers', default=4, help='Files to copy to cloud storage at once.')
+@click.option(
+    '--file-type',
+    type=click.Choice(['wav', 'flac']),
+    default='wav',
+    show_default=True,
+    help="'flac' has sox encode while recording: no full-night WAV, no morning conversion.",
+)
+@click.option(
+    '--predetect/--no-predetect',
+    default=False,
+    help='Run nighthawk only on band-energy candidate regions found by predetect.py.',
+)
+@click.option(
+    '--max-bad-fraction',
+    default=1.0,
+    show_default=True,
+    help='Skip the detector on a recording when more than this fraction of its minutes are flagged '
+    'as rain, wind, silence, dropout or clipping (1.0: never skip).',
+)
+@click.option(
+    '--pack-clips/--no-pack-clips',
+    default=False,
+    help='Write each recording\'s clips into one <recording>_clippack.flac instead of a WAV per clip; '
+    'pull clips out with `getsnips.py extract`.',
+)
+@click.option(
+    '--detector-jobs',
+    default=1,
+    show_default=True,
+    help='Run nighthawk on this many overlapping time shards of each recording at once '
+    '(1: one run over the whole file). Ignored with --predetect.',
+)
 def main(
     # Gain,
     audio_input_name,
+    audio_input_type,
     # BirdVoxThreshold,
     # BirdVoxDuration,
     sunrise_sunset_filename,
@@ -115,9 +463,15 @@ def main(
     sox_filepath,
     filename_template,
     loop_forever,
+    segment_minutes,
+    max_jobs,
+    upload_workers,
+    file_type,
+    predetect,
+    max_bad_fraction,
+    pack_clips,
+    detector_jobs,
 ):
-    script_start_time = now()
-
     print("Audio Input Name:", audio_input_name)
     print("Sunrise Sunset Filename:", sunrise_sunset_filename)
     print("Sunset Offset:", sunset_offset)
@@ -126,12 +480,16 @@ def main(
     print("Output Directory:", output_directory)
     print("Cloud Storage Directory:", cloud_storage_directory)
     print("Sox Filepath:", sox_filepath)
+    print("File Type:", file_type)
+    print("Pack Clips:", pack_clips)
+    print("Detector Jobs:", detector_jobs)
     print()
 
-    file_type = 'wav'
     test_duration = '00:00:02'
 
     while True:
+        # tonight's window, recomputed on each pass of --loop-forever
+        loop_start_time = now()
         today = None
         today_string = now().strftime("%#m/%#d/")
         # read a csv file with sunrise and sunset times for the year as formatted above.
@@ -147,10 +505,10 @@ def main(
         if today:
             sunset_time = datetime.strptime(today["Sunset"], "%H:%M:%S")
             sunrise_time = datetime.strptime(today["Sunrise"], "%H:%M:%S")  # + timedelta(days=1)
-            sunset = script_start_time.replace(
+            sunset = loop_start_time.replace(
                 hour=sunset_time.hour, minute=sunset_time.minute, second=sunset_time.second, microsecond=0
             )
-            sunrise = script_start_time.replace(
+            sunrise = loop_start_time.replace(
                 hour=sunrise_time.hour, minute=sunrise_time.minute, second=sunrise_time.second, microsecond=0
             ) + timedelta(days=1)
             start_record = sunset + timedelta(hours=sunset_offset)
@@ -159,7 +517,7 @@ def main(
             # If no CSV File detected, set to default start/end recording times.
             raise FileNotFoundError()
             print("No SunriseSunset.csv file detected, reverting to default times:")
-            start_record = datetime(script_start_time.year, script_start_time.month, script_start_time.day, 21, 0, 0)
+            start_record = datetime(loop_start_time.year, loop_start_time.month, loop_start_time.day, 21, 0, 0)
             stop_record = start_record + timedelta(days=1, hours=-16)
 
         # start_record = make_local_timestamp_aware(start_record)
@@ -179,126 +537,123 @@ def main(
         else:
             print("This script started after the recommended start time. Starting recording immediately.")
 
-        # PM Recording
         start_pm_at = now()
-        start_am_at = (start_pm_at + timedelta(days=1)).replace(hour=0, minute=0, second=2, microsecond=0)
-
         full_output_directory = os.path.join(
             output_directory, start_pm_at.strftime("%Y"), start_pm_at.strftime("%Y-%m-%d")
         )
         os.makedirs(full_output_directory, exist_ok=True)
         print("Outputting to", full_output_directory)
-        recorded_files = []
-        pm_filename = os.path.join(full_output_directory, format_filename(start_pm_at, filename_template))
-
-        pm_record_time = test_duration if test else format_hhmmss(start_am_at - start_pm_at)
-
-        print(
-            "Starting PM Recording:",
-            start_pm_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "Record Time:",
-            pm_record_time,
-            pm_filename,
-            "Filename:",
-            f"{pm_filename}.{file_type}",
-        )
+        runlog.start(os.path.join(full_output_directory, runlog.LOG_NAME))
+
+        def record_cmd(outfile, record_time):
+            return sox_record_cmd(sox_filepath, audio_input_type, audio_input_name, outfile, record_time)
+
+        def segmented_record_cmd(outfile, record_times):
+            return sox_segmented_cmd(sox_filepath, audio_input_type, audio_input_name, outfile, record_times)
+
+        # segments whose FLAC failed verification, which holds back the upload
+        unverified = []
+        if segment_minutes:
+            def process_segment(file, record_time):
+                segment_jobs = run_jobs(
+                    recording_jobs(
+                        file,
+                        sox_filepath,
+                        file_type,
+                        predetect,
+                        max_bad_fraction,
+                        pack_clips,
+                        detector_jobs,
+                        expected_frames=record_time_frames(record_time),
+                    ),
+                    max_workers=max_jobs,
+                )
+                verify = segment_jobs.get(f"verify {os.path.basename(file)}")
+                if verify and verify.status != DONE:
+                    unverified.append(file)
+
+            if test:
+                segment_length = timedelta(seconds=2)
+                stop_record = start_pm_at + 2 * segment_length
+            else:
+                segment_length = timedelta(minutes=segment_minutes)
+            recorded_files = record_segmented(
+                start_pm_at,
+                stop_record,
+                segment_length,
+                full_output_directory,
+                filename_template,
+                file_type,
+                segmented_record_cmd,
+                process_segment,
+            )
+            print("Recording and segment processing complete:", now().strftime("%Y-%m-%d %H:%M:%S"))
+        else:
+            # PM Recording
+            start_am_at = (start_pm_at + timedelta(days=1)).replace(hour=0, minute=0, second=2, microsecond=0)
+            # (file, sox record time) for each recording
+            recordings = []
+            pm_filename = os.path.join(full_output_directory, format_filename(start_pm_at, filename_template))
+
+            pm_record_time = test_duration if test else format_hhmmss(start_am_at - start_pm_at)
 
-        sox_cmd = [
-            sox_filepath,
-            '-t',
-            'waveaudio',
-            '-c',
-            '1',
-            '-r',
-            '22050',
-            audio_input_name,
-            f"{pm_filename}.{file_type}",
-            'trim',
-            '0',
-            pm_record_time,
-        ]
-        execute(sox_cmd)
-        recorded_files.append(f"{pm_filename}.{file_type}")
-
-        # AM Recording
-        actual_am_start_time = now()
-        am_record_duration = stop_record - actual_am_start_time
-        am_filename = None
-        if am_record_duration.total_seconds() > 0:
-            am_record_time = test_duration if test else format_hhmmss(am_record_duration)
-            am_filename = os.path.join(full_output_directory, format_filename(start_am_at, filename_template))
             print(
-                "Starting AM Recording:",
-                actual_am_start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "Starting PM Recording:",
+                start_pm_at.strftime("%Y-%m-%d %H:%M:%S"),
                 "Record Time:",
-                am_record_time,
-                am_filename,
+                pm_record_time,
+                pm_filename,
+                "Filename:",
+                f"{pm_filename}.{file_type}",
             )
 
-            sox_cmd = [
-                sox_filepath,
-                '-t',
-                'waveaudio',
-                '-c',
-                '1',
-                '-r',
-                '22050',
-                audio_input_name,
-                f"{am_filename}.{file_type}",
-                'trim',
-                '0',
-                am_record_time,
-            ]
-            execute(sox_cmd)
-
-            recorded_files.append(f"{am_filename}.{file_type}")
-
-        print("Recording Complete:", now().strftime("%Y-%m-%d %H:%M:%S"))
-
-        execute(['nighthawk', '--audacity-output', *recorded_files], failure_mode="IGNORE")
-
-        if file_type == 'wav':
-            print("Converting to FLAC...")
-            is_ok_to_delete_wavs = True
-            sox_cmd = [sox_filepath, f"{pm_filename}.{file_type}", f"{pm_filename}.flac"]
-            p = execute(sox_cmd, failure_mode="RETURN_ERRORLEVEL")
-            if p != 0:
-                print(f"Could not find flac, {p}")
-                is_ok_to_delete_wavs = False
-
-            if am_filename:
-                sox_cmd = [sox_filepath, f"{am_filename}.{file_type}", f"{am_filename}.flac"]
-                p = execute(sox_cmd, failure_mode="RETURN_ERRORLEVEL")
-                if p != 0:
-                    print(f"Could not find flac, {p}")
-                    is_ok_to_delete_wavs = False
-
-            if is_ok_to_delete_wavs:
-                print("Deleting wav files...")
-                for file in recorded_files:
-                    if os.path.exists(file):
-                        os.remove(file)
-            else:
-                print("Did not find converted flac files... Leaving original recordings.")
-
-        # Upload to Cloud Storage
-        if cloud_storage_directory:
-            print("Copying", full_output_directory, "to", cloud_storage_directory)
-            if not os.path.exists(cloud_storage_directory):
-                os.makedirs(cloud_storage_directory)
-
-            # copy everything in path to cloud_storage_directory
-            for root, dirs, files in os.walk(full_output_directory):
-                for file in files:
-                    print("Copying", file)
-                    shutil.copy(os.path.join(root, file), cloud_storage_directory)
-
-        for file in recorded_files:
-            execute(['py', '../nfc-processing/getsnips.py', 'clip', '-i', file])
-        execute(
-            ['py', '../nfc-processing/getsnips.py', 'spec', f"{full_output_directory}\\clips\\*.wav"],
-            failure_mode="IGNORE",
+            execute(record_cmd(f"{pm_filename}.{file_type}", pm_record_time))
+            recordings.append((f"{pm_filename}.{file_type}", pm_record_time))
+
+            # AM Recording
+            actual_am_start_time = now()
+            am_record_duration = stop_record - actual_am_start_time
+            if am_record_duration.total_seconds() > 0:
+                am_record_time = test_duration if test else format_hhmmss(am_record_duration)
+                am_filename = os.path.join(full_output_directory, format_filename(start_am_at, filename_template))
+                print(
+                    "Starting AM Recording:",
+                    actual_am_start_time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "Record Time:",
+                    am_record_time,
+                    am_filename,
+                )
+
+                execute(record_cmd(f"{am_filename}.{file_type}", am_record_time))
+
+                recordings.append((f"{am_filename}.{file_type}", am_record_time))
+
+            print("Recording Complete:", now().strftime("%Y-%m-%d %H:%M:%S"))
+
+        jobs = []
+        if not segment_minutes:
+            recorded_files = [file for file, _ in recordings]
+            for file, record_time in recordings:
+                jobs += recording_jobs(
+                    file,
+                    sox_filepath,
+                    file_type,
+                    predetect,
+                    max_bad_fraction,
+                    pack_clips,
+                    detector_jobs,
+                    expected_frames=record_time_frames(record_time),
+                )
+        if unverified:
+            print("Not uploading: these segments failed verification:", *unverified)
+        jobs += night_jobs(
+            jobs,
+            full_output_directory,
+            None if unverified else cloud_storage_directory,
+            transient_files=[file for file in recorded_files if file.endswith('.wav')],
+            upload_workers=upload_workers,
         )
+        run_jobs(jobs, max_workers=max_jobs)
 
         if not loop_forever:
             break
@@ -0,0 +1,140 @@
+"""
+A small dependency-aware job runner for the post-recording pipeline.
+
+Each job names the jobs it depends on (`deps`, which must succeed) and the
+jobs it only has to wait for (`after`, which may fail). A job runs on a
+bounded thread pool as soon as all of those have finished. Most jobs just wait
+on a subprocess, so threads are enough. If a dep fails, the job is skipped.
+Start and end times are logged for each job. A summary at the end shows
+every job's timing and the critical path.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Job:
+    def __init__(self, name, func, *args, deps=(), after=(), **kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.deps = list(deps)
+        self.after = list(after)
+
+        self.status = None
+        self.result = None
+        self.error = None
+        self.started_at = self.ended_at = None
+        self._start = self._end = None
+
+    @property
+    def duration(self):
+        return self._end - self._start if self._start is not None and self._end is not None else 0.0
+
+    def __call__(self):
+        self._start = time.monotonic()
+        self.started_at = datetime.now()
+        print(f"[{self.started_at:%H:%M:%S}] start {self.name}")
+        try:
+            return self.func(*self.args, **self.kwargs)
+        finally:
+            self._end = time.monotonic()
+            self.ended_at = datetime.now()
+
+    def __repr__(self):
+        return f"Job({self.name!r}, {self.status})"
+
+
+def run_jobs(jobs, max_workers=2):
+    """
+    Run `jobs` respecting their deps with at most `max_workers` at a time.
+    Returns {name: Job}, each with status DONE, FAILED or SKIPPED.
+    """
+    by_name = {job.name: job for job in jobs}
+    if len(by_name) != len(jobs):
+        raise ValueError("job names must be unique")
+    for job in jobs:
+        missing = [dep for dep in job.deps + job.after if dep not in by_name]
+        if missing:
+            raise ValueError(f"{job.name} depends on unknown jobs {missing}")
+
+    pending = list(jobs)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            progressed = True
+            while progressed:
+                progressed = False
+                for job in list(pending):
+                    deps = [by_name[dep] for dep in job.deps]
+                    if any(by_name[dep].status is None for dep in job.deps + job.after):
+                        continue
+                    pending.remove(job)
+                    progressed = True
+                    if any(dep.status != DONE for dep in deps):
+                        job.status = SKIPPED
+                        print(f"skip {job.name}: a dependency did not complete")
+                        continue
+                    running[executor.submit(job)] = job
+
+            if not running:
+                if pending:
+                    raise ValueError(f"dependency cycle among {[job.name for job in pending]}")
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                try:
+                    job.result = future.result()
+                    job.status = DONE
+                except BaseException as exc:
+                    # execute() may sys.exit(); in a worker that is just a failed job
+                    job.error = exc
+                    job.status = FAILED
+                print(f"[{job.ended_at:%H:%M:%S}] {job.status} {job.name} ({job.duration:.1f}s)")
+                if job.error is not None:
+                    print(f"  {job.name}: {job.error!r}")
+
+    print_summary(jobs)
+    return by_name
+
+
+def critical_path(jobs):
+    """The chain of ran jobs, following the last dep/after to finish, that ended last."""
+    by_name = {job.name: job for job in jobs}
+    ran = [job for job in jobs if job._end is not None]
+    if not ran:
+        return []
+    path = [max(ran, key=lambda job: job._end)]
+    while True:
+        deps = [
+            by_name[dep]
+            for dep in path[-1].deps + path[-1].after
+            if by_name[dep]._end is not None
+        ]
+        if not deps:
+            break
+        path.append(max(deps, key=lambda job: job._end))
+    return path[::-1]
+
+
+def print_summary(jobs):
+    ran = [job for job in jobs if job._start is not None]
+    if not ran:
+        return
+    t0 = min(job._start for job in ran)
+    print("Job timings (start offset, duration):")
+    for job in sorted(ran, key=lambda job: job._start):
+        print(f"  +{job._start - t0:8.1f}s {job.duration:8.1f}s  {job.status:7s} {job.name}")
+    for job in jobs:
+        if job.status == SKIPPED:
+            print(f"  {'':>20s}  {job.status:7s} {job.name}")
+    path = critical_path(jobs)
+    total = path[-1]._end - t0 if path else 0.0
+    print(f"Critical path ({total:.1f}s): " + " -> ".join(job.name for job in path))
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# record-nfc.py and its helpers are scripts in autorecord/, and they import
+# the nfc-processing scripts, so both directories go on the path
+AUTORECORD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(AUTORECORD_DIR, "..", "nfc-processing"))
+sys.path.insert(0, AUTORECORD_DIR)
@@ -0,0 +1,34 @@
+"""
+Stand-in for `sox -t null ... -n out.wav trim 0 L : newfile : trim 0 L ...`
+in the recorder tests: writes one file of silence per trim, numbered
+out001.wav, out002.wav, ... when there is more than one, pausing after each
+as a live recording would. With no trim it fails, where real sox would
+record forever.
+"""
+import os
+import sys
+import time
+import wave
+
+PAUSE_SECS = 0.3
+
+
+def main(args):
+    if "trim" not in args:
+        sys.exit("fake_sox: no trim, refusing to record without an end")
+    rate = int(args[args.index("-r") + 1])
+    outfile = args[args.index("trim") - 1]
+    lengths = [float(args[i + 2]) for i, arg in enumerate(args) if arg == "trim"]
+    base, ext = os.path.splitext(outfile)
+    for n, secs in enumerate(lengths, 1):
+        fn = outfile if len(lengths) == 1 else f"{base}{n:03d}{ext}"
+        with wave.open(fn, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(rate)
+            f.writeframes(b"\0\0" * int(round(secs * rate)))
+        time.sleep(PAUSE_SECS)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import cloudsync
+from cloudsync import MANIFEST_NAME, sync_directory
+
+
+@pytest.fixture
+def night(tmp_path):
+    src = tmp_path / "2024-05-01"
+    (src / "clips").mkdir(parents=True)
+    (src / "rec.flac").write_bytes(b"flac" * 1000)
+    (src / "rec.wav").write_bytes(b"wav" * 1000)
+    (src / "rec_detections.csv").write_text("start_sec,end_sec\n1.0,2.0\n")
+    (src / "rec-candidates.wav").write_bytes(b"scratch")
+    (src / "clips" / "clip1.wav").write_bytes(b"clip")
+    return src
+
+
+def test_sync_copies_new_and_changed_files_only(night, tmp_path):
+    dest = tmp_path / "cloud"
+    copied, skipped = sync_directory(str(night), str(dest), transient_files=[str(night / "rec.wav")])
+    # flattened, without the WAV about to be deleted, scratch audio or the manifest
+    assert (copied, skipped) == (3, 0)
+    assert sorted(os.listdir(dest)) == ["clip1.wav", "rec.flac", "rec_detections.csv"]
+    assert (dest / "rec.flac").read_bytes() == b"flac" * 1000
+
+    assert sync_directory(str(night), str(dest)) == (1, 3)  # rec.wav is no longer transient
+    assert sync_directory(str(night), str(dest)) == (0, 4)
+
+    (night / "rec_detections.csv").write_text("start_sec,end_sec\n1.0,2.5\n")
+    os.remove(dest / "clip1.wav")
+    assert sync_directory(str(night), str(dest)) == (2, 2)
+    assert (dest / "rec_detections.csv").read_text().endswith("2.5\n")
+
+
+def test_touched_file_is_not_copied_again(night, tmp_path, monkeypatch):
+    dest = tmp_path / "cloud"
+    sync_directory(str(night), str(dest), flatten=False)
+    assert (dest / "clips" / "clip1.wav").exists()
+
+    stat = os.stat(night / "rec.flac")
+    os.utime(night / "rec.flac", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def no_copy(src, dest):
+        raise AssertionError(f"copied {src}")
+
+    monkeypatch.setattr(cloudsync, "copy_file", no_copy)
+    assert sync_directory(str(night), str(dest), flatten=False) == (0, 4)
+
+
+def test_failed_copy_is_retried(night, tmp_path, monkeypatch):
+    dest = tmp_path / "cloud"
+    copy_file = cloudsync.copy_file
+
+    def flaky_copy(src, dest):
+        if src.endswith("rec.flac"):
+            raise OSError("disk full")
+        return copy_file(src, dest)
+
+    monkeypatch.setattr(cloudsync, "copy_file", flaky_copy)
+    with pytest.raises(RuntimeError, match="1 files failed"):
+        sync_directory(str(night), str(dest))
+    assert not os.path.exists(dest / "rec.flac")
+    # what did copy is in the manifest; the failed file is copied next time
+    assert (night / MANIFEST_NAME).exists()
+
+    monkeypatch.setattr(cloudsync, "copy_file", copy_file)
+    assert sync_directory(str(night), str(dest)) == (1, 3)
+
+
+def test_copy_file_leaves_nothing_partial(tmp_path):
+    src = tmp_path / "src.bin"
+    src.write_bytes(os.urandom(100000))
+    dest = str(tmp_path / "dest.bin")
+    assert cloudsync.copy_file(str(src), dest) == cloudsync.file_hash(str(src))
+    assert sorted(os.listdir(tmp_path)) == ["dest.bin", "src.bin"]
+
+    # the final rename fails onto a directory
+    (tmp_path / "taken").mkdir()
+    with pytest.raises(OSError):
+        cloudsync.copy_file(str(src), str(tmp_path / "taken"))
+    assert sorted(os.listdir(tmp_path)) == ["dest.bin", "src.bin", "taken"]
@@ -0,0 +1,93 @@
+import importlib.util
+import os
+import shutil
+import sys
+from datetime import timedelta
+
+import soundfile as sf
+
+AUTORECORD_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_SOX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_sox.py")
+SOX = shutil.which("sox")
+TEMPLATE = "recording-test-NFC-{full_timestamp}"
+
+# record-nfc.py can't be imported by name
+spec = importlib.util.spec_from_file_location("record_nfc", os.path.join(AUTORECORD_DIR, "record-nfc.py"))
+record_nfc = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(record_nfc)
+
+
+def null_record_cmd(outfile, record_times):
+    """Record silence from sox's null input, with the fake sox unless sox is installed."""
+    if SOX:
+        return record_nfc.sox_segmented_cmd(SOX, "null", "-n", outfile, record_times)
+    return [sys.executable] + record_nfc.sox_segmented_cmd(FAKE_SOX, "null", "-n", outfile, record_times)
+
+
+def test_sox_segmented_cmd():
+    cmd = record_nfc.sox_segmented_cmd("sox", "null", "-n", "out.wav", ["60", "30"])
+    assert cmd == [
+        "sox", "-t", "null", "-c", "1", "-r", "22050", "-n", "out.wav",
+        "trim", "0", "60", ":", "newfile", ":", "trim", "0", "30",
+    ]  # fmt: skip
+
+
+def test_record_segmented(tmp_path):
+    processed = []
+    start = record_nfc.now()
+    files = record_nfc.record_segmented(
+        start,
+        start + timedelta(seconds=2.5),
+        timedelta(seconds=1),
+        str(tmp_path),
+        TEMPLATE,
+        "wav",
+        null_record_cmd,
+        lambda file, record_time: processed.append((file, record_time)),
+        poll_secs=0.1,
+    )
+    assert len(files) == 3
+    assert [file for file, _ in processed] == files
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(fn) for fn in files)
+    frames = [sf.info(fn).frames for fn in files]
+    # the last segment is what's left of the 2.5 s after sox was started
+    assert frames[:2] == [22050, 22050] and 11000 < frames[2] <= 11025
+    # each is handed on with the length sox was asked for
+    assert [record_nfc.record_time_frames(record_time) for _, record_time in processed] == frames
+    # named from each segment's first sample, a second apart
+    names = [os.path.basename(fn) for fn in files]
+    assert names == sorted(names) and len(set(names)) == 3
+    assert all(name.startswith("recording-test-NFC-") for name in names)
+
+
+def test_record_segmented_after_stop_time(tmp_path):
+    def record_cmd(outfile, record_times):
+        raise AssertionError("sox must not run with nothing to record")
+
+    start = record_nfc.now() - timedelta(hours=10)
+    files = record_nfc.record_segmented(
+        start, start + timedelta(hours=8), timedelta(minutes=10), str(tmp_path), TEMPLATE, "wav", record_cmd, print
+    )
+    assert files == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_record_time_frames():
+    assert record_nfc.record_time_frames("00:00:02") == 44100
+    assert record_nfc.record_time_frames("1:30") == 90 * 22050
+    assert record_nfc.record_time_frames("0.5") == 11025
+
+
+def test_flac_recording_is_clipped_and_uploaded_only_once_verified():
+    jobs = record_nfc.recording_jobs("/night/rec.flac", "sox", "flac", expected_frames=44100)
+    by_name = {job.name: job for job in jobs}
+    assert "verify rec.flac" in by_name["clip rec.flac"].deps
+    assert by_name["verify rec.flac"].kwargs == {"expected_frames": 44100}
+
+    upload = record_nfc.night_jobs(jobs, "/night", "/cloud")[-1]
+    assert upload.name == "upload" and upload.deps == ["verify rec.flac"]
+
+    # a WAV recording has no verify job; the FLAC encode checks itself
+    jobs = record_nfc.recording_jobs("/night/rec.wav", "sox", "wav")
+    assert sorted(job.name.split()[0] for job in jobs) == ["clip", "delete", "detect", "flac", "quality"]
+    assert record_nfc.night_jobs(jobs, "/night", "/cloud")[-1].deps == []
@@ -0,0 +1,84 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from scheduler import DONE, FAILED, SKIPPED, Job, critical_path, run_jobs
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_deps_and_after():
+    order = []
+    jobs = [
+        Job("detect", order.append, "detect"),
+        Job("flac", fail),
+        Job("clip", order.append, "clip", deps=["detect"]),
+        Job("delete", order.append, "delete", deps=["flac"], after=["clip"]),
+        Job("upload", order.append, "upload", after=["clip", "delete"]),
+        Job("after-skip", order.append, "after-skip", deps=["delete"]),
+    ]
+    by_name = run_jobs(jobs, max_workers=4)
+    assert {name: job.status for name, job in by_name.items()} == {
+        "detect": DONE,
+        "flac": FAILED,
+        "clip": DONE,
+        "delete": SKIPPED,
+        "upload": DONE,
+        "after-skip": SKIPPED,
+    }
+    assert isinstance(by_name["flac"].error, RuntimeError)
+    # a failed or skipped job is still waited for by `after`
+    assert order.index("detect") < order.index("clip") < order.index("upload")
+    assert "delete" not in order
+
+
+def test_exit_in_a_job_is_a_failure():
+    by_name = run_jobs([Job("execute", sys.exit, 3), Job("next", lambda: None, deps=["execute"])])
+    assert by_name["execute"].status == FAILED
+    assert by_name["next"].status == SKIPPED
+
+
+def test_max_workers():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    by_name = run_jobs([Job(f"job {i}", work) for i in range(6)], max_workers=2)
+    assert all(job.status == DONE for job in by_name.values())
+    assert max(peak) == 2
+
+
+def test_critical_path():
+    jobs = [
+        Job("quality", time.sleep, 0.01),
+        Job("detect", time.sleep, 0.05, after=["quality"]),
+        Job("flac", time.sleep, 0.01),
+        Job("clip", time.sleep, 0.01, deps=["detect"]),
+    ]
+    run_jobs(jobs, max_workers=4)
+    assert [job.name for job in critical_path(jobs)] == ["quality", "detect", "clip"]
+
+
+@pytest.mark.parametrize(
+    "jobs, message",
+    [
+        ([Job("a", print), Job("a", print)], "unique"),
+        ([Job("a", print, deps=["b"])], "unknown jobs"),
+        ([Job("a", print, deps=["b"]), Job("b", print, after=["a"])], "cycle"),
+    ],
+)
+def test_invalid_graphs(jobs, message):
+    with pytest.raises(ValueError, match=message):
+        run_jobs(jobs)
@@ -0,0 +1,91 @@
+"""
+Size-bounded on-disk cache of numpy arrays, shared between processes.
+
+Entries are .npy files named by a hash of their key. A hit touches the file's
+mtime, and once the cache grows past `max_bytes` the least recently used
+entries are deleted. Writes go through a temp file and an atomic rename, so
+parallel spectrogram workers can share one cache directory.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "NFC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".nfc-tools-cache")
+)
+DEFAULT_CACHE_MB = int(os.environ.get("NFC_CACHE_MB", "1024"))
+
+
+def file_identity(path):
+    """Path, size and mtime of `path`: changes whenever the file does."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+class ArrayCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = None  # bytes put since the last eviction scan
+
+    def __repr__(self):
+        return f"ArrayCache({self.directory!r}, max_bytes={self.max_bytes})"
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".npy")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path, allow_pickle=False)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return array
+
+    def put(self, key, array):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.partial"
+        with open(partial, "wb") as f:
+            np.save(f, np.asarray(array), allow_pickle=False)
+        os.replace(partial, path)
+        size = os.path.getsize(path)
+
+        # rescan on the first put and after every 1/16th of the budget written
+        if self._written is None or self._written > self.max_bytes // 16:
+            self.evict(keep=path)
+        self._written += size
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used entries (other than `keep`) until the cache
+        fits in max_bytes. Returns the bytes left.
+        """
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith(".npy"):
+                    try:
+                        stat = os.stat(os.path.join(root, file))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, file)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._written = 0
+        return total
@@ -0,0 +1,512 @@
+"""
+Random-access audio readers shared by the getsnips clip and spec paths.
+
+open_audio() returns an object with the subset of the soundfile.SoundFile
+interface getsnips uses (samplerate, channels, frames, subtype, seek, tell,
+read, close, context manager):
+
+- PCM/float WAV files are memory-mapped and read() hands out slices of the
+  data chunk without copying when the native dtype is requested.
+- FLAC files get a sparse sample -> byte-offset index of frame headers, built
+  on first access and saved next to the file as `<file>.seekidx`. Seeks then
+  jump to the nearest indexed frame instead of searching the stream.
+- Anything else is read through soundfile as before.
+
+verify_flac() decodes a FLAC file and checks it against the sample count and
+MD5 signature its encoder stored in STREAMINFO.
+"""
+import hashlib
+import io
+import json
+import os
+import struct
+
+import numpy as np
+import soundfile as sf
+
+# numpy dtypes that hold each libsndfile subtype without conversion; reads in
+# these dtypes match what soundfile returns for the same subtype.
+NATIVE_DTYPES = {
+    "PCM_S8": "int16",
+    "PCM_U8": "int16",
+    "PCM_16": "int16",
+    "PCM_24": "int32",
+    "PCM_32": "int32",
+    "FLOAT": "float32",
+    "DOUBLE": "float64",
+}
+
+
+def native_dtype(subtype):
+    return NATIVE_DTYPES.get(subtype, "float64")
+
+
+def convert_samples(data, dtype):
+    """Convert samples between int16/int32/float32/float64, ints taken as full scale."""
+    dtype = np.dtype(dtype)
+    if data.dtype == dtype:
+        return data
+    if data.dtype.kind == "f":
+        if dtype.kind == "f":
+            return data.astype(dtype)
+        scale = 2.0 ** (8 * dtype.itemsize - 1)
+        info = np.iinfo(dtype)
+        return np.clip(np.round(data * scale), info.min, info.max).astype(dtype)
+    if dtype.kind == "f":
+        return data.astype(dtype) / dtype.type(2.0 ** (8 * data.dtype.itemsize - 1))
+    shift = 8 * (dtype.itemsize - data.dtype.itemsize)
+    if shift > 0:
+        return data.astype(dtype) << shift
+    return (data >> -shift).astype(dtype)
+
+
+class _Reader:
+    """Shared seek/read bookkeeping; subclasses implement _read(start, frames)."""
+
+    samplerate = channels = frames = 0
+    subtype = None
+    name = None
+
+    def __init__(self):
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        pass
+
+    def seek(self, frames, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            frames += self._position
+        elif whence == os.SEEK_END:
+            frames += self.frames
+        self._position = max(0, min(int(frames), self.frames))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def read(self, frames=-1, dtype=None, always_2d=False):
+        if frames < 0 or self._position + frames > self.frames:
+            frames = self.frames - self._position
+        data = self._read(self._position, frames)
+        self._position += len(data)
+        if dtype is not None:
+            data = convert_samples(data, dtype)
+        if not always_2d and self.channels == 1:
+            data = data[:, 0]
+        return data
+
+
+class WavMemmapReader(_Reader):
+    """Memory-mapped reader for PCM (8/16/24/32 bit) and float WAV files."""
+
+    WAVE_FORMAT_PCM = 1
+    WAVE_FORMAT_IEEE_FLOAT = 3
+    WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+    def __init__(self, path):
+        super().__init__()
+        self.name = path
+        fmt, data_offset, data_size = self._parse_chunks(path)
+        audio_format, self.channels, self.samplerate, _, block_align, bits = fmt
+
+        if audio_format == self.WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+            self.subtype = {8: "PCM_U8", 16: "PCM_16", 24: "PCM_24", 32: "PCM_32"}[bits]
+        elif audio_format == self.WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+            self.subtype = {32: "FLOAT", 64: "DOUBLE"}[bits]
+        else:
+            raise ValueError(f"{path}: unsupported WAV format {audio_format}/{bits} bit")
+
+        file_size = os.path.getsize(path)
+        # sox leaves the data size at 0 (or 0xFFFFFFFF) if a recording is cut short
+        if data_size in (0, 0xFFFFFFFF) or data_offset + data_size > file_size:
+            data_size = file_size - data_offset
+        self.frames = data_size // block_align
+
+        if self.subtype == "PCM_24":
+            self._mmap = np.memmap(
+                path, dtype=np.uint8, mode="r", offset=data_offset,
+                shape=(self.frames, self.channels, 3),
+            )
+        else:
+            storage = {"PCM_U8": "u1", "PCM_16": "<i2", "PCM_32": "<i4", "FLOAT": "<f4", "DOUBLE": "<f8"}
+            self._mmap = np.memmap(
+                path, dtype=storage[self.subtype], mode="r", offset=data_offset,
+                shape=(self.frames, self.channels),
+            )
+
+    @staticmethod
+    def _parse_chunks(path):
+        with open(path, "rb") as f:
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                raise ValueError(f"{path}: not a RIFF/WAVE file")
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{path}: no data chunk")
+                chunk_id, size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    body = f.read(size)
+                    fmt = list(struct.unpack("<HHIIHH", body[:16]))
+                    if fmt[0] == WavMemmapReader.WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                        fmt[0] = struct.unpack("<H", body[24:26])[0]
+                    if size % 2:
+                        f.seek(1, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if fmt is None:
+                        raise ValueError(f"{path}: data chunk before fmt chunk")
+                    return fmt, f.tell(), size
+                else:
+                    f.seek(size + size % 2, os.SEEK_CUR)
+
+    def close(self):
+        self._mmap = None
+
+    def _read(self, start, frames):
+        raw = self._mmap[start : start + frames]
+        if self.subtype == "PCM_24":
+            raw = raw.astype(np.int32)
+            return (raw[..., 0] << 8) | (raw[..., 1] << 16) | (raw[..., 2] << 24)
+        if self.subtype == "PCM_U8":
+            return (raw.astype(np.int16) - 128) << 8
+        return raw
+
+
+class SoundFileReader(_Reader):
+    """Plain soundfile-backed reader, for formats with no faster path."""
+
+    def __init__(self, path):
+        super().__init__()
+        self.name = path
+        self._file = sf.SoundFile(path)
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+        self.subtype = self._file.subtype
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, start, frames):
+        if self._file.tell() != start:
+            self._file.seek(start)
+        return self._file.read(frames, dtype=native_dtype(self.subtype), always_2d=True)
+
+
+def _crc8(data):
+    crc = 0
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def _make_crc8_table(poly=0x07):
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+_CRC8_TABLE = _make_crc8_table()
+
+
+class _SplicedFile(io.RawIOBase):
+    """A `header` bytes prefix followed by `path` from byte `offset` to the end."""
+
+    def __init__(self, header, path, offset):
+        self._header = header
+        self._file = open(path, "rb")
+        self._offset = offset
+        self._length = len(header) + os.path.getsize(path) - offset
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self._length
+        self._position = max(0, position)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast("B")
+        n = 0
+        if self._position < len(self._header):
+            head = self._header[self._position : self._position + len(view)]
+            view[: len(head)] = head
+            n = len(head)
+            self._position += n
+        if n < len(view) and self._position < self._length:
+            self._file.seek(self._offset + self._position - len(self._header))
+            got = self._file.readinto(view[n:])
+            n += got
+            self._position += got
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+class FlacIndexedReader(SoundFileReader):
+    """
+    FLAC reader whose seeks are guided by a sparse sample -> byte-offset index
+    of frame headers, cached in a `.seekidx` sidecar file.
+
+    The index is handed to libFLAC as a SEEKTABLE in a rewritten metadata
+    header in front of the untouched audio frames, so a seek jumps to the
+    nearest indexed frame instead of bisecting the whole stream.
+    """
+
+    INDEX_VERSION = 1
+    # probe window when STREAMINFO leaves the maximum frame size unknown (0)
+    PROBE_FALLBACK_BYTES = 32 * 1024
+
+    def __init__(self, path, stride_bytes=64 * 1024):
+        _Reader.__init__(self)
+        self.name = path
+        self._streaminfo, self._audio_offset = self._parse_metadata(path)
+        self._total_samples = int.from_bytes(self._streaminfo[13:18], "big") & (
+            (1 << 36) - 1
+        )
+        self._index = self._load_or_build_index(path, stride_bytes)
+
+        self._file = sf.SoundFile(
+            _SplicedFile(self._metadata_header(), path, self._audio_offset)
+        )
+        self.samplerate = self._file.samplerate
+        self.channels = self._file.channels
+        self.frames = self._file.frames
+        self.subtype = self._file.subtype
+
+    @staticmethod
+    def _parse_metadata(path):
+        with open(path, "rb") as f:
+            if f.read(4) != b"fLaC":
+                raise ValueError(f"{path}: not a native FLAC file")
+            streaminfo = None
+            last = False
+            while not last:
+                header = f.read(4)
+                if len(header) < 4:
+                    raise ValueError(f"{path}: truncated FLAC metadata")
+                last = bool(header[0] & 0x80)
+                block_type = header[0] & 0x7F
+                body = f.read(int.from_bytes(header[1:4], "big"))
+                if block_type == 0:
+                    streaminfo = body
+            if streaminfo is None:
+                raise ValueError(f"{path}: no STREAMINFO block")
+            return streaminfo, f.tell()
+
+    @property
+    def _fixed_blocksize(self):
+        min_block, max_block = struct.unpack(">HH", self._streaminfo[:4])
+        return max_block if min_block == max_block else None
+
+    def _metadata_header(self):
+        seektable = b"".join(
+            struct.pack(">QQH", sample, offset - self._audio_offset, blocksize)
+            for sample, offset, blocksize in self._index
+        )
+        return b"".join(
+            [
+                b"fLaC",
+                bytes([0x00]) + len(self._streaminfo).to_bytes(3, "big"),
+                self._streaminfo,
+                bytes([0x80 | 3]) + len(seektable).to_bytes(3, "big"),
+                seektable,
+            ]
+        )
+
+    def _load_or_build_index(self, path, stride_bytes):
+        stat = os.stat(path)
+        index_path = f"{path}.seekidx"
+        try:
+            with open(index_path) as f:
+                saved = json.load(f)
+            if (
+                saved.get("version") == self.INDEX_VERSION
+                and saved.get("size") == stat.st_size
+                and saved.get("mtime") == stat.st_mtime
+            ):
+                return [tuple(entry) for entry in saved["entries"]]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        entries = self._build_index(path, stride_bytes)
+        try:
+            with open(index_path, "w") as f:
+                json.dump(
+                    {
+                        "version": self.INDEX_VERSION,
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        "entries": entries,
+                    },
+                    f,
+                )
+        except OSError as exc:
+            print(f"Could not save FLAC index {index_path}: {exc}")
+        return entries
+
+    @property
+    def _probe_bytes(self):
+        """Bytes that must hold a frame header: the largest frame plus a header, per STREAMINFO."""
+        max_frame = int.from_bytes(self._streaminfo[7:10], "big")
+        return max_frame + 16 if max_frame else self.PROBE_FALLBACK_BYTES
+
+    def _build_index(self, path, stride_bytes):
+        """(sample, byte offset, blocksize) of the first frame after every stride."""
+        entries = []
+        file_size = os.path.getsize(path)
+        window_bytes = self._probe_bytes
+        # unbuffered, so each probe reads just its window
+        with open(path, "rb", buffering=0) as f:
+            position = self._audio_offset
+            while position < file_size:
+                f.seek(position)
+                window = f.read(window_bytes)
+                found = self._find_frame(window)
+                if found is not None:
+                    offset, sample, blocksize = found
+                    last_sample = entries[-1][0] if entries else -1
+                    if last_sample < sample < (self._total_samples or sample + 1):
+                        entries.append((sample, position + offset, blocksize))
+                position += stride_bytes
+        return entries
+
+    def _find_frame(self, window):
+        fixed_blocksize = self._fixed_blocksize
+        sync = b"\xff\xf8" if fixed_blocksize else b"\xff\xf9"
+        start = window.find(sync)
+        while start != -1:
+            found = self._parse_frame_header(window[start : start + 16], fixed_blocksize)
+            if found is not None:
+                return (start,) + found
+            start = window.find(sync, start + 1)
+        return None
+
+    @staticmethod
+    def _parse_frame_header(header, fixed_blocksize):
+        """(first sample, blocksize) from a frame header, or None if it is not one."""
+        if len(header) < 6:
+            return None
+        blocksize_code, rate_code = header[2] >> 4, header[2] & 0x0F
+        channels_code, size_code = header[3] >> 4, (header[3] >> 1) & 0x07
+        if blocksize_code == 0 or rate_code == 0x0F or channels_code > 10:
+            return None
+        if size_code == 3 or header[3] & 0x01:
+            return None
+
+        # UTF-8 style coded frame number (fixed blocksize) or sample number
+        first = header[4]
+        if first < 0x80:
+            length, number = 1, first
+        elif first >= 0xC0:
+            length = 2
+            while length < 7 and first & (0x80 >> length):
+                length += 1
+            number = first & (0x7F >> length)
+            for byte in header[5 : 4 + length]:
+                if byte & 0xC0 != 0x80:
+                    return None
+                number = (number << 6) | (byte & 0x3F)
+        else:
+            return None
+
+        end = 4 + length
+        if blocksize_code == 1:
+            blocksize = 192
+        elif blocksize_code <= 5:
+            blocksize = 576 << (blocksize_code - 2)
+        elif blocksize_code == 6:
+            blocksize = header[end] + 1 if end < len(header) else 0
+            end += 1
+        elif blocksize_code == 7:
+            blocksize = int.from_bytes(header[end : end + 2], "big") + 1
+            end += 2
+        else:
+            blocksize = 256 << (blocksize_code - 8)
+        end += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+        if end >= len(header) or _crc8(header[:end]) != header[end]:
+            return None
+
+        sample = number * fixed_blocksize if fixed_blocksize else number
+        return sample, blocksize
+
+
+def verify_flac(path, expected_frames=None, block_frames=1 << 20):
+    """
+    Decode `path` and check it against its STREAMINFO: the decoded frame count
+    must equal the header's total (and `expected_frames`, if given) and the
+    MD5 of the decoded samples must match the header's signature. Raises
+    ValueError on the first mismatch; returns the frame count.
+    """
+    streaminfo, _ = FlacIndexedReader._parse_metadata(path)
+    fields = int.from_bytes(streaminfo[10:18], "big")
+    total_samples = fields & ((1 << 36) - 1)
+    bits_per_sample = ((fields >> 36) & 0x1F) + 1
+    signature = streaminfo[18:34]
+    if not total_samples:
+        raise ValueError(f"{path}: STREAMINFO has no sample count (encoder did not finish?)")
+    if expected_frames is not None and total_samples != expected_frames:
+        raise ValueError(f"{path}: header has {total_samples} frames, expected {expected_frames}")
+    if signature == bytes(16):
+        raise ValueError(f"{path}: STREAMINFO has no MD5 signature")
+
+    # FLAC signs the interleaved samples as little-endian signed integers of
+    # ceil(bits_per_sample / 8) bytes; soundfile hands them out left-justified
+    # in int32.
+    width = (bits_per_sample + 7) // 8
+    shift = 32 - bits_per_sample
+    md5 = hashlib.md5()
+    decoded = 0
+    try:
+        with sf.SoundFile(path) as f:
+            for block in f.blocks(block_frames, dtype="int32", always_2d=True):
+                decoded += len(block)
+                samples = (block.ravel() >> shift).astype("<i4")
+                if width < 4:
+                    samples = samples.view(np.uint8).reshape(-1, 4)[:, :width]
+                md5.update(samples.tobytes())
+    except RuntimeError as exc:
+        raise ValueError(f"{path}: {exc}") from exc
+
+    if decoded != total_samples:
+        raise ValueError(f"{path}: decoded {decoded} frames, header says {total_samples}")
+    if md5.digest() != signature:
+        raise ValueError(f"{path}: MD5 of decoded audio does not match STREAMINFO")
+    return decoded
+
+
+def open_audio(path):
+    """Open `path` with the fastest random-access reader that supports it."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext == ".wav":
+            return WavMemmapReader(path)
+        if ext == ".flac":
+            return FlacIndexedReader(path)
+    except (ValueError, OSError, RuntimeError) as exc:
+        print(f"Falling back to soundfile for {path}: {exc}")
+    return SoundFileReader(path)
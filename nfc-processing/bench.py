@@ -0,0 +1,332 @@
+"""
+Benchmarks for the clip, spectrogram and detection-parsing paths.
+
+`run` generates deterministic synthetic nights (22,050 Hz mono noise with
+chirp "calls" injected at known times, plus a nighthawk-format detections CSV
+and an `HHMMSS description` notes file per detection count), then times each
+case in a fresh process and writes wall time, peak RSS and bytes read to
+JSON. Bytes read are those passed through read() calls, so the spec case's
+clips, WAVs read through a memory map, are not included. `compare` lines up
+two result files so regressions stand out:
+
+    py bench.py run --hours 1 --hours 8 -o before.json
+    (change something)
+    py bench.py run --hours 1 --hours 8 -o after.json
+    py bench.py compare before.json after.json
+
+Generated nights are kept in the data folder and reused by later runs.
+"""
+import contextlib
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import click
+import numpy as np
+import soundfile as sf
+
+import getsnips
+import runlog
+
+BENCH_VERSION = 1
+SAMPLERATE = 22050
+CALLS_PER_HOUR = 500
+CALL_SECS = 0.12
+BLOCK_SECS = 60
+NOISE_LEVEL = 0.01
+CALL_LEVEL = 0.2
+LABELS = ("bawwar", "norwat", "amered", "swathr", "ZEEP", "SBUF")
+NIGHTHAWK_COLUMNS = [
+    "start_sec",
+    "end_sec",
+    "filename",
+    "path",
+    "order",
+    "prob_order",
+    "family",
+    "prob_family",
+    "group",
+    "prob_group",
+    "species",
+    "prob_species",
+    "predicted_category",
+    "prob",
+]
+
+CASES = ("parse-csv", "parse-notes", "clip", "clip-pack", "spec")
+DEFAULT_COUNTS = (10, 100, 1000)
+
+
+def night_filename(data_dir, hours, seed):
+    return os.path.join(data_dir, f"night-{hours}h-s{seed}.flac")
+
+
+def call_times(hours, seed):
+    """Sorted start times (seconds) of the calls injected into a night."""
+    rng = np.random.default_rng([seed, hours])
+    return np.sort(rng.uniform(1.0, hours * 3600 - 1.0, CALLS_PER_HOUR * hours))
+
+
+def _chirp(t):
+    """A falling 8-4 kHz sweep with a smooth envelope, at times 0 <= t < CALL_SECS."""
+    f0, f1 = 8000.0, 4000.0
+    phase = 2 * np.pi * (f0 * t + (f1 - f0) * t * t / (2 * CALL_SECS))
+    return CALL_LEVEL * np.sin(np.pi * t / CALL_SECS) ** 2 * np.sin(phase)
+
+
+def write_night(fn, hours, seed):
+    """Write `hours` of noise with calls at call_times(hours, seed), a minute at a time."""
+    calls = call_times(hours, seed)
+    block_frames = BLOCK_SECS * SAMPLERATE
+    partial = fn + ".partial"
+    with sf.SoundFile(partial, "w", SAMPLERATE, channels=1, subtype="PCM_16", format="FLAC") as out:
+        for block in range(hours * 3600 // BLOCK_SECS):
+            rng = np.random.default_rng([seed, hours, block])
+            samples = rng.normal(0.0, NOISE_LEVEL, block_frames)
+            block_start = block * BLOCK_SECS
+            first, last = np.searchsorted(calls, [block_start - CALL_SECS, block_start + BLOCK_SECS])
+            for start in calls[first:last]:
+                lo = max(0, int(np.ceil((start - block_start) * SAMPLERATE)))
+                hi = min(block_frames, int(np.ceil((start + CALL_SECS - block_start) * SAMPLERATE)))
+                t = (np.arange(lo, hi) / SAMPLERATE + block_start) - start
+                samples[lo:hi] += _chirp(t)
+            out.write(np.clip(samples, -1.0, 1.0))
+    os.replace(partial, fn)
+
+
+def detection_times(hours, seed, count):
+    """
+    `count` detection start times: an even subset of the injected calls, plus
+    false positives at random times once there are more detections than calls.
+    """
+    calls = call_times(hours, seed)
+    if count <= len(calls):
+        return calls[np.linspace(0, len(calls) - 1, count).astype(int)]
+    rng = np.random.default_rng([seed, hours, count])
+    extra = rng.uniform(1.0, hours * 3600 - 2.0, count - len(calls))
+    return np.sort(np.concatenate([calls, extra]))
+
+
+def write_detection_files(fn_night, hours, seed, count):
+    """Write <night>-<count>_detections.csv and <night>-<count>.txt; returns both names."""
+    base = f"{os.path.splitext(fn_night)[0]}-{count}"
+    fn_csv, fn_notes = f"{base}_detections.csv", f"{base}.txt"
+    times = detection_times(hours, seed, count)
+    name = os.path.basename(fn_night)
+    with open(fn_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(NIGHTHAWK_COLUMNS)
+        path = os.path.abspath(fn_night)
+        for i, start in enumerate(times):
+            label = LABELS[i % len(LABELS)]
+            # nighthawk reports on a 0.1s grid, a little before the call
+            start_sec = np.floor((start - 0.2) * 10) / 10
+            row = dict(
+                start_sec=f"{start_sec:.1f}",
+                end_sec=f"{start_sec + 1.2:.1f}",
+                filename=name,
+                path=path,
+                order="Passeriformes",
+                prob_order="0.99",
+                family="Parulidae",
+                prob_family="0.99",
+                species=label,
+                prob_species="0.9995",
+                predicted_category=label,
+                prob="0.9995",
+            )
+            writer.writerow([row.get(column, "") for column in NIGHTHAWK_COLUMNS])
+    with open(fn_notes, "w") as f:
+        for i, start in enumerate(times):
+            secs = int(start)
+            f.write(
+                f"{secs // 3600:02d}{secs % 3600 // 60:02d}{secs % 60:02d}.{int(start * 10) % 10}"
+                f" {LABELS[i % len(LABELS)]}\n"
+            )
+    return fn_csv, fn_notes
+
+
+def prepare_data(data_dir, hours, seed, counts):
+    """Generate whatever is missing of one night and its detection files."""
+    os.makedirs(data_dir, exist_ok=True)
+    fn_night = night_filename(data_dir, hours, seed)
+    if not os.path.exists(fn_night):
+        click.echo(f'Generating "{fn_night}"...')
+        write_night(fn_night, hours, seed)
+    return fn_night, {count: write_detection_files(fn_night, hours, seed, count) for count in counts}
+
+
+def resource_usage():
+    """
+    (peak RSS bytes, bytes read) of this process so far; None where the
+    platform can't say. Bytes are counted as the run log counts them (see
+    runlog.io_counters), so WAVs read through a memory map, as in the spec
+    case, don't add to them.
+    """
+    peak = None
+    try:
+        import resource
+
+        # kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        try:
+            import psutil
+
+            peak = getattr(psutil.Process().memory_info(), "peak_wset", None)
+        except ImportError:
+            pass
+    read, _ = runlog.io_counters()
+    return peak, read
+
+
+def _run_case(case, fn_night, fn_csv, fn_notes):
+    """Run one case in this (fresh) process; returns its measurements."""
+    with tempfile.TemporaryDirectory() as outputdir, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        devnull
+    ):
+        clips = []
+        if case == "spec":
+            # the clips to render are setup, not part of the measurement
+            clips = getsnips.clip_file(fn_night, fn_csv, outputdir, merge_gap=None)
+
+        _, read_before = resource_usage()
+        start = time.perf_counter()
+        if case == "parse-csv":
+            count = len(getsnips.read_detections(fn_csv))
+        elif case == "parse-notes":
+            count = len(getsnips.read_detections(fn_notes))
+        elif case in ("clip", "clip-pack"):
+            clips = getsnips.clip_file(fn_night, fn_csv, outputdir, merge_gap=None, pack=case == "clip-pack")
+            count = len(clips)
+        elif case == "spec":
+            for clip in clips:
+                getsnips.create_spectrogram(
+                    clip, getsnips.spectrogram_filename(clip), min_frequency=0, max_frequency=11025, renderer="fast"
+                )
+            count = len(clips)
+        else:
+            raise ValueError(f"unknown case {case}")
+        wall_secs = time.perf_counter() - start
+        peak_rss, read_after = resource_usage()
+
+    return {
+        "wall_secs": wall_secs,
+        "peak_rss_bytes": peak_rss,
+        "read_bytes": None if read_after is None else read_after - read_before,
+        "items": count,
+    }
+
+
+def run_case(case, fn_night, fn_csv, fn_notes, repeat=1):
+    """Best-of-`repeat` measurements of a case, each repeat in a new process."""
+    runs = []
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            runs.append(executor.submit(_run_case, case, fn_night, fn_csv, fn_notes).result())
+    best = min(runs, key=lambda run: run["wall_secs"])
+    return dict(best, wall_secs_all=[run["wall_secs"] for run in runs])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result["case"], result["hours"], result["detections"]
+
+
+def _format_bytes(n):
+    return "-" if n is None else f"{n / 1e6:.1f}MB"
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("-d", "--data-dir", default="bench-data", show_default=True, help="Folder for the generated nights.")
+@click.option("-o", "--outfile", default=None, help="JSON results file (default: bench-<time>.json).")
+@click.option("--hours", multiple=True, type=click.IntRange(1, 8), default=[1], show_default=True, help="Night length; repeatable.")
+@click.option("-n", "--count", "counts", multiple=True, type=int, default=DEFAULT_COUNTS, show_default=True, help="Detections per night; repeatable.")
+@click.option("-c", "--case", "cases", multiple=True, type=click.Choice(CASES), default=CASES, show_default=True, help="Cases to run; repeatable.")
+@click.option("--repeat", default=3, show_default=True, help="Runs per case; the fastest is reported.")
+@click.option("--seed", default=0, show_default=True)
+def run(data_dir, outfile, hours, counts, cases, repeat, seed):
+    """Time every case on every night length and detection count."""
+    outfile = outfile or f"bench-{datetime.now():%Y%m%d-%H%M%S}.json"
+    results = []
+    for night_hours in hours:
+        fn_night, detection_files = prepare_data(data_dir, night_hours, seed, counts)
+        for count, (fn_csv, fn_notes) in detection_files.items():
+            for case in cases:
+                result = dict(case=case, hours=night_hours, detections=count)
+                result.update(run_case(case, fn_night, fn_csv, fn_notes, repeat))
+                results.append(result)
+                click.echo(
+                    f"{case:12s} {night_hours}h {count:6d} detections: {result['wall_secs']:8.3f}s"
+                    f"  peak {_format_bytes(result['peak_rss_bytes'])}  read {_format_bytes(result['read_bytes'])}"
+                )
+
+    report = {
+        "version": BENCH_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "soundfile": sf.__version__,
+        "seed": seed,
+        "repeat": repeat,
+        "read_bytes": "bytes passed through read() calls; memory-mapped WAV reads are not included",
+        "results": results,
+    }
+    with open(outfile, "w") as f:
+        json.dump(report, f, indent=1)
+    click.echo(f'Wrote {len(results)} results to "{outfile}".')
+
+
+@cli.command()
+@click.argument("before", type=click.File())
+@click.argument("after", type=click.File())
+@click.option("--threshold", default=1.1, show_default=True, help="Flag cases this many times slower.")
+def compare(before, after, threshold):
+    """Compare two result files case by case."""
+    old = {result_key(result): result for result in json.load(before)["results"]}
+    regressions = 0
+    for result in json.load(after)["results"]:
+        previous = old.get(result_key(result))
+        if previous is None:
+            continue
+        ratio = result["wall_secs"] / max(previous["wall_secs"], 1e-9)
+        slower = ratio > threshold
+        regressions += slower
+        case, hours, count = result_key(result)
+        click.echo(
+            f"{case:12s} {hours}h {count:6d}: {previous['wall_secs']:8.3f}s -> {result['wall_secs']:8.3f}s"
+            f" ({ratio:5.2f}x)  peak {_format_bytes(previous['peak_rss_bytes'])} -> "
+            f"{_format_bytes(result['peak_rss_bytes'])}{'  SLOWER' if slower else ''}"
+        )
+    if regressions:
+        raise click.ClickException(f"{regressions} cases slower by more than {threshold}x.")
+
+
+if __name__ == "__main__":
+    cli()
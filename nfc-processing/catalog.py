@@ -0,0 +1,145 @@
+"""
+SQLite catalog of detections across nights.
+
+Each ingested detections file (nighthawk CSV or notes .txt) is a source row
+remembering its size and mtime; its detections are replaced as a whole when
+the file changes and left alone otherwise, so re-indexing an archive only
+parses what is new. Times are stored as sortable UTC ISO strings and the
+label columns are indexed together with the time, so queries like "bawwar
+above 0.99 in September" are index lookups rather than CSV scans.
+"""
+import sqlite3
+
+DEFAULT_DB = "nfc-catalog.sqlite"
+
+# detection columns, in export order
+COLUMNS = [
+    "recording",
+    "utc_start",
+    "utc_end",
+    "start_sec",
+    "end_sec",
+    "category",
+    "prob",
+    "order_name",
+    "prob_order",
+    "family",
+    "prob_family",
+    "group_name",
+    "prob_group",
+    "species",
+    "prob_species",
+    "clip_path",
+    "source",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id) ON DELETE CASCADE,
+    recording TEXT NOT NULL,
+    utc_start TEXT,
+    utc_end TEXT,
+    start_sec REAL NOT NULL,
+    end_sec REAL NOT NULL,
+    category TEXT,
+    prob REAL,
+    order_name TEXT,
+    prob_order REAL,
+    family TEXT,
+    prob_family REAL,
+    group_name TEXT,
+    prob_group REAL,
+    species TEXT,
+    prob_species REAL,
+    clip_path TEXT
+);
+CREATE INDEX IF NOT EXISTS detections_source ON detections(source_id);
+CREATE INDEX IF NOT EXISTS detections_time ON detections(utc_start);
+CREATE INDEX IF NOT EXISTS detections_category ON detections(category, utc_start);
+CREATE INDEX IF NOT EXISTS detections_species ON detections(species, utc_start);
+CREATE INDEX IF NOT EXISTS detections_group ON detections(group_name, utc_start);
+CREATE INDEX IF NOT EXISTS detections_recording ON detections(recording);
+"""
+
+
+def connect(db_path=DEFAULT_DB):
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(SCHEMA)
+    return db
+
+
+def is_current(db, path, size, mtime):
+    row = db.execute("SELECT size, mtime FROM sources WHERE path = ?", (path,)).fetchone()
+    return row is not None and row["size"] == size and row["mtime"] == mtime
+
+
+def replace_source(db, path, size, mtime, detections):
+    """Replace everything ingested from `path` with `detections` (dicts keyed by COLUMNS)."""
+    db.execute("DELETE FROM sources WHERE path = ?", (path,))
+    source_id = db.execute(
+        "INSERT INTO sources (path, size, mtime) VALUES (?, ?, ?)", (path, size, mtime)
+    ).lastrowid
+    columns = [column for column in COLUMNS if column != "source"]
+    db.executemany(
+        f"INSERT INTO detections (source_id, {', '.join(columns)}) "
+        f"VALUES (?, {', '.join('?' for _ in columns)})",
+        ([source_id] + [d.get(column) for column in columns] for d in detections),
+    )
+
+
+def prune_sources(db, keep_paths, prefix):
+    """Forget sources under `prefix` that are not in `keep_paths` (deleted files)."""
+    stale = [
+        row["path"]
+        for row in db.execute(
+            "SELECT path FROM sources WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+        )
+        if row["path"] not in keep_paths
+    ]
+    db.executemany("DELETE FROM sources WHERE path = ?", ((path,) for path in stale))
+    return stale
+
+
+def query(db, label=None, min_prob=None, since=None, until=None, recording=None, limit=None):
+    """
+    Detections matching every given filter, in time order. `label` matches the
+    predicted category, species or group; `since`/`until` are UTC date or
+    datetime strings ("2023-09-01", "2023-09-30 12:00"), `until` inclusive of
+    that whole day when only a date is given.
+    """
+    where, params = [], []
+    if label:
+        where.append("(d.category = ? OR d.species = ? OR d.group_name = ?)")
+        params += [label] * 3
+    if min_prob is not None:
+        where.append("d.prob >= ?")
+        params.append(min_prob)
+    if since:
+        where.append("d.utc_start >= ?")
+        params.append(since)
+    if until:
+        where.append("d.utc_start < ?")
+        params.append(until + "~" if len(until) == 10 else until)
+    if recording:
+        where.append("d.recording LIKE ?")
+        params.append(f"%{recording}%")
+
+    sql = (
+        "SELECT d.*, s.path AS source FROM detections d JOIN sources s ON s.id = d.source_id"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + " ORDER BY d.utc_start, d.recording, d.start_sec"
+    )
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return db.execute(sql, params).fetchall()
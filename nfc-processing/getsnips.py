@@ -1,45 +1,75 @@
+"""
+Clip, spectrogram and contact-sheet tools for NFC recordings, and a catalog
+of detections across nights.
+
+Usable as a command line tool, `py getsnips.py <command> ...`:
+
+    clip      clip a recording's detections into WAVs (or one clip pack)
+    extract   pull clips out of a clip pack as WAVs
+    spec      render spectrograms for many clips, in parallel
+    sheet     contact sheets of every detection in a recording
+    archive   re-clip every recording under a folder, resumably
+    index     add detections files to the SQLite catalog
+    query     list catalogued detections matching filters
+    export    write catalogued detections matching filters to CSV
+
+or imported in-process:
+
+    import getsnips
+    getsnips.clip_file("night.flac")
+    getsnips.render_spectrograms(getsnips.expand_audio_paths(["clips"]), renderer="fast")
+    getsnips.contact_sheets("night.flac")
+
+librosa, matplotlib and scipy are only imported by the functions that need
+them, so importing this module, `--help` and parsing detections stay fast.
+"""
+import csv
+import fnmatch
+import glob
+import hashlib
+import json
 import os
 import re
-from datetime import timedelta
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Union
 import click
-from matplotlib.pyplot import figure
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import soundfile as sf
-from scipy import signal
-import matplotlib.pyplot as plt
-import librosa
-import librosa.display
 
-import matplotlib.ticker as ticker
+import catalog
+import runlog
+from arraycache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MB, ArrayCache, file_identity
+from audioreader import native_dtype, open_audio
+from manifest import load_manifest, save_manifest
+
+
+# the yellow line marking the centre of a clip (Hz, seconds)
+MARKER_FREQUENCY = 7000
+MARKER_DURATION = 0.05
 
 
 def _add_spec_to_axes(
-    clip,
+    S_db,
     duration,
     ax,
-    n_fft,
     hop_length=None,
-    win_length=None,
-    window=signal.windows.blackman,
 ):
     #             ax.set_title(f"{window} {min(n_fft, win_length)}", fontsize=4)
     # ax.xaxis.set_visible(False)
     # ax.yaxis.set_visible(False)
     # ax.yaxis.set_ticklabels([])
 
+    import librosa.display
+
     # plt.gca().set_axis_off()
-    S = np.abs(
-        librosa.stft(
-            clip,
-            hop_length=hop_length,
-            win_length=min(n_fft, win_length) if win_length else None,
-            window=window,
-            n_fft=n_fft,  # fft must be equal to or greater than win_length
-        )
-    )
     librosa.display.specshow(
-        librosa.amplitude_to_db(S, ref=np.max),
+        S_db,
         cmap="gray_r",
         y_axis="hz",
         x_axis="ms",
@@ -51,13 +81,368 @@ def _add_spec_to_axes(
     ax.label_outer()
 
     # draw vertical line from (70,100) to (70, 250)
-    y2 = y1 = 7000
-    yellow_line_duration = 0.05
-    x1 = duration / 2.0 - yellow_line_duration / 2.0
-    x2 = x1 + yellow_line_duration
+    y2 = y1 = MARKER_FREQUENCY
+    x1 = duration / 2.0 - MARKER_DURATION / 2.0
+    x2 = x1 + MARKER_DURATION
     ax.plot([x1, x2], [y1, y2], "y-", lw=0.5)
 
 
+@lru_cache(maxsize=16)
+def _stft_window(window, n_fft, win_length=None):
+    """Analysis window of `win_length` samples, zero-padded to `n_fft`, as librosa does."""
+    win_length = min(n_fft, win_length) if win_length else n_fft
+    if callable(window):
+        w = np.asarray(window(win_length), dtype=np.float32)
+    else:
+        from scipy import signal
+
+        w = signal.get_window(window, win_length, fftbins=True).astype(np.float32)
+    pad = n_fft - win_length
+    return np.pad(w, (pad // 2, pad - pad // 2))
+
+
+def batch_stft_magnitude(
+    clips,
+    n_fft=256,
+    hop_length=16,
+    win_length=None,
+    window=np.blackman,
+    max_chunk_bytes=256 * 1024 * 1024,
+):
+    """
+    Magnitude spectrograms of many equal-length clips at once.
+
+    `clips` is a 2-D array (n_clips, n_samples). Returns a float32 array of
+    shape (n_clips, 1 + n_fft // 2, n_frames), framed like librosa.stft with
+    center=True, zero padding and the same (cached) window. Clips are
+    processed in chunks so the framed intermediate stays under
+    `max_chunk_bytes`.
+    """
+    clips = np.asarray(clips, dtype=np.float32)
+    if clips.ndim != 2:
+        raise ValueError(f"expected a 2-D array of clips, got shape {clips.shape}")
+    hop_length = hop_length or n_fft // 4
+    w = _stft_window(window, n_fft, win_length)
+
+    padded = np.pad(clips, ((0, 0), (n_fft // 2, n_fft // 2)))
+    n_frames = 1 + (padded.shape[1] - n_fft) // hop_length
+    out = np.empty((len(clips), 1 + n_fft // 2, n_frames), dtype=np.float32)
+
+    per_clip_bytes = n_frames * n_fft * 8
+    chunk = max(1, max_chunk_bytes // per_clip_bytes)
+    for i in range(0, len(clips), chunk):
+        frames = sliding_window_view(padded[i : i + chunk], n_fft, axis=1)[
+            :, ::hop_length
+        ]
+        spectrum = np.fft.rfft(frames * w, axis=-1)
+        out[i : i + chunk] = np.abs(spectrum).transpose(0, 2, 1)
+    return out
+
+
+def batch_amplitude_to_db(S, amin=1e-5, top_db=80.0):
+    """
+    librosa.amplitude_to_db(ref=np.max) applied to each spectrogram in a
+    (n_clips, bins, frames) stack independently.
+    """
+    S = np.maximum(S, amin)
+    ref = S.max(axis=(1, 2), keepdims=True)
+    S_db = 20.0 * np.log10(S) - 20.0 * np.log10(ref)
+    if top_db is not None:
+        S_db = np.maximum(S_db, -top_db)
+    return S_db
+
+
+def _spectrogram_db(
+    clip,
+    n_fft,
+    hop_length=None,
+    win_length=None,
+    window=np.blackman,
+):
+    S = batch_stft_magnitude(
+        clip[np.newaxis],
+        n_fft=n_fft,
+        hop_length=hop_length,
+        win_length=win_length,
+        window=window,
+    )
+    return batch_amplitude_to_db(S)[0]
+
+
+# width of a "fast" spectrogram PNG, about that of the matplotlib figure
+SPEC_WIDTH = 700
+# palette index of the centre marker; the colormap gets the 255 below it
+MARKER_INDEX = 255
+
+
+@lru_cache(maxsize=None)
+def _colormap_lut(cmap="gray_r"):
+    """
+    256-entry uint8 RGB palette: a matplotlib colormap over indices 0-254 and
+    yellow for the marker at MARKER_INDEX.
+    """
+    import matplotlib.pyplot as plt
+
+    colors = plt.get_cmap(cmap)(np.linspace(0.0, 1.0, MARKER_INDEX))[:, :3]
+    return np.vstack([np.round(colors * 255).astype(np.uint8), [[255, 255, 0]]]).astype(np.uint8)
+
+
+def render_spectrogram_levels(
+    S_db,
+    sample_rate,
+    n_fft,
+    hop_length,
+    min_frequency=None,
+    max_frequency=None,
+    marker=True,
+    min_height=400,
+    width=None,
+):
+    """
+    Map a dB spectrogram (frequency x frames, as from _spectrogram_db) to a
+    uint8 image of _colormap_lut indices, low frequencies at the bottom. Rows
+    outside [min_frequency, max_frequency] are cropped, frames are max-pooled
+    down to `width` columns when there are more, and rows are repeated so the
+    image is at least `min_height` pixels tall. The centre marker matches the
+    one drawn by _add_spec_to_axes.
+    """
+    hz_per_bin = sample_rate / n_fft
+    lo = 0 if min_frequency is None else max(0, int(np.floor(min_frequency / hz_per_bin)))
+    hi = len(S_db) if max_frequency is None else int(np.ceil(max_frequency / hz_per_bin)) + 1
+    S_db = S_db[lo:hi]
+
+    n_frames = S_db.shape[1]
+    if width and n_frames > width:
+        # keep the loudest frame of each column, as pyramid.py does, so short calls survive
+        edges = np.linspace(0, n_frames, width + 1).astype(int)[:-1]
+        S_db = np.maximum.reduceat(S_db, edges, axis=1)
+
+    vmin, vmax = S_db.min(), S_db.max()
+    scale = (MARKER_INDEX - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    levels = np.clip((S_db - vmin) * scale, 0, MARKER_INDEX - 1).astype(np.uint8)[::-1]
+
+    row_repeat = max(1, -(-min_height // len(levels)))
+    if row_repeat > 1:
+        levels = np.repeat(levels, row_repeat, axis=0)
+
+    marker_bin = int(round(MARKER_FREQUENCY / hz_per_bin))
+    if marker and lo <= marker_bin < lo + len(S_db):
+        columns = levels.shape[1]
+        center = (columns - 1) / 2.0
+        half_width = MARKER_DURATION / 2.0 * sample_rate / hop_length * columns / n_frames
+        x1 = max(0, int(round(center - half_width)))
+        x2 = min(columns, int(round(center + half_width)) + 1)
+        y = (lo + len(S_db) - 1 - marker_bin) * row_repeat + row_repeat // 2
+        levels[y, x1:x2] = MARKER_INDEX
+
+    return levels
+
+
+def render_spectrogram_image(S_db, sample_rate, n_fft, hop_length, cmap="gray_r", **kwargs):
+    """render_spectrogram_levels as an RGB uint8 image, for compositing (e.g. contact sheets)."""
+    return _colormap_lut(cmap)[render_spectrogram_levels(S_db, sample_rate, n_fft, hop_length, **kwargs)]
+
+
+def write_spectrogram_png(
+    clip,
+    sample_rate,
+    fn_gram,
+    n_fft=256,
+    hop_length=16,
+    win_length=None,
+    window=np.blackman,
+    min_frequency=None,
+    max_frequency=None,
+):
+    """Render `clip` to `fn_gram` without building a matplotlib figure."""
+    S_db = _spectrogram_db(clip, n_fft, hop_length, win_length, window)
+    write_spectrogram_image(
+        S_db, sample_rate, fn_gram, n_fft, hop_length, min_frequency, max_frequency
+    )
+
+
+def write_spectrogram_image(
+    S_db,
+    sample_rate,
+    fn_gram,
+    n_fft=256,
+    hop_length=16,
+    min_frequency=None,
+    max_frequency=None,
+    width=SPEC_WIDTH,
+    cmap="gray_r",
+):
+    """Write an 8-bit palette PNG at most `width` pixels wide."""
+    from PIL import Image
+
+    levels = render_spectrogram_levels(
+        S_db,
+        sample_rate,
+        n_fft,
+        hop_length,
+        min_frequency=min_frequency,
+        max_frequency=max_frequency,
+        width=width,
+    )
+    image = Image.fromarray(levels, mode="P")
+    image.putpalette(_colormap_lut(cmap).tobytes())
+    image.save(fn_gram, optimize=False)
+
+
+def _band_filter(samplerate, min_frequency=None, max_frequency=None, order=4):
+    from scipy import signal
+
+    nyquist = samplerate / 2.0
+    if max_frequency is not None and max_frequency >= nyquist:
+        max_frequency = None
+    if min_frequency is not None and min_frequency <= 0:
+        min_frequency = None
+
+    if min_frequency and max_frequency:
+        return signal.butter(
+            order, [min_frequency, max_frequency], "bandpass", fs=samplerate, output="sos"
+        )
+    elif min_frequency:
+        return signal.butter(order, min_frequency, "highpass", fs=samplerate, output="sos")
+    elif max_frequency:
+        return signal.butter(order, max_frequency, "lowpass", fs=samplerate, output="sos")
+    return None
+
+
+def find_loudest_time(
+    fn_audio,
+    offset=None,
+    duration=None,
+    min_frequency=None,
+    max_frequency=None,
+    frame_length=2048,
+    block_frames=65536,
+):
+    """
+    Return the time (in seconds from the start of the file) at the centre of the
+    loudest `frame_length`-sample frame, optionally band-limited and restricted
+    to [offset, offset + duration).
+
+    The file is streamed in blocks through a stateful filter while only the
+    running RMS maximum is kept, so memory stays flat however long the file is.
+    """
+    from scipy import signal
+
+    with open_audio(fn_audio) as f:
+        samplerate = f.samplerate
+        start_frame = min(get_frame(offset, samplerate), f.frames) if offset else 0
+        stop_frame = f.frames
+        if duration is not None:
+            stop_frame = min(stop_frame, start_frame + get_frame(duration, samplerate))
+        f.seek(start_frame)
+
+        sos = _band_filter(samplerate, min_frequency, max_frequency)
+        zi = None if sos is None else np.zeros((sos.shape[0], 2))
+
+        best_rms, best_frame = -1.0, start_frame
+        carry = np.zeros(0, dtype=np.float32)
+        carry_start = position = start_frame
+        while position < stop_frame:
+            block = f.read(
+                min(block_frames, stop_frame - position), dtype="float32", always_2d=True
+            )
+            if not len(block):
+                break
+            position += len(block)
+            block = block.mean(axis=1)
+            if sos is not None:
+                block, zi = signal.sosfilt(sos, block, zi=zi)
+
+            block = np.concatenate([carry, block])
+            n_frames = len(block) // frame_length
+            if n_frames == 0 and position >= stop_frame and best_rms < 0:
+                n_frames, frame_length = 1, len(block)
+            if n_frames:
+                frames = block[: n_frames * frame_length].reshape(n_frames, -1)
+                rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+                i = int(rms.argmax())
+                if rms[i] > best_rms:
+                    best_rms = rms[i]
+                    best_frame = carry_start + i * frame_length + frame_length // 2
+            carry = block[n_frames * frame_length :]
+            carry_start += n_frames * frame_length
+
+    return best_frame / samplerate
+
+
+def read_mono(f, offset=None, duration=None):
+    """Read `duration` seconds (default: to the end) from `offset` of an open reader as mono float32."""
+    if offset:
+        f.seek(get_frame(max(0.0, offset), f.samplerate))
+    frames = get_frame(duration, f.samplerate) if duration is not None else -1
+    return f.read(frames, dtype="float32", always_2d=True).mean(axis=1)
+
+
+def _window_name(window):
+    return f"{window.__module__}.{window.__qualname__}" if callable(window) else repr(window)
+
+
+def clip_spectrogram_db(
+    fn_audio,
+    offset=None,
+    duration=None,
+    n_fft=256,
+    hop_length=16,
+    win_length=None,
+    window=np.blackman,
+    cache=None,
+):
+    """
+    dB spectrogram (frequency x frames, see batch_amplitude_to_db) of part of
+    `fn_audio`. With an ArrayCache, one already computed for the same file
+    contents, span and STFT parameters is reused without decoding anything.
+    Entries are stored as float16: half the size of float32, and finer than
+    a rendered pixel's 80/255 dB step.
+    """
+    if cache is not None:
+        key = cache.key(
+            "stft-db",
+            file_identity(fn_audio),
+            offset,
+            duration,
+            n_fft,
+            hop_length,
+            win_length,
+            _window_name(window),
+        )
+        S_db = cache.get(key)
+        if S_db is not None:
+            return S_db.astype(np.float32)
+    with open_audio(fn_audio) as f:
+        clip = read_mono(f, offset, duration)
+    S_db = batch_amplitude_to_db(
+        batch_stft_magnitude(
+            clip[np.newaxis],
+            n_fft=n_fft,
+            hop_length=hop_length,
+            win_length=win_length,
+            window=window,
+        )
+    )[0]
+    if cache is not None:
+        cache.put(key, S_db.astype(np.float16))
+    return S_db
+
+
+def _loudest_time(fn_audio, min_frequency=None, max_frequency=None, cache=None):
+    if cache is not None:
+        key = cache.key("loudest", file_identity(fn_audio), min_frequency, max_frequency)
+        loudest_time = cache.get(key)
+        if loudest_time is not None:
+            return float(loudest_time)
+    loudest_time = find_loudest_time(
+        fn_audio, min_frequency=min_frequency, max_frequency=max_frequency
+    )
+    if cache is not None:
+        cache.put(key, np.array(loudest_time))
+    return loudest_time
+
+
 def create_spectrogram(
     fn_audio,
     fn_gram,
@@ -65,59 +450,82 @@ def create_spectrogram(
     duration=None,
     n_fft=256,
     hop_length=16,
-    window=signal.windows.blackman,
+    window=np.blackman,
     min_frequency=None,
     max_frequency=None,
     auto_center=False,
+    renderer="matplotlib",
+    cache=None,
 ):
+    """
+    Write a spectrogram of part of `fn_audio` to the PNG `fn_gram`.
+
+    renderer="matplotlib" draws an annotated figure (axes, ticks, labels);
+    renderer="fast" writes just the image through a colormap lookup table,
+    which is much cheaper when rendering thousands of clips.
+
+    With an ArrayCache as `cache`, re-rendering the same span with the same
+    STFT parameters (e.g. another frequency crop or renderer) skips decoding
+    and the FFT.
+    """
 
     # duration = 3.0 - offset * 2.0
     # # offset = 0
     # duration = 1.0
-    entire_clip, sample_rate = librosa.load(
-        fn_audio, sr=None  # , offset=offset, duration=duration
-    )
-    total_infile_duration = librosa.get_duration(entire_clip, sr=sample_rate)
-
     if auto_center:
-        S, phase = librosa.magphase(librosa.stft(entire_clip))
-        rms_data = librosa.feature.rms(S=S)
-        loudest_time = (
-            rms_data.argmax() / len(rms_data[0]) * len(entire_clip) / sample_rate
-        )
+        loudest_time = _loudest_time(fn_audio, min_frequency, max_frequency, cache)
 
         print(f"loudest time is {loudest_time}")
 
         duration = 0.3 if duration is None else duration
         offset = loudest_time - duration / 2.0
 
+    info = sf.info(fn_audio)
+    sample_rate = info.samplerate
     if offset is None and duration is not None:
+        total_infile_duration = info.frames / sample_rate
         offset = (total_infile_duration - duration) / 2.0
     elif offset is not None and duration is None:
         duration = 0.3
 
-    clip, sample_rate = librosa.load(
-        fn_audio,
-        sr=None,
-        offset=offset,
-        duration=duration
-        # offset=loudest_time,
-        # duration=duration,
-    )
-    duration = librosa.get_duration(clip, sr=sample_rate)
-
     win_length = None  # n_fft
-    fig = plt.figure(figsize=(8.00, 6.00), dpi=100)
-    axes = fig.subplots()
-    _add_spec_to_axes(
-        clip,
-        ax=axes,
-        duration=duration,
+    S_db = clip_spectrogram_db(
+        fn_audio,
+        offset,
+        duration,
         n_fft=n_fft,
         hop_length=hop_length,
         win_length=win_length,
         window=window,
+        cache=cache,
     )
+    # the length read_mono reads, without having to decode it
+    start_frame = get_frame(max(0.0, offset), sample_rate) if offset else 0
+    clip_frames = max(0, info.frames - start_frame)
+    if duration is not None:
+        clip_frames = min(clip_frames, get_frame(duration, sample_rate))
+    duration = clip_frames / sample_rate
+
+    if renderer == "fast":
+        write_spectrogram_image(
+            S_db,
+            sample_rate,
+            fn_gram,
+            n_fft=n_fft,
+            hop_length=hop_length,
+            min_frequency=min_frequency,
+            max_frequency=max_frequency,
+        )
+        click.echo(f'Wrote spectrogram to "{fn_gram}".')
+        return
+    elif renderer != "matplotlib":
+        raise ValueError(f"unknown renderer {renderer!r}")
+
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(8.00, 6.00), dpi=100)
+    axes = fig.subplots()
+    _add_spec_to_axes(S_db, ax=axes, duration=duration, hop_length=hop_length)
 
     axes.set(ylim=[min_frequency, max_frequency])
 
@@ -140,6 +548,94 @@ def create_spectrogram(
 # )
 
 
+def spectrogram_filename(infile):
+    basename, ext = os.path.splitext(infile)
+    return f"{basename}-spec.png"
+
+
+def expand_audio_paths(patterns):
+    """
+    Expand directories (all .wav/.flac inside) and glob patterns into a sorted,
+    de-duplicated list of audio files.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for ext in ("*.wav", "*.flac"):
+                paths.update(
+                    path
+                    for path in glob.glob(os.path.join(glob.escape(pattern), ext))
+                    if not is_clip_pack(path)
+                )
+        else:
+            matches = glob.glob(pattern)
+            if not matches and os.path.exists(pattern):
+                matches = [pattern]
+            paths.update(matches)
+    return sorted(paths)
+
+
+def is_up_to_date(outfile, infile):
+    return os.path.exists(outfile) and os.path.getmtime(outfile) >= os.path.getmtime(
+        infile
+    )
+
+
+def _init_spectrogram_worker():
+    # workers only ever save figures; never spin up a GUI backend per process.
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _render_spectrogram_job(infile, outfile, kwargs):
+    create_spectrogram(infile, outfile, **kwargs)
+    return outfile
+
+
+def render_spectrograms(infiles, jobs=None, force=False, **kwargs):
+    """
+    Render `<clip>-spec.png` next to every file in `infiles` across a pool of
+    `jobs` processes (default: one per core). Outputs newer than their source
+    are skipped unless `force` is set. Extra keyword arguments are passed to
+    create_spectrogram. Returns the list of spectrograms written.
+    """
+    todo = []
+    for infile in infiles:
+        outfile = spectrogram_filename(infile)
+        if not force and is_up_to_date(outfile, infile):
+            continue
+        todo.append((infile, outfile))
+    click.echo(
+        f"Rendering {len(todo)} spectrograms ({len(infiles) - len(todo)} up to date)."
+    )
+
+    written = []
+    failures = 0
+    with ProcessPoolExecutor(
+        max_workers=jobs or os.cpu_count(), initializer=_init_spectrogram_worker
+    ) as executor:
+        futures = {
+            executor.submit(_render_spectrogram_job, infile, outfile, kwargs): infile
+            for infile, outfile in todo
+        }
+        for future in as_completed(futures):
+            try:
+                written.append(future.result())
+            except Exception as exc:
+                failures += 1
+                click.echo(f'Failed to render "{futures[future]}": {exc}')
+
+    if failures:
+        click.echo(f"{failures} spectrograms failed.")
+    runlog.count(
+        spectrograms=len(written),
+        spectrograms_up_to_date=len(infiles) - len(todo),
+        spectrograms_failed=failures,
+    )
+    return written
+
+
 def construct_safe_filename(s):
     s = re.sub(r"[/\\]", "_", s)
     s = re.sub(r"\?", " maybe", s)
@@ -153,8 +649,19 @@ def get_frame(timestamp: Union[float, timedelta], samplerate: int):
     return int(round(timestamp_secs * samplerate))
 
 
-def write_clip(infile, outputdir, timestamp, description, length_secs: float = 3.0):
-    fileinfo = sf.info(infile)
+# prob is the detector's confidence, if any; members are the detections a
+# merged Detection was built from (empty for one straight from the notes file)
+Detection = namedtuple(
+    "Detection",
+    ["timestamp", "description", "length_secs", "prob", "members"],
+    defaults=(None, ()),
+)
+
+# nighthawk detections below this probability are not clipped
+CLIP_MIN_PROB = 0.99
+
+
+def clip_filename(infile, outputdir, timestamp, description):
     basefilename = os.path.splitext(os.path.split(infile)[1])[0]
 
     sec = round(timestamp.total_seconds())
@@ -164,27 +671,892 @@ def write_clip(infile, outputdir, timestamp, description, length_secs: float = 3
 
     description = construct_safe_filename(description)
     desc = f"{hours:02d}{minutes:02d}{seconds:02d}-{description}"
-    outfile = os.path.join(outputdir, f"{basefilename} {desc}.wav")
-    samplerate = fileinfo.samplerate
-    start_ts = timestamp - timedelta(seconds=length_secs / 2.0)
-    start_frame = get_frame(start_ts, samplerate)
-    clip_wav_data, _ = sf.read(
-        infile, frames=get_frame(length_secs, samplerate), start=start_frame
+    return os.path.join(outputdir, f"{basefilename} {desc}.wav")
+
+
+def clip_span(detection, samplerate):
+    """Return the (start_frame, frames) of audio to extract for a detection."""
+    start_ts = detection.timestamp - timedelta(seconds=detection.length_secs / 2.0)
+    start_frame = max(0, get_frame(start_ts, samplerate))
+    return start_frame, get_frame(detection.length_secs, samplerate)
+
+
+def iter_clip_audio(f, detections):
+    """
+    Yield (detection, data) for each detection in order of start time, reading
+    the open SoundFile `f` in a single forward pass.
+
+    Audio shared by overlapping clips is decoded once and kept in a small
+    buffer; gaps between clips are skipped with a seek instead of decoded.
+    """
+    dtype = native_dtype(f.subtype)
+    spans = sorted(
+        ((clip_span(d, f.samplerate), d) for d in detections),
+        key=lambda item: item[0],
     )
-    with sf.SoundFile(
-        outfile,
-        "w",
-        fileinfo.samplerate,
-        channels=fileinfo.channels,
-        subtype=fileinfo.subtype,
-    ) as f:
-        f.write(clip_wav_data)
 
-    print(f"Wrote {timestamp} into {outfile}")
+    buf = np.zeros((0, f.channels), dtype=dtype)
+    buf_start = 0
+    for (start_frame, frames), detection in spans:
+        if start_frame >= buf_start + len(buf):
+            f.seek(min(start_frame, f.frames))
+            buf = buf[:0]
+        else:
+            buf = buf[start_frame - buf_start :]
+        buf_start = start_frame
+
+        missing = frames - len(buf)
+        if missing > 0:
+            more = f.read(missing, dtype=dtype, always_2d=True)
+            buf = np.concatenate([buf, more]) if len(buf) else more
+
+        yield detection, buf[:frames]
+
+
+def write_clips(infile, outputdir, detections):
+    """
+    Write one WAV per detection, opening `infile` once and decoding it in one
+    forward pass. Samples keep the source subtype (e.g. PCM_16 or PCM_24).
+    """
+    outfiles = []
+    with open_audio(infile) as f:
+        for detection, clip_wav_data in iter_clip_audio(f, detections):
+            outfile = clip_filename(
+                infile, outputdir, detection.timestamp, detection.description
+            )
+            with sf.SoundFile(
+                outfile,
+                "w",
+                f.samplerate,
+                channels=f.channels,
+                subtype=f.subtype,
+            ) as out:
+                out.write(clip_wav_data)
+
+            print(f"Wrote {detection.timestamp} into {outfile}")
+            outfiles.append(outfile)
+    return outfiles
+
+
+# a recording's clips packed end to end in one <infile_base>_clippack.flac,
+# indexed by the pack_offset/pack_frames columns of <infile_base>_clips.csv
+PACK_SUFFIX = "_clippack"
+
+
+def pack_filename(infile, outputdir, ext=".flac"):
+    basefilename = os.path.splitext(os.path.basename(infile))[0]
+    return os.path.join(outputdir, f"{basefilename}{PACK_SUFFIX}{ext}")
+
+
+def is_clip_pack(path):
+    return os.path.splitext(path)[0].endswith(PACK_SUFFIX)
+
+
+def write_clip_pack(infile, outputdir, detections):
+    """
+    Append the audio of every detection to one pack file instead of writing a
+    WAV each: FLAC, or WAV for sample formats FLAC can't hold. Returns the
+    pack's filename and a list of (detection, pack_offset, pack_frames) in
+    pack order.
+    """
+    packed = []
+    with open_audio(infile) as f:
+        ext = ".flac" if sf.check_format("FLAC", f.subtype) else ".wav"
+        fn_pack = pack_filename(infile, outputdir, ext)
+        partial = fn_pack + ".partial"
+        with sf.SoundFile(
+            partial,
+            "w",
+            f.samplerate,
+            channels=f.channels,
+            subtype=f.subtype,
+            format=ext[1:].upper(),
+        ) as out:
+            offset = 0
+            for detection, clip_wav_data in iter_clip_audio(f, detections):
+                out.write(clip_wav_data)
+                packed.append((detection, offset, len(clip_wav_data)))
+                offset += len(clip_wav_data)
+    os.replace(partial, fn_pack)
+    print(f"Packed {len(packed)} clips into {fn_pack}")
+    return fn_pack, packed
+
+
+def find_clip_pack(fn_manifest):
+    base = fn_manifest[: -len("_clips.csv")]
+    for ext in (".flac", ".wav"):
+        if os.path.exists(base + PACK_SUFFIX + ext):
+            return base + PACK_SUFFIX + ext
+    raise FileNotFoundError(f"no clip pack next to {fn_manifest}")
+
+
+def clip_manifest_filename(infile, outputdir=None):
+    """The `<infile_base>_clips.csv` clip_file writes into `outputdir` (default: "clips" next to it)."""
+    if outputdir is None:
+        outputdir = os.path.join(os.path.dirname(infile), "clips")
+    return os.path.join(outputdir, f"{os.path.splitext(os.path.basename(infile))[0]}_clips.csv")
+
+
+def remove_clips(fn_manifest):
+    """
+    Delete what a `_clips.csv` lists, its clip pack or its clips (with any
+    spectrograms rendered from them), and then the manifest itself, so
+    clips from an earlier run can't outlive a re-clip. Returns the number
+    of files deleted.
+    """
+    directory = os.path.dirname(fn_manifest)
+    with open(fn_manifest, newline="") as f:
+        rows = list(csv.DictReader(f))
+    files = []
+    if any(row.get("pack_offset") for row in rows):
+        try:
+            files.append(find_clip_pack(fn_manifest))
+        except FileNotFoundError:
+            pass
+    else:
+        clips = [os.path.join(directory, row["clip"]) for row in rows if row.get("clip")]
+        files += clips + [spectrogram_filename(clip) for clip in clips]
+    files.append(fn_manifest)
+    removed = 0
+    for fn in files:
+        try:
+            os.remove(fn)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def read_clip_index(fn_manifest):
+    """The packed clips listed in a `_clips.csv`, as dicts keyed by its header."""
+    with open(fn_manifest, newline="") as f:
+        return [row for row in csv.DictReader(f) if row.get("pack_offset")]
+
+
+def extract_clips(fn_manifest, patterns=None, outputdir=None):
+    """
+    Write the packed clips whose names match any of the fnmatch `patterns`
+    (all of them by default) as WAVs into `outputdir` (default: next to the
+    manifest), named as unpacked clips would be. Returns the files written.
+    """
+    outputdir = outputdir or os.path.dirname(fn_manifest)
+    os.makedirs(outputdir, exist_ok=True)
+    rows = [
+        row
+        for row in read_clip_index(fn_manifest)
+        if not patterns or any(fnmatch.fnmatch(row["clip"], pattern) for pattern in patterns)
+    ]
+    outfiles = []
+    with open_audio(find_clip_pack(fn_manifest)) as f:
+        dtype = native_dtype(f.subtype)
+        for row in sorted(rows, key=lambda row: int(row["pack_offset"])):
+            f.seek(int(row["pack_offset"]))
+            data = f.read(int(row["pack_frames"]), dtype=dtype, always_2d=True)
+            outfile = os.path.join(outputdir, row["clip"])
+            with sf.SoundFile(
+                outfile, "w", f.samplerate, channels=f.channels, subtype=f.subtype
+            ) as out:
+                out.write(data)
+            outfiles.append(outfile)
+    return outfiles
+
+
+def write_clip(infile, outputdir, timestamp, description, length_secs: float = 3.0):
+    return write_clips(
+        infile, outputdir, [Detection(timestamp, description, length_secs)]
+    )[0]
+
+
+NIGHTHAWK_LEVELS = ("order", "family", "group", "species")
+
+
+def is_nighthawk_csv(notesfile):
+    with open(notesfile, newline="", encoding="utf-8-sig") as f:
+        header = next(csv.reader(f), [])
+    return "start_sec" in header and "end_sec" in header
+
+
+def load_nighthawk_csv(fn, columns=None):
+    """
+    Read the named `columns` (default: all) of a nighthawk detections CSV in
+    one vectorized call. Columns are found by header name, so extra or
+    reordered columns and quoted fields (e.g. paths with commas) are fine.
+    Returns {name: array}: times and probabilities as float64 (NaN where
+    empty), everything else as str objects.
+    """
+    with open(fn, newline="", encoding="utf-8-sig") as f:
+        header = [name.strip() for name in next(csv.reader(f), [])]
+    columns = header if columns is None else list(columns)
+    missing = [name for name in columns if name not in header]
+    if missing:
+        raise ValueError(f"{fn}: no {', '.join(missing)} column")
+
+    usecols = [header.index(name) for name in columns]
+    dtype = [(name, "f8" if name.endswith("_sec") else "O") for name in columns]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # header-only files
+        table = np.loadtxt(
+            fn,
+            delimiter=",",
+            quotechar='"',
+            skiprows=1,
+            dtype=dtype,
+            usecols=usecols,
+            ndmin=1,
+            encoding="utf-8-sig",
+        )
+
+    loaded = {}
+    for name in columns:
+        values = table[name]
+        if name == "prob" or name.startswith("prob_"):
+            values = values.copy()
+            values[values == ""] = "nan"
+            values = values.astype(np.float64)
+        loaded[name] = values
+    return loaded
+
+
+def detection_mask(columns, min_prob=CLIP_MIN_PROB, thresholds=None):
+    """
+    Which rows of a loaded nighthawk CSV pass the thresholds. A row needs its
+    `prob` to reach `min_prob`, or thresholds[predicted_category] when that
+    is given (e.g. {"bawwar": 0.95}). A per-level column in `thresholds`
+    (e.g. {"prob_species": 0.9}) must also be reached by every row that is
+    labelled at that level.
+    """
+    thresholds = thresholds or {}
+    category = columns["predicted_category"]
+    needed = np.full(len(category), float(min_prob))
+    for name, value in thresholds.items():
+        if not name.startswith("prob_"):
+            needed[category == name] = value
+    mask = columns["prob"] >= needed
+
+    for name, value in thresholds.items():
+        if name.startswith("prob_"):
+            level = name[len("prob_") :]
+            labelled = columns[level] != "" if level in columns else ~np.isnan(columns[name])
+            mask &= ~labelled | (columns[name] >= value)
+    return mask
+
+
+def threshold_columns(thresholds=None):
+    """The CSV columns detection_mask needs for `thresholds`."""
+    columns = ["start_sec", "end_sec", "predicted_category", "prob"]
+    for name in thresholds or {}:
+        if name.startswith("prob_"):
+            level = name[len("prob_") :]
+            columns += [name] + ([level] if level in NIGHTHAWK_LEVELS else [])
+    return columns
+
+
+def read_detections(notesfile, min_prob=CLIP_MIN_PROB, thresholds=None):
+    """
+    Parse a notes file (`HHMMSS description` per line) or a nighthawk
+    detections CSV into a list of Detection, in file order. Nighthawk rows
+    are kept if they pass `min_prob` and `thresholds` (see detection_mask).
+    """
+    if is_nighthawk_csv(notesfile):
+        columns = load_nighthawk_csv(notesfile, threshold_columns(thresholds))
+        keep = np.flatnonzero(detection_mask(columns, min_prob, thresholds))
+        runlog.count(detections_parsed=len(columns["start_sec"]), detections_kept=len(keep))
+        start_sec, end_sec = columns["start_sec"][keep], columns["end_sec"][keep]
+        midpoints = (start_sec + end_sec) / 2.0
+        lengths = np.maximum(3.0, end_sec - start_sec + 2.0)
+        return [
+            Detection(timedelta(seconds=midpoint), category or "unknown", length_secs, prob)
+            for midpoint, category, length_secs, prob in zip(
+                midpoints.tolist(),
+                columns["predicted_category"][keep],
+                lengths.tolist(),
+                columns["prob"][keep].tolist(),
+            )
+        ]
+
+    detections = []
+    with open(notesfile) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                continue
+            m = re.match(r"(\d\d)(\d\d)(\d\d[\.\d]*)[ ]+(.*)", line)
+            if m is None:
+                print(f"skipping {line}, cannot parse.")
+                continue
+            hours = int(m.group(1))
+            minutes = int(m.group(2))
+            seconds = float(m.group(3))
+            timestamp = timedelta(hours=hours, minutes=minutes, seconds=seconds)
+            description = re.sub("[:]", "-", m.group(4))
+            detections.append(Detection(timestamp, description, 3))
+    runlog.count(detections_parsed=len(detections), detections_kept=len(detections))
+    return detections
+
+
+# a merged clip never grows past this; a longer run of detections is split
+MAX_CLIP_SECS = 10.0
+
+
+def merge_detections(detections, gap_secs=0.5, max_clip_secs=MAX_CLIP_SECS):
+    """
+    Combine detections whose clips overlap or are within `gap_secs` of each
+    other into one Detection spanning them all, labelled like its most
+    probable member and listing the originals in `members`. A group is closed
+    once adding the next detection would make it longer than `max_clip_secs`.
+    Only detector output (with a `prob`) is merged; hand annotations from a
+    notes file keep a clip each. Returns the result in order of start time,
+    so each stretch of audio is clipped once.
+    """
+
+    def bounds(detection):
+        start = detection.timestamp.total_seconds() - detection.length_secs / 2.0
+        return start, start + detection.length_secs
+
+    groups = []
+    for detection in sorted(detections, key=lambda d: bounds(d)[0]):
+        start, end = bounds(detection)
+        if (
+            groups
+            and detection.prob is not None
+            and groups[-1][2][-1].prob is not None
+            and start - groups[-1][1] <= gap_secs
+            and max(groups[-1][1], end) - groups[-1][0] <= max_clip_secs
+        ):
+            groups[-1][1] = max(groups[-1][1], end)
+            groups[-1][2].append(detection)
+        else:
+            groups.append([start, end, [detection]])
+
+    merged = []
+    for start, end, members in groups:
+        if len(members) == 1:
+            merged.append(members[0])
+            continue
+        best = max(members, key=lambda d: -1.0 if d.prob is None else d.prob)
+        merged.append(
+            Detection(
+                timedelta(seconds=(start + end) / 2.0),
+                best.description,
+                end - start,
+                best.prob,
+                tuple(members),
+            )
+        )
+    return merged
+
+
+def write_clip_manifest(fn_manifest, infile, outputdir, detections, pack_spans=None):
+    """
+    Record which detections went into which clip: one row per clip, listing
+    its members as "start-end label prob" separated by semicolons. With
+    `pack_spans`, (offset, frames) for each detection, the clips live in a
+    pack file and these are recorded too, making the manifest its index.
+    """
+    with open(fn_manifest, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["clip", "start_sec", "end_sec", "label", "prob", "members"]
+            + (["pack_offset", "pack_frames"] if pack_spans is not None else [])
+        )
+        for i, detection in enumerate(detections):
+            center = detection.timestamp.total_seconds()
+            members = "; ".join(
+                f"{m.timestamp.total_seconds() - m.length_secs / 2.0:.2f}-"
+                f"{m.timestamp.total_seconds() + m.length_secs / 2.0:.2f} {m.description}"
+                + ("" if m.prob is None else f" {m.prob:.4f}")
+                for m in detection.members or (detection,)
+            )
+            writer.writerow(
+                [
+                    os.path.basename(
+                        clip_filename(infile, outputdir, detection.timestamp, detection.description)
+                    ),
+                    f"{max(0.0, center - detection.length_secs / 2.0):.2f}",
+                    f"{center + detection.length_secs / 2.0:.2f}",
+                    detection.description,
+                    "" if detection.prob is None else detection.prob,
+                    members,
+                ]
+                + (list(pack_spans[i]) if pack_spans is not None else [])
+            )
+
+
+def find_notesfile(infile, notesfile=None):
+    """The detections file for `infile`: <base>.txt, else <base>_detections.csv."""
+    basename, ext = os.path.splitext(infile)
+    if not notesfile:
+        notesfile = basename + ".txt"
+    if not os.path.exists(notesfile):
+        notesfile = basename + "_detections.csv"
+
+    assert os.path.exists(notesfile), notesfile
+    return notesfile
+
+
+def format_timestamp(timestamp):
+    secs = timestamp.total_seconds()
+    hours, secs = divmod(secs, 3600)
+    minutes, secs = divmod(secs, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:04.1f}"
+
+
+def _write_sheet(fn_sheet, tiles, labels, columns, label_height=14, pad=2, dpi=100):
+    import matplotlib.pyplot as plt
+
+    tile_height, tile_width = tiles[0].shape[:2]
+    cell_height = tile_height + label_height + pad
+    cell_width = tile_width + pad
+    rows = -(-len(tiles) // columns)
+    height, width = rows * cell_height + pad, columns * cell_width + pad
+
+    mosaic = np.full((height, width, 3), 255, dtype=np.uint8)
+    fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    for i, (tile, label) in enumerate(zip(tiles, labels)):
+        y = (i // columns) * cell_height + pad + label_height
+        x = (i % columns) * cell_width + pad
+        mosaic[y : y + tile_height, x : x + tile_width] = tile
+        fig.text(
+            x / width,
+            1.0 - (y - label_height) / height,
+            label,
+            fontsize=7,
+            va="top",
+            ha="left",
+        )
+    fig.figimage(mosaic, origin="upper", zorder=-1)
+    fig.savefig(fn_sheet, dpi=dpi)
+    plt.close(fig)
+    click.echo(f'Wrote {len(tiles)} detections to "{fn_sheet}".')
+
+
+def write_contact_sheets(
+    infile,
+    detections,
+    fn_prefix=None,
+    columns=8,
+    rows=12,
+    tile_duration=1.0,
+    tile_width=240,
+    n_fft=256,
+    window=np.blackman,
+    min_frequency=None,
+    max_frequency=None,
+):
+    """
+    Render every detection as a small spectrogram tile, labelled with its time
+    and description, and pack them `columns` x `rows` to a page into
+    `<fn_prefix>-sheetNN.png`. The recording is read in one ordered pass and
+    each page's tiles are transformed with a single batched STFT; no per-clip
+    WAV or PNG is written. Returns the list of sheets written.
+    """
+    if fn_prefix is None:
+        fn_prefix = os.path.splitext(infile)[0]
+    per_sheet = columns * rows
+    fn_sheets = []
+
+    with open_audio(infile) as f:
+        samplerate = f.samplerate
+        tile_frames = get_frame(tile_duration, samplerate)
+        hop_length = max(1, tile_frames // tile_width)
+        tile_detections = [d._replace(length_secs=tile_duration) for d in detections]
+
+        def flush(page, labels):
+            S_db = batch_amplitude_to_db(
+                batch_stft_magnitude(
+                    page, n_fft=n_fft, hop_length=hop_length, window=window
+                )
+            )
+            tiles = [
+                render_spectrogram_image(
+                    S,
+                    samplerate,
+                    n_fft,
+                    hop_length,
+                    min_frequency=min_frequency,
+                    max_frequency=max_frequency,
+                    min_height=0,
+                )
+                for S in S_db
+            ]
+            fn_sheet = f"{fn_prefix}-sheet{len(fn_sheets) + 1:02d}.png"
+            _write_sheet(fn_sheet, tiles, labels, columns)
+            fn_sheets.append(fn_sheet)
+
+        page = np.zeros((per_sheet, tile_frames), dtype=np.float32)
+        labels = []
+        for detection, data in iter_clip_audio(f, tile_detections):
+            page[len(labels), : len(data)] = data.mean(axis=1, dtype=np.float32)
+            labels.append(f"{format_timestamp(detection.timestamp)} {detection.description}")
+            if len(labels) == per_sheet:
+                flush(page, labels)
+                page[:] = 0
+                labels = []
+        if labels:
+            flush(page[: len(labels)], labels)
+
+    return fn_sheets
+
+
+def clip_file(
+    infile,
+    notesfile=None,
+    outputdir=None,
+    merge_gap=0.5,
+    min_prob=CLIP_MIN_PROB,
+    thresholds=None,
+    pack=False,
+    max_clip_secs=MAX_CLIP_SECS,
+):
+    """
+    Write a clip for every detection of `infile` into `outputdir` (default:
+    a "clips" folder next to it). Detections whose clips overlap or are within
+    `merge_gap` seconds share one clip (None keeps them all separate), up to
+    `max_clip_secs` long, and `<infile_base>_clips.csv` in `outputdir`
+    records what each clip holds.
+    `min_prob` and `thresholds` pick the nighthawk detections worth clipping
+    (see detection_mask). Returns the list of clips written; with `pack`, the
+    clips all go into one `<infile_base>_clippack.flac` (see extract_clips)
+    and that is returned alone.
+    """
+    # infile = "NFC-2021-09-10 0000.flac"
+    assert os.path.exists(infile)
+    basename, ext = os.path.splitext(infile)
+    assert ext.lower() in [".flac", ".wav"]
+
+    notesfile = find_notesfile(infile, notesfile)
+
+    if outputdir is None:
+        outputdir = os.path.join(os.path.dirname(infile), "clips")
+    os.makedirs(outputdir, exist_ok=True)
+    """
+start_sec,end_sec,filename,path,order,prob_order,family,prob_family,group,prob_group,species,prob_species,predicted_category,prob
+30.200000000000003,32.0,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.97104126,Parulidae,0.951334,SBUF,0.9273938,,,SBUF,0.9273937940597534
+132.4,134.20000000000002,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.9721271,Parulidae,0.9554213,ZEEP,0.9575265,norwat,0.9999989,norwat,0.999998927116394
+227.4,228.8,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.96027213,Parulidae,0.9154916,ZEEP,0.88409126,,,ZEEP,0.8840912580490112
+232.4,234.0,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.97222793,Parulidae,0.9563978,,,bawwar,0.99999833,bawwar,0.9999983310699463
+"""
+
+    detections = read_detections(notesfile, min_prob, thresholds)
+    if merge_gap is not None:
+        merged = merge_detections(detections, merge_gap, max_clip_secs)
+        print(f"Merged {len(detections)} detections into {len(merged)} clips.")
+        detections = merged
+    runlog.count(clips=len(detections))
+    fn_manifest = clip_manifest_filename(infile, outputdir)
+    if pack:
+        fn_pack, packed = write_clip_pack(infile, outputdir, detections)
+        write_clip_manifest(
+            fn_manifest,
+            infile,
+            outputdir,
+            [detection for detection, _, _ in packed],
+            [(offset, frames) for _, offset, frames in packed],
+        )
+        return [fn_pack]
+    write_clip_manifest(fn_manifest, infile, outputdir, detections)
+    return write_clips(infile, outputdir, detections)
+
+
+def contact_sheets(infile, notesfile=None, min_prob=CLIP_MIN_PROB, thresholds=None, **kwargs):
+    """
+    Write contact sheets for every detection of `infile` that passes
+    `min_prob` and `thresholds`; extra keyword arguments go to
+    write_contact_sheets. Returns the list of sheets written.
+    """
+    assert os.path.exists(infile)
+    notesfile = find_notesfile(infile, notesfile)
+    detections = read_detections(notesfile, min_prob, thresholds)
+    if not detections:
+        click.echo(f"No detections in {notesfile}.")
+        return []
+    return write_contact_sheets(infile, detections, **kwargs)
+
+
+RECORDING_TIME_RE = re.compile(r"(\d{4})-(\d\d)-(\d\d)[ _-](\d\d)(\d\d)(\d\d)?([+-]\d{4})?")
+
+
+def recording_start_utc(path):
+    """
+    Start time of a recording from its name (e.g. "...-NFC-2021-09-10 2230-0400"
+    or "...-nfc-2021-08-14-2230") as naive UTC, or None. Names without a UTC
+    offset are taken to be in local time.
+    """
+    m = RECORDING_TIME_RE.search(os.path.basename(path))
+    if m is None:
+        return None
+    year, month, day, hour, minute, second, offset = m.groups()
+    start = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0))
+    if offset:
+        sign = -1 if offset[0] == "-" else 1
+        start = start.replace(
+            tzinfo=timezone(sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:])))
+        )
+    return start.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _recording_basename(notesfile):
+    basename = os.path.splitext(notesfile)[0]
+    if basename.endswith("_detections"):
+        basename = basename[: -len("_detections")]
+    return basename
+
+
+def find_recording(notesfile):
+    """The recording a detections/notes file belongs to (FLAC preferred), or None."""
+    basename = _recording_basename(notesfile)
+    for ext in (".flac", ".wav"):
+        if os.path.exists(basename + ext):
+            return basename + ext
+    return None
+
+
+def find_detection_files(path):
+    """Detections CSVs, and notes files next to their recording, at or under `path`."""
+    if not os.path.isdir(path):
+        return [path] if os.path.exists(path) else sorted(glob.glob(path))
+    found = []
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            fn = os.path.join(root, file)
+            if file.endswith("-candidates_detections.csv"):
+                continue  # predetect scratch output; remapped into _detections.csv
+            if file.endswith("_detections.csv") or (
+                file.endswith(".txt") and find_recording(fn)
+            ):
+                found.append(fn)
+    return sorted(found)
+
+
+# catalog column -> nighthawk CSV column
+CATALOG_CSV_COLUMNS = {
+    "category": "predicted_category",
+    "prob": "prob",
+    "order_name": "order",
+    "prob_order": "prob_order",
+    "family": "family",
+    "prob_family": "prob_family",
+    "group_name": "group",
+    "prob_group": "prob_group",
+    "species": "species",
+    "prob_species": "prob_species",
+}
+
+
+def catalog_rows(notesfile):
+    """Catalog rows (dicts keyed by catalog.COLUMNS) for one detections or notes file."""
+    # the WAV a detector ran on may since have been replaced by a FLAC, or deleted
+    recording = find_recording(notesfile) or _recording_basename(notesfile) + ".wav"
+    recording = os.path.abspath(recording)
+    clipdir = os.path.join(os.path.dirname(recording), "clips")
+    start = recording_start_utc(recording)
+
+    def at(secs):
+        return None if start is None else (start + timedelta(seconds=secs)).isoformat(" ", "milliseconds")
+
+    # the clip each clipped detection ends up in, merged as `clip` does by default
+    clip_paths = {}
+    for merged in merge_detections(read_detections(notesfile)):
+        clip_path = clip_filename(recording, clipdir, merged.timestamp, merged.description)
+        for member in merged.members or (merged,):
+            clip_paths[member.timestamp] = clip_path
+
+    rows = []
+    if is_nighthawk_csv(notesfile):
+        table = load_nighthawk_csv(notesfile)
+        n = len(table["start_sec"])
+
+        def values(name):
+            if name not in table:
+                return [None] * n
+            # empty labels and NaN probabilities both become NULL
+            return [None if v == "" or v != v else v for v in table[name].tolist()]
+
+        labels = {column: values(name) for column, name in CATALOG_CSV_COLUMNS.items()}
+        for i, (start_sec, end_sec) in enumerate(
+            zip(table["start_sec"].tolist(), table["end_sec"].tolist())
+        ):
+            row = {column: labels[column][i] for column in labels}
+            row["category"] = row["category"] or "unknown"
+            row.update(
+                recording=recording,
+                utc_start=at(start_sec),
+                utc_end=at(end_sec),
+                start_sec=start_sec,
+                end_sec=end_sec,
+                clip_path=clip_paths.get(timedelta(seconds=(start_sec + end_sec) / 2.0)),
+            )
+            rows.append(row)
+    else:
+        for detection in read_detections(notesfile):
+            center = detection.timestamp.total_seconds()
+            start_sec = max(0.0, center - detection.length_secs / 2.0)
+            end_sec = center + detection.length_secs / 2.0
+            rows.append(
+                dict(
+                    recording=recording,
+                    utc_start=at(start_sec),
+                    utc_end=at(end_sec),
+                    start_sec=start_sec,
+                    end_sec=end_sec,
+                    category=detection.description,
+                    clip_path=clip_paths.get(detection.timestamp),
+                )
+            )
+    return rows
+
+
+def index_detections(paths, db_path=catalog.DEFAULT_DB):
+    """
+    Ingest every detections CSV and notes file at or under `paths` into the
+    SQLite catalog at `db_path`. Files whose size and mtime are unchanged since
+    they were last indexed are skipped, and files that have disappeared from an
+    indexed directory are forgotten. Returns (indexed, unchanged) counts.
+    """
+    db = catalog.connect(db_path)
+    indexed = unchanged = 0
+    try:
+        with db:
+            for path in paths:
+                seen = set()
+                for notesfile in find_detection_files(path):
+                    notesfile = os.path.abspath(notesfile)
+                    seen.add(notesfile)
+                    stat = os.stat(notesfile)
+                    if catalog.is_current(db, notesfile, stat.st_size, stat.st_mtime):
+                        unchanged += 1
+                        continue
+                    try:
+                        rows = catalog_rows(notesfile)
+                    except (ValueError, KeyError) as exc:
+                        click.echo(f'Skipping "{notesfile}": {exc}')
+                        continue
+                    catalog.replace_source(db, notesfile, stat.st_size, stat.st_mtime, rows)
+                    indexed += 1
+                if os.path.isdir(path):
+                    prefix = os.path.join(os.path.abspath(path), "")
+                    for stale in catalog.prune_sources(db, seen, prefix):
+                        click.echo(f'Forgot "{stale}", which no longer exists.')
+    finally:
+        db.close()
+    return indexed, unchanged
+
+
+# remembers, per recording, the inputs and parameters it was last clipped with
+ARCHIVE_MANIFEST = ".getsnips-archive.json"
+
+
+def find_archive_recordings(root):
+    """(recording, notesfile) for every recording with detections under `root`, biggest first."""
+    recordings = {
+        recording
+        for recording in map(find_recording, find_detection_files(root))
+        if recording is not None
+    }
+    return [
+        (recording, find_notesfile(recording))
+        for recording in sorted(recordings, key=lambda path: (-os.path.getsize(path), path))
+    ]
+
+
+def archive_task_key(recording, notesfile, params):
+    """
+    Changes when the recording (size and mtime), the detections file
+    (content hash) or the clip parameters do.
+    """
+    with open(notesfile, "rb") as f:
+        notes_hash = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+    stat = os.stat(recording)
+    key = [stat.st_size, stat.st_mtime_ns, os.path.basename(notesfile), notes_hash, params]
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _archive_clip_job(recording, notesfile, params):
+    with runlog.stage("clip", file=recording):
+        fn_manifest = clip_manifest_filename(recording, params.get("outputdir"))
+        if os.path.exists(fn_manifest):
+            runlog.count(files_removed=remove_clips(fn_manifest))
+        return len(clip_file(recording, notesfile, **params))
+
+
+def reprocess_archive(root, jobs=None, force=False, **params):
+    """
+    Re-clip every recording with detections under `root` (e.g. an
+    `<output_directory>` of `<YYYY>/<YYYY-MM-DD>/` folders) across a pool of
+    `jobs` processes (default: one per core). `params` are clip_file keyword
+    arguments. A manifest in `root`, saved after each recording, keys every
+    finished recording by its inputs and `params`, so a rerun (e.g. after a
+    crash) skips those unless `force` is set or something changed. The
+    clips an earlier run listed in a recording's `_clips.csv` are deleted
+    before it is clipped again. Returns (clipped, unchanged, failed) counts.
+    """
+    manifest_path = os.path.join(root, ARCHIVE_MANIFEST)
+    manifest = load_manifest(manifest_path)
+
+    todo = []
+    unchanged = 0
+    for recording, notesfile in find_archive_recordings(root):
+        rel = os.path.relpath(recording, root)
+        key = archive_task_key(recording, notesfile, params)
+        if not force and manifest.get(rel, {}).get("key") == key:
+            unchanged += 1
+            continue
+        todo.append((rel, recording, notesfile, key))
+    click.echo(f"Clipping {len(todo)} recordings ({unchanged} unchanged) on {jobs or os.cpu_count()} processes.")
+
+    clipped = failed = 0
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = {
+            executor.submit(_archive_clip_job, recording, notesfile, params): (rel, key)
+            for rel, recording, notesfile, key in todo
+        }
+        for future in as_completed(futures):
+            rel, key = futures[future]
+            try:
+                clips = future.result()
+            except Exception as exc:
+                failed += 1
+                click.echo(f'Failed to clip "{rel}": {exc!r}')
+                continue
+            manifest[rel] = {"key": key, "clips": clips, "finished": datetime.now().isoformat(timespec="seconds")}
+            save_manifest(manifest_path, manifest)
+            clipped += 1
+            click.echo(f"[{clipped + failed}/{len(todo)}] {rel}: {clips} clips")
+    return clipped, unchanged, failed
 
 
 # # print(data)
 # clip(infile, timestamp=timedelta(minutes=1, seconds=7), description="singleup")
+def _parse_thresholds(ctx, param, values):
+    thresholds = {}
+    for value in values:
+        name, sep, prob = value.partition("=")
+        try:
+            thresholds[name.strip()] = float(prob)
+        except ValueError:
+            raise click.BadParameter(f"expected NAME=PROB, got {value!r}")
+    return thresholds
+
+
+def _threshold_options(command):
+    command = click.option(
+        "-t",
+        "--threshold",
+        "thresholds",
+        multiple=True,
+        callback=_parse_thresholds,
+        help="NAME=PROB: the prob a category needs (e.g. bawwar=0.95), or the minimum for a "
+        "level column (e.g. prob_species=0.9). Repeatable.",
+    )(command)
+    return click.option(
+        "-p",
+        "--min-prob",
+        default=CLIP_MIN_PROB,
+        show_default=True,
+        help="Probability a nighthawk detection needs unless --threshold says otherwise.",
+    )(command)
+
+
 @click.group()
 @click.option("--debug/--no-debug", default=False)
 def cli(debug):
@@ -202,64 +1574,71 @@ def cli(debug):
     type=str,
     help="if given, file to source clip timestamps from. otherwise, expects it to be <infile_base>.notes or <infile_base>._detections.csv",
 )
-def clip(infile, notesfile):
-    # infile = "NFC-2021-09-10 0000.flac"
-    assert os.path.exists(infile)
-    basename, ext = os.path.splitext(infile)
-    assert ext.lower() in [".flac", ".wav"]
-
-    if not notesfile:
-        notesfile = basename + ".txt"
-    if not os.path.exists(notesfile):
-        notesfile = basename + "_detections.csv"
+@click.option(
+    "-g",
+    "--merge-gap",
+    default=0.5,
+    show_default=True,
+    help="Detections whose clips overlap or are this many seconds apart share one clip.",
+)
+@click.option(
+    "--merge/--no-merge",
+    default=True,
+    help="Merge overlapping detections (default), or write a clip for every one.",
+)
+@click.option(
+    "--max-clip",
+    "max_clip_secs",
+    default=MAX_CLIP_SECS,
+    show_default=True,
+    help="Longest a merged clip may grow, in seconds.",
+)
+@click.option(
+    "--pack/--no-pack",
+    default=False,
+    help="Write all clips into one <infile_base>_clippack.flac, indexed by <infile_base>_clips.csv.",
+)
+@_threshold_options
+def clip(infile, notesfile, merge_gap, merge, max_clip_secs, pack, min_prob, thresholds):
+    clip_file(
+        infile,
+        notesfile,
+        merge_gap=merge_gap if merge else None,
+        max_clip_secs=max_clip_secs,
+        min_prob=min_prob,
+        thresholds=thresholds,
+        pack=pack,
+    )
 
-    assert os.path.exists(notesfile), notesfile
 
-    outputdir = os.path.join(os.path.dirname(infile), "clips")
-    os.makedirs(outputdir, exist_ok=True)
+@cli.command()
+@click.argument("pack", type=str)
+@click.argument("patterns", nargs=-1, type=str)
+@click.option("-o", "--outputdir", required=False, type=str, help="Folder to write the clips to (default: next to the pack).")
+def extract(pack, patterns, outputdir):
     """
-start_sec,end_sec,filename,path,order,prob_order,family,prob_family,group,prob_group,species,prob_species,predicted_category,prob
-30.200000000000003,32.0,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.97104126,Parulidae,0.951334,SBUF,0.9273938,,,SBUF,0.9273937940597534
-132.4,134.20000000000002,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.9721271,Parulidae,0.9554213,ZEEP,0.9575265,norwat,0.9999989,norwat,0.999998927116394
-227.4,228.8,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.96027213,Parulidae,0.9154916,ZEEP,0.88409126,,,ZEEP,0.8840912580490112
-232.4,234.0,vinalhaven-nfc-2021-08-14-2230.wav,Q:\birdrecordings\vinalhaven-nfc-2021-08\vinalhaven-nfc-2021-08-14-2230.wav,Passeriformes,0.97222793,Parulidae,0.9563978,,,bawwar,0.99999833,bawwar,0.9999983310699463
-"""
-
-    notes_format = 'scottold'
-    with open(notesfile) as f:
-        for line in f:
-            line = line.strip()
-            if line == 'start_sec,end_sec,filename,path,order,prob_order,family,prob_family,group,prob_group,species,prob_species,predicted_category,prob':
-                notes_format = 'nighthawk'
-                continue
-            if notes_format == 'nighthawk':
-                start_sec,end_sec,filename,path,order,prob_order,family,prob_family,group,prob_group,species,prob_species,predicted_category,prob = line.split(',')
-                if float(prob) < .99:
-                    continue
-                midpoint_sec = (float(start_sec) + float(end_sec)) / 2.0
-                diff = float(end_sec) - float(start_sec)
-                timestamp = timedelta(seconds=midpoint_sec)
-                description = predicted_category or 'unknown'
-                length_secs = max(3.0, diff + 2.0)
-            else:
-                if line.startswith("#"):
-                    continue
-                m = re.match(r"(\d\d)(\d\d)(\d\d[\.\d]*)[ ]+(.*)", line)
-                if m is None:
-                    print(f"skipping {line}, cannot parse.")
-                    continue
-                hours = int(m.group(1))
-                minutes = int(m.group(2))
-                seconds = float(m.group(3))
-                timestamp = timedelta(hours=hours, minutes=minutes, seconds=seconds)
-                description = re.sub("[:]", "-", m.group(4))
-                length_secs=3
-
-            write_clip(infile, outputdir, timestamp=timestamp, description=description, length_secs=length_secs)
+    Pull clips out of a clip pack as WAVs. PACK is the _clippack file or its
+    _clips.csv index; PATTERNS match clip names (e.g. "*bawwar*"), default all.
+    """
+    if is_clip_pack(pack):
+        fn_manifest = os.path.splitext(pack)[0][: -len(PACK_SUFFIX)] + "_clips.csv"
+    else:
+        fn_manifest = pack
+    if not os.path.exists(fn_manifest):
+        raise click.ClickException(f'No clip index "{fn_manifest}".')
+    outfiles = extract_clips(fn_manifest, patterns, outputdir)
+    click.echo(f"Extracted {len(outfiles)} clips.")
 
 
 @cli.command()
-@click.option("-i", "--infile", required=True, type=str, help="")
+@click.argument("paths", nargs=-1, type=str)
+@click.option(
+    "-i",
+    "--infile",
+    required=False,
+    type=str,
+    help="Single wav/flac file to render and open in the default viewer.",
+)
 @click.option("-m", "--min", required=False, type=int, help="")
 @click.option("-M", "--max", required=False, type=int, help="")
 @click.option(
@@ -276,23 +1655,220 @@ start_sec,end_sec,filename,path,order,prob_order,family,prob_family,group,prob_g
     type=float,
     help="Duration (in seconds) of clip to spectrogram.",
 )
-def spec(infile, min, max, offset, duration):
-    assert os.path.exists(infile)
-    basename, ext = os.path.splitext(infile)
-    outfile = f"{basename}-spec.png"
-    create_spectrogram(
-        infile,
-        outfile,
+@click.option(
+    "-r",
+    "--renderer",
+    type=click.Choice(["matplotlib", "fast"]),
+    default="matplotlib",
+    show_default=True,
+    help="'fast' writes the bare spectrogram image without axes; much quicker for many clips.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    required=False,
+    type=int,
+    help="Worker processes for batch rendering (default: number of cores).",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Re-render spectrograms that are newer than their clip.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="Keep spectrograms in an on-disk cache, for re-rendering the same clips with other settings.",
+)
+@click.option(
+    "--cache-dir",
+    default=DEFAULT_CACHE_DIR,
+    show_default=True,
+    help="Cache directory (also set by NFC_CACHE_DIR).",
+)
+@click.option(
+    "--cache-mb",
+    default=DEFAULT_CACHE_MB,
+    show_default=True,
+    help="Cache size; least recently used entries go first (also set by NFC_CACHE_MB).",
+)
+def spec(
+    paths, infile, min, max, offset, duration, renderer, jobs, force, cache, cache_dir, cache_mb
+):
+    """
+    Render spectrograms for PATHS (files, directories or glob patterns, e.g.
+    "clips\\*.wav") in parallel, or for a single --infile.
+    """
+    kwargs = dict(
         min_frequency=min,
         max_frequency=max,
         duration=duration,
         offset=offset,
+        renderer=renderer,
+        cache=ArrayCache(cache_dir, cache_mb * 1024 * 1024) if cache else None,
     )
-    # os.system(f'start "{outfile}"')
-    import subprocess
+    if paths:
+        infiles = expand_audio_paths(paths)
+        if not infiles:
+            raise click.ClickException(f"No audio files match {' '.join(paths)}")
+        render_spectrograms(infiles, jobs=jobs, force=force, **kwargs)
+
+    if infile:
+        assert os.path.exists(infile)
+        outfile = spectrogram_filename(infile)
+        create_spectrogram(infile, outfile, **kwargs)
+        # os.system(f'start "{outfile}"')
+        if hasattr(os, "startfile"):
+            os.startfile(outfile)
+    elif not paths:
+        raise click.UsageError("Give one or more PATHS or --infile.")
 
-    os.startfile(outfile)
-    # subprocess.run(["start", outfile], check=True)
+
+@cli.command()
+@click.option(
+    "-i", "--infile", required=True, type=str, help="wav/flac recording to sheet"
+)
+@click.option(
+    "-n",
+    "--notesfile",
+    required=False,
+    type=str,
+    help="if given, file to source detections from. otherwise, expects it to be <infile_base>.txt or <infile_base>_detections.csv",
+)
+@click.option("-m", "--min", required=False, type=int, help="")
+@click.option("-M", "--max", required=False, type=int, help="")
+@click.option("--columns", default=8, show_default=True, help="Tiles per row.")
+@click.option("--rows", default=12, show_default=True, help="Rows per sheet.")
+@click.option(
+    "-d",
+    "--tile-duration",
+    default=1.0,
+    show_default=True,
+    help="Seconds of audio in each tile, centred on the detection.",
+)
+@_threshold_options
+def sheet(infile, notesfile, min, max, columns, rows, tile_duration, min_prob, thresholds):
+    """Pack every detection in a recording into a few contact-sheet PNGs."""
+    contact_sheets(
+        infile,
+        notesfile,
+        min_prob=min_prob,
+        thresholds=thresholds,
+        columns=columns,
+        rows=rows,
+        tile_duration=tile_duration,
+        min_frequency=min,
+        max_frequency=max,
+    )
+
+
+def _catalog_query_options(command):
+    options = [
+        click.option("--db", default=catalog.DEFAULT_DB, show_default=True, help="SQLite catalog file."),
+        click.option("-l", "--label", help="Predicted category, species or group code, e.g. bawwar."),
+        click.option("-p", "--min-prob", type=float, help="Lowest predicted-category probability."),
+        click.option("--since", help="UTC date or time to start from, e.g. 2023-09-01."),
+        click.option("--until", help="UTC date or time to end at (a date includes that whole day)."),
+        click.option("-r", "--recording", help="Only recordings whose path contains this."),
+        click.option("--limit", type=int, help="Return at most this many detections."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+@cli.command()
+@click.argument("root", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "-g",
+    "--merge-gap",
+    default=0.5,
+    show_default=True,
+    help="Detections whose clips overlap or are this many seconds apart share one clip.",
+)
+@click.option(
+    "--merge/--no-merge",
+    default=True,
+    help="Merge overlapping detections (default), or write a clip for every one.",
+)
+@click.option(
+    "--max-clip",
+    "max_clip_secs",
+    default=MAX_CLIP_SECS,
+    show_default=True,
+    help="Longest a merged clip may grow, in seconds.",
+)
+@click.option(
+    "--pack/--no-pack",
+    default=False,
+    help="Write each recording's clips into one <recording>_clippack.flac.",
+)
+@click.option("-j", "--jobs", type=int, default=None, help="Processes to use (default: one per core).")
+@click.option("-f", "--force", is_flag=True, help="Redo recordings the manifest says are done.")
+@click.option("--run-log", type=str, default=None, help="Append per-recording stages to this JSON-lines run log.")
+@_threshold_options
+def archive(root, merge_gap, merge, max_clip_secs, pack, jobs, force, run_log, min_prob, thresholds):
+    """
+    Re-clip every recording with detections under ROOT in parallel, skipping
+    recordings already done with the same inputs and options.
+    """
+    if run_log:
+        runlog.start(run_log)
+    clipped, unchanged, failed = reprocess_archive(
+        root,
+        jobs=jobs,
+        force=force,
+        merge_gap=merge_gap if merge else None,
+        max_clip_secs=max_clip_secs,
+        min_prob=min_prob,
+        thresholds=thresholds,
+        pack=pack,
+    )
+    click.echo(f"Clipped {clipped} recordings, {unchanged} unchanged, {failed} failed.")
+    if failed:
+        raise click.ClickException(f"{failed} recordings failed; rerun to retry them.")
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=str)
+@click.option("--db", default=catalog.DEFAULT_DB, show_default=True, help="SQLite catalog file.")
+def index(paths, db):
+    """
+    Add the detections CSVs and notes files in PATHS (files, directories or
+    glob patterns) to the catalog; unchanged files are skipped.
+    """
+    indexed, unchanged = index_detections(paths, db)
+    click.echo(f'Indexed {indexed} detection files ({unchanged} unchanged) into "{db}".')
+
+
+@cli.command()
+@_catalog_query_options
+def query(db, label, min_prob, since, until, recording, limit):
+    """List catalogued detections matching the filters."""
+    with closing(catalog.connect(db)) as conn:
+        rows = catalog.query(conn, label, min_prob, since, until, recording, limit)
+    for row in rows:
+        prob = "" if row["prob"] is None else f"{row['prob']:.3f}"
+        click.echo(
+            f"{row['utc_start'] or '':23s}  {prob:5s}  {row['category']:8s}  "
+            f"{os.path.basename(row['recording'])} @ {row['start_sec']:.1f}s"
+        )
+    click.echo(f"{len(rows)} detections.")
+
+
+@cli.command()
+@_catalog_query_options
+@click.option("-o", "--outfile", required=True, type=str, help="CSV file to write.")
+def export(db, label, min_prob, since, until, recording, limit, outfile):
+    """Write catalogued detections matching the filters to a CSV file."""
+    with closing(catalog.connect(db)) as conn:
+        rows = catalog.query(conn, label, min_prob, since, until, recording, limit)
+    with open(outfile, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(catalog.COLUMNS)
+        writer.writerows([row[column] for column in catalog.COLUMNS] for row in rows)
+    click.echo(f'Wrote {len(rows)} detections to "{outfile}".')
 
 
 if __name__ == "__main__":
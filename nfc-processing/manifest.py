@@ -0,0 +1,24 @@
+"""
+JSON manifests that record what a long-running job has already done, so a
+rerun can skip it. A manifest is rewritten whole through a temp file and an
+atomic rename, so a crash mid-save leaves the previous one intact, and one
+that is missing or unreadable reads as empty.
+"""
+import json
+import os
+
+PARTIAL_SUFFIX = ".partial"
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path, manifest):
+    with open(path + PARTIAL_SUFFIX, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + PARTIAL_SUFFIX, path)
@@ -0,0 +1,268 @@
+"""
+Night-quality statistics from one streaming pass over a recording.
+
+For every minute: overall RMS, energy in the flight-call band and below it,
+clipping rate, spectral flatness of the call band, how often broadband
+impacts (rain drops) stand out from its noise floor, and the fraction of
+digitally silent frames. Each minute is flagged as silence, dropout, clipping,
+rain or wind by simple thresholds; runs of flagged minutes become spans and a
+recording that is mostly flagged can be skipped or run last instead of
+spending hours in the detector.
+
+    py nightstats.py scan -i night.flac
+
+The flag thresholds are rough and worth tuning to your own site and mic.
+"""
+import csv
+import os
+from collections import Counter, deque, namedtuple
+
+import click
+import numpy as np
+
+from audioreader import open_audio
+from predetect import merge_intervals
+
+MinuteStats = namedtuple(
+    "MinuteStats",
+    [
+        "start_sec",
+        "rms_db",
+        "band_db",
+        "low_db",
+        "flatness",
+        "transients",
+        "floor_rise_db",
+        "clip_rate",
+        "dropout",
+        "flags",
+    ],
+)
+
+# a sample this close to full scale counts as clipped
+CLIP_LEVEL = 0.999
+# a frame quieter than this (dBFS) is digital silence: a dropout
+DROPOUT_DB = -90.0
+
+SILENCE_RMS_DB = -70.0
+DROPOUT_FRACTION = 0.05
+CLIPPING_RATE = 1e-4
+# rain: many broadband (flat) impacts standing out from the minute's own
+# noise floor in the call band, or (heavy rain, a continuous roar) a flat
+# call band whose floor has risen well above that of the minutes before.
+# Steady hiss is flat too, but has neither.
+RAIN_FLATNESS = 0.35
+RAIN_TRANSIENT_DB = 6.0
+RAIN_TRANSIENTS = 0.05
+RAIN_BAND_DB = -60.0
+RAIN_FLOOR_RISE_DB = 10.0
+# minutes the rolling noise floor looks back over, and its percentile
+FLOOR_MINUTES = 60
+FLOOR_PERCENTILE = 10
+# wind: low-frequency rumble well above the call band
+WIND_LOW_DB = -35.0
+WIND_LOW_OVER_BAND_DB = 25.0
+
+FLAGS = ("silence", "dropout", "clipping", "rain", "wind")
+
+
+def _db(power):
+    return 10.0 * np.log10(np.maximum(power, 1e-20))
+
+
+def minute_flags(rms_db, band_db, low_db, flatness, transients, floor_rise_db, clip_rate, dropout):
+    flags = []
+    if rms_db < SILENCE_RMS_DB:
+        flags.append("silence")
+    if dropout > DROPOUT_FRACTION:
+        flags.append("dropout")
+    if clip_rate > CLIPPING_RATE:
+        flags.append("clipping")
+    if band_db > RAIN_BAND_DB and (
+        transients > RAIN_TRANSIENTS or (floor_rise_db > RAIN_FLOOR_RISE_DB and flatness > RAIN_FLATNESS)
+    ):
+        flags.append("rain")
+    if low_db > WIND_LOW_DB and low_db - band_db > WIND_LOW_OVER_BAND_DB:
+        flags.append("wind")
+    return tuple(flags)
+
+
+def night_stats(
+    infile,
+    minute_secs=60.0,
+    frame_length=1024,
+    min_frequency=2000,
+    max_frequency=10000,
+    low_frequency=500,
+):
+    """
+    MinuteStats for each `minute_secs` of `infile`, read one minute at a time.
+    Energies are dB relative to full scale; `flatness` is the mean over frames
+    of the geometric / arithmetic mean of the call-band power spectrum, and
+    `transients` the fraction of frames that are flat and RAIN_TRANSIENT_DB
+    above the minute's median call-band power. `floor_rise_db` is how far
+    that median is above the FLOOR_PERCENTILE of the previous FLOOR_MINUTES
+    minutes' medians. Spectral frames run on across minute boundaries, so
+    each minute's share of a frame is counted once.
+    """
+    stats = []
+    with open_audio(infile) as f:
+        samplerate = f.samplerate
+        block_frames = max(frame_length, int(round(minute_secs * samplerate)))
+        window = np.hanning(frame_length).astype(np.float32)
+        # power of a full-scale sine through this window, for dBFS
+        ref = (window.sum() / 2.0) ** 2
+        freqs = np.fft.rfftfreq(frame_length, 1.0 / samplerate)
+        band = (freqs >= min_frequency) & (freqs <= max_frequency)
+        low = (freqs > 0) & (freqs < low_frequency)
+
+        position = 0
+        carry = np.zeros(0, dtype=np.float32)
+        floors = deque(maxlen=FLOOR_MINUTES)
+        while True:
+            block = f.read(block_frames, dtype="float32", always_2d=True)
+            if not len(block):
+                break
+            clip_rate = float(np.mean(np.abs(block) >= CLIP_LEVEL))
+            samples = block.mean(axis=1)
+            stream = np.concatenate([carry, samples])
+            n_frames = len(stream) // frame_length
+            if len(block) < block_frames or not n_frames:
+                # the last minute: pad its remainder out to a whole frame
+                n_frames += len(stream) % frame_length > 0
+                carry = np.zeros(0, dtype=np.float32)
+            else:
+                carry = stream[n_frames * frame_length :]
+            frames = np.zeros((n_frames, frame_length), dtype=np.float32)
+            usable = stream[: n_frames * frame_length]
+            frames.reshape(-1)[: len(usable)] = usable
+
+            frame_power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+            power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 / ref
+            band_power = power[:, band]
+            flatness = np.exp(np.mean(np.log(band_power + 1e-20), axis=1)) / (
+                np.mean(band_power, axis=1) + 1e-20
+            )
+            frame_band_db = _db(band_power.sum(axis=1))
+            floor_db = float(np.median(frame_band_db))
+            transients = float(
+                np.mean((frame_band_db - floor_db > RAIN_TRANSIENT_DB) & (flatness > RAIN_FLATNESS))
+            )
+            floor_rise_db = floor_db - float(np.percentile(floors, FLOOR_PERCENTILE)) if floors else 0.0
+            floors.append(floor_db)
+
+            rms_db = float(_db(np.mean(np.square(samples, dtype=np.float64)) * 2.0))
+            band_db = float(_db(band_power.sum(axis=1).mean()))
+            low_db = float(_db(power[:, low].sum(axis=1).mean()))
+            dropout = float(np.mean(_db(frame_power * 2.0) < DROPOUT_DB))
+            flat = float(np.mean(flatness))
+            stats.append(
+                MinuteStats(
+                    position / samplerate,
+                    rms_db,
+                    band_db,
+                    low_db,
+                    flat,
+                    transients,
+                    floor_rise_db,
+                    clip_rate,
+                    dropout,
+                    minute_flags(rms_db, band_db, low_db, flat, transients, floor_rise_db, clip_rate, dropout),
+                )
+            )
+            position += len(block)
+    return stats
+
+
+def flagged_spans(stats, minute_secs=60.0):
+    """{flag: [(start_sec, end_sec), ...]} of consecutive minutes with that flag."""
+    return {
+        flag: merge_intervals(
+            (m.start_sec, m.start_sec + minute_secs) for m in stats if flag in m.flags
+        )
+        for flag in FLAGS
+    }
+
+
+def bad_fraction(stats):
+    """Fraction of minutes with any flag."""
+    return sum(1 for m in stats if m.flags) / len(stats) if stats else 1.0
+
+
+def night_summary(stats):
+    """Counter of minutes per flag, plus the total under "minutes"."""
+    summary = Counter(flag for m in stats for flag in m.flags)
+    summary["minutes"] = len(stats)
+    return summary
+
+
+def stats_filename(infile):
+    return f"{os.path.splitext(infile)[0]}_quality.csv"
+
+
+def write_stats(stats, fn):
+    with open(fn, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(MinuteStats._fields)
+        for m in stats:
+            writer.writerow(
+                [
+                    f"{m.start_sec:.0f}",
+                    f"{m.rms_db:.1f}",
+                    f"{m.band_db:.1f}",
+                    f"{m.low_db:.1f}",
+                    f"{m.flatness:.3f}",
+                    f"{m.transients:.3f}",
+                    f"{m.floor_rise_db:.1f}",
+                    f"{m.clip_rate:.2e}",
+                    f"{m.dropout:.3f}",
+                    " ".join(m.flags),
+                ]
+            )
+
+
+def read_stats(fn):
+    with open(fn, newline="") as f:
+        return [
+            MinuteStats(
+                *(float(row.get(name) or 0.0) for name in MinuteStats._fields[:-1]),
+                tuple(row["flags"].split()),
+            )
+            for row in csv.DictReader(f)
+        ]
+
+
+def format_spans(spans):
+    def hms(secs):
+        return f"{int(secs // 3600)}:{int(secs % 3600 // 60):02d}"
+
+    return ", ".join(f"{hms(start)}-{hms(end)}" for start, end in spans)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="wav/flac recording to analyze")
+@click.option("-m", "--min", "min_frequency", default=2000, show_default=True, help="Call band low edge (Hz).")
+@click.option("-M", "--max", "max_frequency", default=10000, show_default=True, help="Call band high edge (Hz).")
+def scan(infile, min_frequency, max_frequency):
+    """Write per-minute stats to <infile_base>_quality.csv and summarize the night."""
+    assert os.path.exists(infile)
+    stats = night_stats(infile, min_frequency=min_frequency, max_frequency=max_frequency)
+    fn = stats_filename(infile)
+    write_stats(stats, fn)
+    summary = night_summary(stats)
+    click.echo(
+        f'Wrote {summary["minutes"]} minutes to "{fn}"; '
+        f"{100.0 * bad_fraction(stats):.0f}% flagged."
+    )
+    for flag, spans in flagged_spans(stats).items():
+        if spans:
+            click.echo(f"  {flag} ({summary[flag]} min): {format_spans(spans)}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,271 @@
+"""
+Cheap band-energy pre-detector to run ahead of nighthawk.
+
+A night's recording is streamed in blocks; each short frame's energy in the
+flight-call band (2-10 kHz by default) is compared against a rolling noise
+floor (a low percentile of the last minute of frames). Frames that stand out
+become padded candidate intervals. The candidates can be written as a compact
+WAV of just those regions plus a time map, so the detector sees a few percent
+of the night, and its detections CSV can be mapped back to the original
+recording's timestamps afterwards.
+
+    py predetect.py scan -i night.wav --compact
+    nighthawk --audacity-output night-candidates.wav
+    py predetect.py remap -i night.wav
+"""
+import csv
+import os
+from collections import deque, namedtuple
+
+import click
+import numpy as np
+import soundfile as sf
+
+from audioreader import native_dtype, open_audio
+
+# (start in compact file, start in original recording, length), all in seconds
+TimeMapEntry = namedtuple("TimeMapEntry", ["compact_start", "original_start", "duration"])
+
+# silence between regions in the compact file, so splices don't look like calls
+SEGMENT_GAP_SECS = 0.5
+
+
+def band_energy_db(frames, samplerate, min_frequency, max_frequency):
+    """Energy (dB) of each row of `frames` between min and max frequency."""
+    n_fft = frames.shape[1]
+    window = np.hanning(n_fft).astype(np.float32)
+    power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / samplerate)
+    band = (freqs >= min_frequency) & (freqs <= max_frequency)
+    return 10.0 * np.log10(power[:, band].sum(axis=1) + 1e-12)
+
+
+def merge_intervals(intervals, min_gap=0.0):
+    """Merge sorted (start, end) intervals that overlap or are within `min_gap`."""
+    merged = []
+    for start, end in intervals:
+        if merged and start - merged[-1][1] <= min_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def find_candidates(
+    infile,
+    min_frequency=2000,
+    max_frequency=10000,
+    frame_length=512,
+    block_secs=10.0,
+    floor_secs=60.0,
+    floor_percentile=20,
+    threshold_db=8.0,
+    pad_secs=1.0,
+    min_gap_secs=0.5,
+):
+    """
+    Return merged (start_sec, end_sec) candidate intervals in `infile`.
+
+    Memory is bounded by one block plus `floor_secs` of frame energies.
+    """
+    with open_audio(infile) as f:
+        samplerate = f.samplerate
+        total_secs = f.frames / samplerate
+        frame_secs = frame_length / samplerate
+        block_frames = max(1, int(block_secs * samplerate) // frame_length) * frame_length
+        history = deque(maxlen=max(1, int(floor_secs / frame_secs)))
+
+        hits = []
+        position = 0
+        carry = np.zeros(0, dtype=np.float32)
+        while True:
+            block = f.read(block_frames, dtype="float32", always_2d=True)
+            if not len(block):
+                break
+            block = np.concatenate([carry, block.mean(axis=1)])
+            n_frames = len(block) // frame_length
+            carry = block[n_frames * frame_length :]
+            if not n_frames:
+                continue
+
+            energy = band_energy_db(
+                block[: n_frames * frame_length].reshape(n_frames, frame_length),
+                samplerate,
+                min_frequency,
+                max_frequency,
+            )
+            history.extend(energy)
+            floor = np.percentile(np.fromiter(history, dtype=np.float64), floor_percentile)
+            for i in np.flatnonzero(energy - floor > threshold_db):
+                hits.append((position + i) * frame_secs)
+            position += n_frames
+
+    intervals = (
+        (max(0.0, t - pad_secs), min(total_secs, t + frame_secs + pad_secs)) for t in hits
+    )
+    return merge_intervals(intervals, min_gap=min_gap_secs)
+
+
+def write_candidate_audio(infile, intervals, outfile, gap_secs=SEGMENT_GAP_SECS):
+    """
+    Concatenate the candidate `intervals` of `infile` into `outfile`, separated
+    by `gap_secs` of silence, keeping the source subtype. Returns the time map.
+    """
+    timemap = []
+    with open_audio(infile) as f, sf.SoundFile(
+        outfile, "w", f.samplerate, channels=f.channels, subtype=f.subtype
+    ) as out:
+        dtype = native_dtype(f.subtype)
+        gap = np.zeros((int(round(gap_secs * f.samplerate)), f.channels), dtype=dtype)
+        compact_frames = 0
+        for start, end in intervals:
+            start_frame = int(round(start * f.samplerate))
+            f.seek(start_frame)
+            data = f.read(int(round((end - start) * f.samplerate)), dtype=dtype, always_2d=True)
+            if compact_frames:
+                out.write(gap)
+                compact_frames += len(gap)
+            out.write(data)
+            timemap.append(
+                TimeMapEntry(
+                    compact_frames / f.samplerate,
+                    start_frame / f.samplerate,
+                    len(data) / f.samplerate,
+                )
+            )
+            compact_frames += len(data)
+    return timemap
+
+
+def write_timemap(timemap, fn):
+    with open(fn, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TimeMapEntry._fields)
+        writer.writerows(timemap)
+
+
+def read_timemap(fn):
+    with open(fn, newline="") as f:
+        return [TimeMapEntry(*map(float, row)) for row in list(csv.reader(f))[1:]]
+
+
+def timemap_entry(t, timemap):
+    """The time map entry of the region holding compact time `t`."""
+    starts = [entry.compact_start for entry in timemap]
+    return timemap[max(0, int(np.searchsorted(starts, t, side="right")) - 1)]
+
+
+def to_original_time(t, timemap, entry=None):
+    """
+    Map a time in the compact file back to the original recording, clamped to
+    its region (or to `entry`'s, when given).
+    """
+    if entry is None:
+        entry = timemap_entry(t, timemap)
+    return entry.original_start + min(max(0.0, t - entry.compact_start), entry.duration)
+
+
+def remap_detections(compact_csv, timemap, outfile, original_path):
+    """
+    Rewrite a nighthawk detections CSV produced on the compact file so its
+    start/end times, filename and path refer to the original recording.
+    """
+    with open(compact_csv, newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+
+    for row in rows:
+        # map both ends through the start's region: a detection running
+        # across a splice would otherwise end in another part of the night
+        start = float(row["start_sec"])
+        entry = timemap_entry(start, timemap)
+        row["start_sec"] = to_original_time(start, timemap, entry)
+        row["end_sec"] = to_original_time(float(row["end_sec"]), timemap, entry)
+        if "filename" in row:
+            row["filename"] = os.path.basename(original_path)
+        if "path" in row:
+            row["path"] = os.path.abspath(original_path)
+
+    with open(outfile, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+def candidate_filenames(infile):
+    """(compact audio, time map, compact detections CSV) paths for `infile`."""
+    basename = os.path.splitext(infile)[0]
+    compact = f"{basename}-candidates.wav"
+    return compact, f"{basename}-candidates.timemap.csv", f"{basename}-candidates_detections.csv"
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="wav/flac recording to scan")
+@click.option(
+    "-m", "--min", "min_frequency", default=2000, show_default=True, help="Band low edge (Hz)."
+)
+@click.option(
+    "-M", "--max", "max_frequency", default=10000, show_default=True, help="Band high edge (Hz)."
+)
+@click.option(
+    "-t",
+    "--threshold",
+    default=8.0,
+    show_default=True,
+    help="dB above the rolling noise floor that makes a candidate.",
+)
+@click.option("--pad", default=1.0, show_default=True, help="Seconds kept around each candidate.")
+@click.option(
+    "--compact/--no-compact",
+    default=False,
+    help="Also write <infile_base>-candidates.wav and its time map.",
+)
+def scan(infile, min_frequency, max_frequency, threshold, pad, compact):
+    """Write candidate intervals to <infile_base>_candidates.csv."""
+    assert os.path.exists(infile)
+    intervals = find_candidates(
+        infile,
+        min_frequency=min_frequency,
+        max_frequency=max_frequency,
+        threshold_db=threshold,
+        pad_secs=pad,
+    )
+    total_secs = sf.info(infile).duration
+    kept_secs = sum(end - start for start, end in intervals)
+    click.echo(
+        f"{len(intervals)} candidate regions, {kept_secs:.0f}s of {total_secs:.0f}s "
+        f"({100.0 * kept_secs / max(total_secs, 1e-9):.1f}%)."
+    )
+
+    with open(f"{os.path.splitext(infile)[0]}_candidates.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_sec", "end_sec"])
+        writer.writerows(intervals)
+
+    if compact:
+        fn_compact, fn_timemap, _ = candidate_filenames(infile)
+        timemap = write_candidate_audio(infile, intervals, fn_compact)
+        write_timemap(timemap, fn_timemap)
+        click.echo(f'Wrote candidate audio to "{fn_compact}".')
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="original wav/flac recording")
+def remap(infile):
+    """Map <infile_base>-candidates_detections.csv back onto <infile_base>_detections.csv."""
+    fn_compact, fn_timemap, fn_compact_csv = candidate_filenames(infile)
+    assert os.path.exists(fn_compact_csv), fn_compact_csv
+    outfile = f"{os.path.splitext(infile)[0]}_detections.csv"
+    n = remap_detections(fn_compact_csv, read_timemap(fn_timemap), outfile, infile)
+    click.echo(f'Wrote {n} remapped detections to "{outfile}".')
+
+
+if __name__ == "__main__":
+    cli()
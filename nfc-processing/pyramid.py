@@ -0,0 +1,272 @@
+"""
+Whole-night spectrogram pyramid.
+
+`build` streams a recording once, computes a log-magnitude spectrogram block
+by block and stores it as uint8 (time x frequency) in a memory-mapped file.
+Each further zoom level max-pools the one below it by ZOOM_FACTOR in time, so
+short calls stay visible however far out you zoom. Any time range can then be
+rendered from the coarsest level that still has enough columns, without
+touching the audio again:
+
+    py pyramid.py build -i night.flac
+    py pyramid.py view -i night.flac --start 1:30:00 --end 1:45:00
+    py pyramid.py view -i night.flac -w 4000 -o whole-night.png
+"""
+import json
+import os
+import shutil
+
+import click
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audioreader import open_audio
+
+PYRAMID_VERSION = 1
+ZOOM_FACTOR = 4
+# stop adding levels once one is this narrow
+MIN_LEVEL_FRAMES = 1024
+
+
+def pyramid_dirname(infile):
+    return f"{os.path.splitext(infile)[0]}.pyramid"
+
+
+def level_filename(directory, level):
+    return os.path.join(directory, f"level{level}.u8")
+
+
+def _source_stamp(infile):
+    """Size and mtime of `infile`, or None once it has been deleted."""
+    try:
+        stat = os.stat(infile)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_meta(directory):
+    with open(os.path.join(directory, "meta.json")) as f:
+        return json.load(f)
+
+
+def is_current(infile, directory=None):
+    """
+    Whether the pyramid was built from `infile` as it is now. Once `infile`
+    is gone (the recorder deletes its WAVs) the pyramid is all that is left
+    of it, and it is served as built.
+    """
+    directory = directory or pyramid_dirname(infile)
+    try:
+        meta = load_meta(directory)
+    except (OSError, ValueError):
+        return False
+    stamp = _source_stamp(infile)
+    return meta.get("version") == PYRAMID_VERSION and (stamp is None or meta.get("source") == stamp)
+
+
+def _to_levels(magnitude, ref, db_min, db_max):
+    db = 20.0 * np.log10(np.maximum(magnitude, 1e-10) / ref)
+    scaled = (db - db_min) * (255.0 / (db_max - db_min))
+    return np.clip(scaled, 0, 255).astype(np.uint8)
+
+
+def build_pyramid(
+    infile,
+    directory=None,
+    n_fft=256,
+    hop_length=256,
+    db_min=-100.0,
+    db_max=0.0,
+    block_frames=4096,
+):
+    """
+    Stream `infile` once into `<infile_base>.pyramid/`: level0.u8 holds one
+    row of 1 + n_fft // 2 dB levels (db_min..db_max mapped onto 0..255, 0 dB
+    being a full-scale sine) per hop, and each levelN.u8 above it is max-pooled
+    by ZOOM_FACTOR in time. Returns the metadata written to meta.json.
+    """
+    directory = directory or pyramid_dirname(infile)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    window = np.blackman(n_fft).astype(np.float32)
+    ref = window.sum() / 2.0
+    n_bins = 1 + n_fft // 2
+
+    with open_audio(infile) as f:
+        samplerate = f.samplerate
+        n_frames = max(0, 1 + (f.frames - n_fft) // hop_length)
+        out = np.memmap(
+            level_filename(directory, 0), dtype=np.uint8, mode="w+", shape=(max(n_frames, 1), n_bins)
+        )
+
+        # each block yields block_frames spectrogram frames; keep the overlap
+        # of the last frame's window for the next block
+        overlap = n_fft - hop_length
+        carry = np.zeros(0, dtype=np.float32)
+        row = 0
+        while row < n_frames:
+            want = block_frames * hop_length + overlap - len(carry)
+            block = f.read(max(want, 0), dtype="float32", always_2d=True)
+            samples = np.concatenate([carry, block.mean(axis=1)]) if len(block) else carry
+            usable = (len(samples) - n_fft) // hop_length + 1 if len(samples) >= n_fft else 0
+            usable = min(usable, n_frames - row)
+            if usable <= 0:
+                break
+            frames = sliding_window_view(samples, n_fft)[::hop_length][:usable]
+            magnitude = np.abs(np.fft.rfft(frames * window, axis=1))
+            out[row : row + usable] = _to_levels(magnitude, ref, db_min, db_max)
+            row += usable
+            carry = samples[usable * hop_length :]
+        out.flush()
+
+    levels = [row]
+    source = out
+    while levels[-1] > MIN_LEVEL_FRAMES:
+        rows = -(-levels[-1] // ZOOM_FACTOR)
+        level = len(levels)
+        dest = np.memmap(level_filename(directory, level), dtype=np.uint8, mode="w+", shape=(rows, n_bins))
+        chunk = 65536 * ZOOM_FACTOR
+        for start in range(0, levels[-1], chunk):
+            part = np.asarray(source[start : min(start + chunk, levels[-1])])
+            pad = -len(part) % ZOOM_FACTOR
+            if pad:
+                part = np.concatenate([part, np.zeros((pad, n_bins), dtype=np.uint8)])
+            dest[start // ZOOM_FACTOR : start // ZOOM_FACTOR + len(part) // ZOOM_FACTOR] = part.reshape(
+                -1, ZOOM_FACTOR, n_bins
+            ).max(axis=1)
+        dest.flush()
+        levels.append(rows)
+        source = dest
+
+    meta = {
+        "version": PYRAMID_VERSION,
+        "source": _source_stamp(infile),
+        "samplerate": samplerate,
+        "n_fft": n_fft,
+        "hop_length": hop_length,
+        "db_min": db_min,
+        "db_max": db_max,
+        "n_bins": n_bins,
+        "zoom_factor": ZOOM_FACTOR,
+        "levels": levels,
+    }
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=1)
+    return meta
+
+
+def open_level(directory, meta, level):
+    rows = meta["levels"][level]
+    return np.memmap(
+        level_filename(directory, level), dtype=np.uint8, mode="r", shape=(max(rows, 1), meta["n_bins"])
+    )[:rows]
+
+
+def read_range(directory, start_sec=0.0, end_sec=None, width=2000, min_frequency=None, max_frequency=None):
+    """
+    A (frequency x time) uint8 image of [start_sec, end_sec) about `width`
+    columns wide, low frequencies at the bottom, read from the coarsest
+    level that still has at least `width` frames in the range. Each column is
+    the maximum over the frames it covers.
+    """
+    meta = load_meta(directory)
+    secs_per_frame = meta["hop_length"] / meta["samplerate"]
+    total_secs = meta["levels"][0] * secs_per_frame
+    end_sec = total_secs if end_sec is None else min(end_sec, total_secs)
+    start_sec = max(0.0, start_sec)
+    if end_sec <= start_sec:
+        raise ValueError(f"empty time range {start_sec}-{end_sec}s")
+
+    level = 0
+    while (
+        level + 1 < len(meta["levels"])
+        and (end_sec - start_sec) / (secs_per_frame * meta["zoom_factor"] ** (level + 1)) >= width
+    ):
+        level += 1
+    scale = secs_per_frame * meta["zoom_factor"] ** level
+    data = open_level(directory, meta, level)
+    first = int(start_sec / scale)
+    last = max(first + 1, min(len(data), int(np.ceil(end_sec / scale))))
+    frames = np.asarray(data[first:last])
+
+    if len(frames) > width:
+        edges = np.linspace(0, len(frames), width + 1).astype(int)[:-1]
+        frames = np.maximum.reduceat(frames, edges, axis=0)
+
+    hz_per_bin = meta["samplerate"] / meta["n_fft"]
+    lo = 0 if min_frequency is None else max(0, int(np.floor(min_frequency / hz_per_bin)))
+    hi = meta["n_bins"] if max_frequency is None else int(np.ceil(max_frequency / hz_per_bin)) + 1
+    return frames[:, lo:hi].T[::-1]
+
+
+def write_range_png(image, fn_png, cmap="gray_r", min_height=300):
+    import matplotlib.pyplot as plt
+
+    row_repeat = max(1, -(-min_height // len(image)))
+    if row_repeat > 1:
+        image = np.repeat(image, row_repeat, axis=0)
+    plt.imsave(fn_png, image, cmap=cmap, vmin=0, vmax=255)
+
+
+def parse_time(value):
+    """Seconds from "5400", "90:00" or "1:30:00"."""
+    secs = 0.0
+    for part in str(value).split(":"):
+        secs = secs * 60 + float(part)
+    return secs
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="wav/flac recording")
+@click.option("--n-fft", default=256, show_default=True, help="FFT size of the finest level.")
+@click.option("--hop", default=256, show_default=True, help="Samples between frames of the finest level.")
+@click.option("-f", "--force", is_flag=True, help="Rebuild even if the pyramid is up to date.")
+def build(infile, n_fft, hop, force):
+    """Write <infile_base>.pyramid/ for a whole recording."""
+    assert os.path.exists(infile)
+    directory = pyramid_dirname(infile)
+    if not force and is_current(infile, directory):
+        click.echo(f'"{directory}" is up to date.')
+        return
+    meta = build_pyramid(infile, directory, n_fft=n_fft, hop_length=hop)
+    size = sum(meta["levels"]) * meta["n_bins"]
+    click.echo(
+        f'Wrote {len(meta["levels"])} levels ({size / 1e6:.0f} MB) to "{directory}".'
+    )
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="recording with a pyramid built")
+@click.option("-s", "--start", default="0", help="Start time, in seconds or [H:]MM:SS.")
+@click.option("-e", "--end", default=None, help="End time (default: end of the recording).")
+@click.option("-w", "--width", default=2000, show_default=True, help="Image width in pixels.")
+@click.option("-m", "--min", "min_frequency", required=False, type=int, help="")
+@click.option("-M", "--max", "max_frequency", required=False, type=int, help="")
+@click.option("-o", "--outfile", required=False, type=str, help="PNG to write (default: next to the recording).")
+def view(infile, start, end, width, min_frequency, max_frequency, outfile):
+    """Render a time range of a recording from its pyramid."""
+    directory = pyramid_dirname(infile)
+    if not is_current(infile, directory):
+        raise click.ClickException(f'No up-to-date pyramid for "{infile}"; run build first.')
+    start_sec = parse_time(start)
+    end_sec = None if end is None else parse_time(end)
+    image = read_range(directory, start_sec, end_sec, width, min_frequency, max_frequency)
+    if outfile is None:
+        end_label = "end" if end_sec is None else f"{end_sec:.0f}"
+        outfile = f"{os.path.splitext(infile)[0]}-{start_sec:.0f}-{end_label}.png"
+    write_range_png(image, outfile)
+    click.echo(f'Wrote spectrogram to "{outfile}".')
+    if hasattr(os, "startfile"):
+        os.startfile(outfile)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,343 @@
+"""
+Structured run log: one JSON object per line for every stage of a night.
+
+A stage records its wall and CPU time, bytes read and written, whether it
+failed, and any counts the code inside it reports (detections parsed, kept,
+clipped, ...). Logging is on once `start` has named a log file; the path is
+kept in the environment so worker processes and scripts run as subprocesses
+append to the same file. Without it, stages cost a few clock reads and write
+nothing.
+
+    runlog.start("2023-09-10/run-log.jsonl")
+    with runlog.stage("clip", file=infile):
+        ...
+        runlog.count(clipped=len(clips))
+
+    py runlog.py summary D:\\birdrecordings --group-by stage
+
+CPU time is the calling thread's own. Subprocesses started through
+`run_process` or `wait` have their own CPU time measured as they are reaped
+and logged as the stage's child CPU, which is also added to the stage around
+it in the same thread. Bytes are per thread on Linux and per process elsewhere (with
+psutil installed), so stages running side by side share the latter.
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+import click
+
+LOG_ENV = "NFC_RUN_LOG"
+RUN_ENV = "NFC_RUN_ID"
+LOG_NAME = "run-log.jsonl"
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def start(path, run_id=None):
+    """Log to `path` from now on, here and in any process started later."""
+    os.environ[LOG_ENV] = os.path.abspath(path)
+    os.environ[RUN_ENV] = run_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+    log_event("run-start", argv=sys.argv)
+
+
+def enabled():
+    return bool(os.environ.get(LOG_ENV))
+
+
+def log_event(event, **fields):
+    if not enabled():
+        return
+    record = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "run": os.environ.get(RUN_ENV),
+        "event": event,
+        "pid": os.getpid(),
+    }
+    record.update(fields)
+    line = json.dumps(record, default=str) + "\n"
+    with _lock, open(os.environ[LOG_ENV], "a") as f:
+        f.write(line)
+
+
+def io_counters():
+    """
+    (bytes read, bytes written) so far by this thread or process, or
+    (None, None). On Linux these are rchar/wchar: bytes passed through
+    read()/write() calls, cached or not. Pages of a memory-mapped file are
+    not counted.
+    """
+    for path in ("/proc/thread-self/io", "/proc/self/io"):
+        try:
+            with open(path) as f:
+                counters = dict(line.split(": ") for line in f.read().splitlines())
+            return int(counters["rchar"]), int(counters["wchar"])
+        except (OSError, KeyError, ValueError):
+            continue
+    try:
+        import psutil
+
+        counters = psutil.Process().io_counters()
+        return counters.read_bytes, counters.write_bytes
+    except (ImportError, AttributeError):
+        return None, None
+
+
+def _process_cpu(pid):
+    """CPU seconds of a process that has exited but not been released, or None."""
+    try:
+        import psutil
+
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+    except Exception:
+        return None
+
+
+def wait(process, record=None, timeout=None):
+    """
+    Wait up to `timeout` seconds (None: until it exits) for a Popen process
+    and return its return code, or None if it is still running. Its CPU
+    seconds (and those of its own children) are added to
+    record["child_cpu_secs"], measured from that process alone, so stages
+    running side by side don't pick up each other's subprocesses.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if hasattr(os, "wait4"):
+        while True:
+            pid, status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+            if pid:
+                break
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cpu_secs = usage.ru_utime + usage.ru_stime
+    else:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+        # Popen still holds the process handle, so its times can be read after exit
+        cpu_secs = _process_cpu(process.pid)
+    if record is not None and cpu_secs is not None:
+        record["child_cpu_secs"] = round(record.get("child_cpu_secs", 0.0) + cpu_secs, 4)
+    return process.returncode
+
+
+def run_process(cmd, record=None):
+    """subprocess.run(cmd).returncode, with its CPU time added to `record` as by `wait`."""
+    return wait(subprocess.Popen(cmd), record)
+
+
+def _delta(after, before):
+    return None if after is None or before is None else after - before
+
+
+def count(**counts):
+    """Add to the counts of the innermost stage running in this thread."""
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return
+    record = stack[-1]
+    for name, value in counts.items():
+        record[name] = record.get(name, 0) + value
+
+
+@contextmanager
+def stage(name, file=None, **fields):
+    """
+    Log a "stage" event for the body of the with statement. `fields` and any
+    `count()`s made inside are logged with it; the yielded dict can also be
+    updated directly.
+    """
+    record = dict(fields)
+    if not enabled():
+        yield record
+        return
+
+    stack = _local.__dict__.setdefault("stack", [])
+    parent = stack[-1]["_stage"] if stack else None
+    record["_stage"] = name
+    stack.append(record)
+    read_before, written_before = io_counters()
+    cpu_before = time.thread_time()
+    wall_before = time.perf_counter()
+    error = None
+    try:
+        yield record
+    except BaseException as exc:
+        error = repr(exc)
+        raise
+    finally:
+        wall_secs = time.perf_counter() - wall_before
+        cpu_secs = time.thread_time() - cpu_before
+        read_after, written_after = io_counters()
+        stack.pop()
+        del record["_stage"]
+        if stack and "child_cpu_secs" in record:
+            stack[-1]["child_cpu_secs"] = round(stack[-1].get("child_cpu_secs", 0.0) + record["child_cpu_secs"], 4)
+        log_event(
+            "stage",
+            stage=name,
+            file=file,
+            parent=parent,
+            ok=error is None,
+            error=error,
+            wall_secs=round(wall_secs, 4),
+            cpu_secs=round(cpu_secs, 4),
+            read_bytes=_delta(read_after, read_before),
+            written_bytes=_delta(written_after, written_before),
+            **record,
+        )
+
+
+def staged(name, func, file=None):
+    """`func` wrapped to run as a stage, e.g. for a scheduler Job."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(name, file=file):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def find_logs(paths):
+    """Run logs at or under `paths`."""
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            logs += glob.glob(os.path.join(glob.escape(path), "**", LOG_NAME), recursive=True)
+        else:
+            logs += glob.glob(path)
+    return sorted(set(logs))
+
+
+def read_events(fn):
+    events = []
+    with open(fn) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue  # a line cut short by a crash
+    return events
+
+
+STAGE_FIELDS = {
+    "event",
+    "time",
+    "run",
+    "pid",
+    "stage",
+    "file",
+    "parent",
+    "ok",
+    "error",
+    "wall_secs",
+    "cpu_secs",
+    "child_cpu_secs",
+    "read_bytes",
+    "written_bytes",
+    "command",
+    "returncode",
+}
+
+
+TOTAL_FIELDS = (
+    "calls",
+    "failed",
+    "wall_secs",
+    "max_wall_secs",
+    "cpu_secs",
+    "child_cpu_secs",
+    "read_bytes",
+    "written_bytes",
+)
+
+
+def summarize(events, group_by="stage"):
+    """
+    Totals over the "stage" events, keyed by stage name (and command, for
+    subprocesses), run, or stage and file: calls, failures (exceptions and
+    non-zero return codes), wall, CPU and child CPU seconds, max wall, bytes
+    read and written, and the sum of every count logged. Per run, only
+    outermost stages are added up, so nested ones aren't counted twice.
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    for event in events:
+        if event.get("event") != "stage":
+            continue
+        if group_by == "run":
+            if event.get("parent") is not None:
+                continue
+            key = event.get("run")
+        elif group_by == "file":
+            key = f"{event['stage']} {os.path.basename(event.get('file') or '')}".strip()
+        else:
+            key = f"{event['stage']} {event.get('command') or ''}".strip()
+        total = totals[key]
+        total["calls"] += 1
+        total["failed"] += not event.get("ok", True) or event.get("returncode") not in (None, 0)
+        total["max_wall_secs"] = max(total["max_wall_secs"], event.get("wall_secs") or 0.0)
+        for name in ("wall_secs", "cpu_secs", "child_cpu_secs", "read_bytes", "written_bytes"):
+            total[name] += event.get(name) or 0
+        for name, value in event.items():
+            if name not in STAGE_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[name] += value
+    return totals
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("paths", nargs=-1, required=True, type=str)
+@click.option(
+    "-g",
+    "--group-by",
+    type=click.Choice(["stage", "run", "file"]),
+    default="stage",
+    show_default=True,
+    help="Total per stage, per night, or per stage and file.",
+)
+@click.option("--top", default=None, type=int, help="Only show the groups with the most wall time.")
+def summary(paths, group_by, top):
+    """Where the time went, across the run logs at or under PATHS."""
+    logs = find_logs(paths)
+    if not logs:
+        raise click.ClickException(f"No {LOG_NAME} found.")
+    events = [event for fn in logs for event in read_events(fn)]
+    runs = {event.get("run") for event in events}
+    totals = summarize(events, group_by)
+    click.echo(f"{len(logs)} logs, {len(runs)} runs, {len(events)} events.")
+    click.echo(
+        f"{group_by:40s} {'calls':>6s} {'fail':>5s} {'wall':>9s} {'max':>8s} {'cpu':>9s} "
+        f"{'child':>9s} {'read':>8s} {'written':>8s}  counts"
+    )
+    ordered = sorted(totals.items(), key=lambda item: -item[1]["wall_secs"])
+    for key, total in ordered[:top]:
+        counts = ", ".join(
+            f"{name} {value:.0f}" for name, value in total.items() if name not in TOTAL_FIELDS
+        )
+        click.echo(
+            f"{str(key)[:40]:40s} {total['calls']:6.0f} {total['failed']:5.0f} {total['wall_secs']:8.1f}s "
+            f"{total['max_wall_secs']:7.1f}s {total['cpu_secs']:8.1f}s {total['child_cpu_secs']:8.1f}s "
+            f"{total['read_bytes'] / 1e6:6.0f}MB {total['written_bytes'] / 1e6:6.0f}MB  {counts}"
+        )
+
+
+if __name__ == "__main__":
+    cli()
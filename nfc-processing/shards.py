@@ -0,0 +1,247 @@
+"""
+Run the detector on a long recording as overlapping time shards in parallel.
+
+nighthawk works on one file with one core for most of its run, so a
+multi-hour recording is cut into shards of `shard_secs` plus `overlap_secs`
+on either side, each written as a WAV in the source's sample format (a plain
+sample copy for WAV recordings), and up to `jobs` detector processes run at
+once. Each shard's `_detections.csv` is shifted back onto the recording's
+timeline; a detection is kept by the shard whose core span holds its middle,
+and a call that two shards both saw across a boundary is kept once. The
+result is the `<infile_base>_detections.csv` a single whole-file run writes.
+
+    py shards.py run -i night.flac -j 8
+    py shards.py run -i night.flac --detector "py stub_detector.py"
+
+The detector command is given the shard file as its last argument and must
+write `<shard_base>_detections.csv` next to it, as nighthawk
+`--audacity-output` does.
+"""
+import csv
+import os
+import shlex
+import shutil
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import soundfile as sf
+
+import runlog
+from audioreader import native_dtype, open_audio
+
+DEFAULT_DETECTOR = "nighthawk --audacity-output"
+DEFAULT_SHARD_SECS = 15 * 60
+DEFAULT_OVERLAP_SECS = 5.0
+COPY_BLOCK_FRAMES = 1 << 20
+
+# frames of the recording: [start, end) is written out, [core_start, core_end) is owned
+Shard = namedtuple("Shard", ["index", "start", "end", "core_start", "core_end"])
+
+
+def plan_shards(frames, samplerate, shard_secs=DEFAULT_SHARD_SECS, overlap_secs=DEFAULT_OVERLAP_SECS):
+    """Shards covering `frames`: cores of `shard_secs` padded by `overlap_secs` each side."""
+    core = max(1, int(round(shard_secs * samplerate)))
+    overlap = int(round(overlap_secs * samplerate))
+    shards = []
+    for core_start in range(0, frames, core):
+        core_end = min(frames, core_start + core)
+        # a short tail is folded into the shard before it
+        if shards and core_end - core_start < overlap:
+            last = shards.pop()
+            core_start = last.core_start
+        shards.append(
+            Shard(
+                len(shards),
+                max(0, core_start - overlap),
+                min(frames, core_end + overlap),
+                core_start,
+                core_end,
+            )
+        )
+    return shards
+
+
+def shard_dirname(infile):
+    return f"{os.path.splitext(infile)[0]}.shards"
+
+
+def shard_filename(directory, infile, shard):
+    basename = os.path.splitext(os.path.basename(infile))[0]
+    return os.path.join(directory, f"{basename}-shard{shard.index:03d}.wav")
+
+
+def write_shard(infile, shard, outfile):
+    """Copy the shard's frames of `infile` to a WAV, keeping the sample format."""
+    with open_audio(infile) as f, sf.SoundFile(
+        outfile, "w", f.samplerate, channels=f.channels, subtype=f.subtype, format="WAV"
+    ) as out:
+        dtype = native_dtype(f.subtype)
+        f.seek(shard.start)
+        remaining = shard.end - shard.start
+        while remaining > 0:
+            data = f.read(min(remaining, COPY_BLOCK_FRAMES), dtype=dtype, always_2d=True)
+            if not len(data):
+                break
+            out.write(data)
+            remaining -= len(data)
+
+
+def read_shard_detections(fn_csv):
+    with open(fn_csv, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames or [], list(reader)
+
+
+def run_shard(infile, shard, directory, command, keep_shards=False):
+    """Write one shard, run the detector on it; returns (fieldnames, rows) of its CSV."""
+    fn_shard = shard_filename(directory, infile, shard)
+    fn_csv = f"{os.path.splitext(fn_shard)[0]}_detections.csv"
+    with runlog.stage("detect-shard", file=infile, shard=shard.index) as record:
+        write_shard(infile, shard, fn_shard)
+        cmd = shlex.split(command, posix=os.name != "nt") + [fn_shard]
+        record["command"] = os.path.basename(cmd[0])
+        record["returncode"] = runlog.run_process(cmd, record)
+        try:
+            if record["returncode"] != 0:
+                raise RuntimeError(f"detector exited with {record['returncode']}")
+            if not os.path.exists(fn_csv):
+                raise RuntimeError(f"detector wrote no {os.path.basename(fn_csv)}")
+            fieldnames, rows = read_shard_detections(fn_csv)
+            runlog.count(detections=len(rows))
+        finally:
+            if not keep_shards:
+                os.remove(fn_shard)
+    return fieldnames, rows
+
+
+def merge_shard_detections(results, shards, samplerate, infile, tolerance_secs=0.5):
+    """
+    One time-ordered list of detection rows from each shard's (fieldnames,
+    rows): times shifted onto the recording, each row kept only by the shard
+    owning its middle, and same-label detections from neighbouring shards
+    that overlap (within `tolerance_secs`) reduced to the more probable one.
+    """
+    kept = []
+    for shard, (_, rows) in zip(shards, results):
+        offset = shard.start / samplerate
+        for row in rows:
+            start_sec = float(row["start_sec"]) + offset
+            end_sec = float(row["end_sec"]) + offset
+            middle = (start_sec + end_sec) / 2.0 * samplerate
+            last = shard is shards[-1]
+            if middle < shard.core_start or (middle >= shard.core_end and not last):
+                continue
+            row = dict(row, start_sec=round(start_sec, 4), end_sec=round(end_sec, 4))
+            if "filename" in row:
+                row["filename"] = os.path.basename(infile)
+            if "path" in row:
+                row["path"] = os.path.abspath(infile)
+            kept.append((start_sec, end_sec, shard.index, row))
+    kept.sort(key=lambda item: item[:2])
+
+    def prob(row):
+        try:
+            return float(row.get("prob") or 0.0)
+        except ValueError:
+            return 0.0
+
+    merged = []
+    for start_sec, end_sec, index, row in kept:
+        duplicate = None
+        for i in range(len(merged) - 1, -1, -1):
+            other_start, other_end, other_index, other = merged[i]
+            if other_start < start_sec - 60.0:
+                break  # detections are short; nothing further back can overlap
+            if (
+                other_index != index
+                and other_end + tolerance_secs >= start_sec
+                and other.get("predicted_category") == row.get("predicted_category")
+            ):
+                duplicate = i
+                break
+        if duplicate is None:
+            merged.append((start_sec, end_sec, index, row))
+        elif prob(row) > prob(merged[duplicate][3]):
+            merged[duplicate] = (start_sec, end_sec, index, row)
+    return [row for _, _, _, row in merged]
+
+
+def detect_sharded(
+    infile,
+    command=DEFAULT_DETECTOR,
+    jobs=None,
+    shard_secs=DEFAULT_SHARD_SECS,
+    overlap_secs=DEFAULT_OVERLAP_SECS,
+    outfile=None,
+    keep_shards=False,
+):
+    """
+    Run `command` over `infile` in shards, at most `jobs` at once (default:
+    one per core), and write the merged `<infile_base>_detections.csv` (or
+    `outfile`). Nothing is written if any shard fails. Returns the number of
+    detections written.
+    """
+    info = sf.info(infile)
+    shards = plan_shards(info.frames, info.samplerate, shard_secs, overlap_secs)
+    outfile = outfile or f"{os.path.splitext(infile)[0]}_detections.csv"
+    directory = shard_dirname(infile)
+    os.makedirs(directory, exist_ok=True)
+    print(f"Detecting on {len(shards)} shards of {infile} with {jobs or os.cpu_count()} at a time.")
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+            futures = [
+                executor.submit(run_shard, infile, shard, directory, command, keep_shards)
+                for shard in shards
+            ]
+            results, failures = [], []
+            for shard, future in zip(shards, futures):
+                try:
+                    results.append(future.result())
+                except Exception as exc:
+                    failures.append(f"shard {shard.index}: {exc}")
+        if failures:
+            raise RuntimeError("; ".join(failures))
+    finally:
+        if not keep_shards:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    rows = merge_shard_detections(results, shards, info.samplerate, infile)
+    fieldnames = next((names for names, _ in results if names), ["start_sec", "end_sec"])
+    partial = outfile + ".partial"
+    with open(partial, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(partial, outfile)
+    print(f"Wrote {len(rows)} detections to {outfile}")
+    return len(rows)
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.option("-i", "--infile", required=True, type=str, help="wav/flac recording")
+@click.option("-j", "--jobs", type=int, default=None, help="Detector processes at once (default: one per core).")
+@click.option("--shard-minutes", default=DEFAULT_SHARD_SECS / 60, show_default=True, help="Length of each shard.")
+@click.option("--overlap", default=DEFAULT_OVERLAP_SECS, show_default=True, help="Seconds each shard overlaps its neighbours.")
+@click.option("--detector", default=DEFAULT_DETECTOR, show_default=True, help="Detector command; the shard file is appended.")
+@click.option("--keep-shards", is_flag=True, help="Keep the shard WAVs and CSVs in <infile_base>.shards/.")
+def run(infile, jobs, shard_minutes, overlap, detector, keep_shards):
+    """Write <infile_base>_detections.csv from a sharded, parallel detector run."""
+    assert os.path.exists(infile)
+    detect_sharded(
+        infile,
+        command=detector,
+        jobs=jobs,
+        shard_secs=shard_minutes * 60,
+        overlap_secs=overlap,
+        keep_shards=keep_shards,
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,34 @@
+"""
+Stand-in for `nighthawk --audacity-output` in the shard tests: writes
+<base>_detections.csv next to the WAV it is given, one row per run of loud
+50 ms frames. Exits 1 without writing anything if the file name contains
+$STUB_DETECTOR_FAIL.
+"""
+import os
+import sys
+
+import numpy as np
+import soundfile as sf
+
+HOP_SECS = 0.05
+LEVEL = 0.01
+
+
+def main(fn):
+    fail = os.environ.get("STUB_DETECTOR_FAIL")
+    if fail and fail in os.path.basename(fn):
+        sys.exit(1)
+    samples, samplerate = sf.read(fn, dtype="float32")
+    hop = int(HOP_SECS * samplerate)
+    n = len(samples) // hop
+    loud = np.mean(np.square(samples[: n * hop].reshape(n, hop)), axis=1) > LEVEL
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], loud.astype(int), [0]])))
+    with open(f"{os.path.splitext(fn)[0]}_detections.csv", "w") as f:
+        f.write("start_sec,end_sec,filename,path,predicted_category,prob\n")
+        for start, end in zip(edges[::2], edges[1::2]):
+            f.write(f"{start * hop / samplerate:.4f},{end * hop / samplerate:.4f},"
+                    f"{os.path.basename(fn)},{fn},bawwar,0.999\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[-1])
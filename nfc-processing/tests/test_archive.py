@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+from getsnips import ARCHIVE_MANIFEST, clip_file, clip_manifest_filename, remove_clips, reprocess_archive
+
+SAMPLERATE = 22050
+DETECTIONS = "start_sec,end_sec,predicted_category,prob\n10.0,11.0,bawwar,0.999\n30.2,32.0,SBUF,0.999\n"
+
+
+def write_recording(directory, name, secs=40.0):
+    directory.mkdir(parents=True, exist_ok=True)
+    fn = directory / f"{name}.wav"
+    sf.write(str(fn), np.zeros(int(secs * SAMPLERATE)), SAMPLERATE, subtype="PCM_16")
+    (directory / f"{name}_detections.csv").write_text(DETECTIONS)
+    return fn
+
+
+def clips(directory):
+    return sorted(name for name in os.listdir(directory / "clips") if name.endswith(".wav"))
+
+
+def test_rerun_skips_finished_recordings(tmp_path):
+    first = write_recording(tmp_path / "2023" / "2023-09-25", "rec-2023-09-25")
+    second = write_recording(tmp_path / "2023" / "2023-09-26", "rec-2023-09-26", secs=50.0)
+    assert reprocess_archive(str(tmp_path), jobs=2) == (2, 0, 0)
+    assert len(clips(first.parent)) == len(clips(second.parent)) == 2
+    with open(tmp_path / ARCHIVE_MANIFEST) as f:
+        manifest = json.load(f)
+    assert sorted(manifest) == [
+        os.path.join("2023", "2023-09-25", first.name),
+        os.path.join("2023", "2023-09-26", second.name),
+    ]
+
+    assert reprocess_archive(str(tmp_path), jobs=2) == (0, 2, 0)
+    assert reprocess_archive(str(tmp_path), jobs=2, force=True) == (2, 0, 0)
+    # other clip options are another task
+    assert reprocess_archive(str(tmp_path), jobs=2, merge_gap=None) == (2, 0, 0)
+
+    # so is a changed detections file, for that recording only
+    (first.parent / "rec-2023-09-25_detections.csv").write_text(DETECTIONS.replace("SBUF", "ZEEP"))
+    assert reprocess_archive(str(tmp_path), jobs=2, merge_gap=None) == (1, 1, 0)
+    # and the clip from before is gone, not left next to its replacement
+    assert sorted(name.split("-")[-1] for name in clips(first.parent)) == ["ZEEP.wav", "bawwar.wav"]
+
+
+def test_failed_recording_is_retried(tmp_path):
+    good = write_recording(tmp_path / "2023-09-25", "good")
+    bad = write_recording(tmp_path / "2023-09-26", "bad")
+    (bad.parent / "bad_detections.csv").write_text("start_sec,end_sec,predicted_category,prob\nnot,a,number,\n")
+    assert reprocess_archive(str(tmp_path), jobs=2) == (1, 0, 1)
+
+    (bad.parent / "bad_detections.csv").write_text(DETECTIONS)
+    assert reprocess_archive(str(tmp_path), jobs=2) == (1, 1, 0)
+    assert len(clips(good.parent)) == len(clips(bad.parent)) == 2
+
+
+def test_remove_clips(tmp_path):
+    recording = str(write_recording(tmp_path, "rec"))
+    (pack,) = clip_file(recording, merge_gap=None, pack=True)
+    fn_manifest = clip_manifest_filename(recording)
+    assert remove_clips(fn_manifest) == 2
+    assert not os.path.exists(pack) and not os.path.exists(fn_manifest)
+
+    written = clip_file(recording, merge_gap=None)
+    assert remove_clips(fn_manifest) == len(written) + 1
+    assert os.listdir(tmp_path / "clips") == []
@@ -0,0 +1,120 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audioreader import (
+    FlacIndexedReader,
+    SoundFileReader,
+    WavMemmapReader,
+    native_dtype,
+    open_audio,
+    verify_flac,
+)
+
+SAMPLERATE = 22050
+# (start, frames) reads, including one past the end
+READS = [(0, 1000), (12345, 4096), (SAMPLERATE * 7 + 3, 50000), (SAMPLERATE * 20 - 100, 500)]
+
+
+def write_noise(fn, subtype, channels=1, secs=20.0):
+    rng = np.random.default_rng(1)
+    samples = rng.uniform(-0.9, 0.9, (int(secs * SAMPLERATE), channels))
+    sf.write(fn, samples, SAMPLERATE, subtype=subtype)
+    return fn
+
+
+def assert_reads_match(reader, fn):
+    with sf.SoundFile(fn) as expected:
+        assert (reader.samplerate, reader.channels, reader.frames, reader.subtype) == (
+            expected.samplerate,
+            expected.channels,
+            expected.frames,
+            expected.subtype,
+        )
+        for dtype in (native_dtype(expected.subtype), "float32", "float64"):
+            for start, frames in READS:
+                reader.seek(start)
+                expected.seek(start)
+                np.testing.assert_array_equal(
+                    reader.read(frames, dtype=dtype, always_2d=True),
+                    expected.read(frames, dtype=dtype, always_2d=True),
+                    err_msg=f"{dtype} read of {frames} at {start}",
+                )
+                assert reader.tell() == expected.tell()
+
+
+@pytest.mark.parametrize("subtype", ["PCM_U8", "PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE"])
+@pytest.mark.parametrize("channels", [1, 2])
+def test_wav_reader_matches_soundfile(tmp_path, subtype, channels):
+    fn = write_noise(str(tmp_path / "noise.wav"), subtype, channels)
+    with open_audio(fn) as reader:
+        assert isinstance(reader, WavMemmapReader)
+        assert_reads_match(reader, fn)
+
+
+def test_wav_reader_with_unfinished_header(tmp_path):
+    # sox leaves the data chunk size at 0 when a recording is cut short
+    fn = write_noise(str(tmp_path / "cut.wav"), "PCM_16", secs=1.0)
+    expected, _ = sf.read(fn, dtype="int16")
+    with open(fn, "r+b") as f:
+        data = f.read()
+        f.seek(data.index(b"data") + 4)
+        f.write(b"\0\0\0\0")
+    with open_audio(fn) as reader:
+        assert reader.frames == SAMPLERATE
+        np.testing.assert_array_equal(reader.read(dtype="int16"), expected)
+
+
+@pytest.mark.parametrize("subtype", ["PCM_16", "PCM_24"])
+def test_flac_reader_matches_soundfile(tmp_path, subtype):
+    fn = write_noise(str(tmp_path / "noise.flac"), subtype)
+    with open_audio(fn) as reader:
+        assert isinstance(reader, FlacIndexedReader)
+        assert len(reader._index) > 10
+        assert_reads_match(reader, fn)
+
+
+def test_flac_index_sidecar(tmp_path):
+    fn = write_noise(str(tmp_path / "noise.flac"), "PCM_16")
+    with FlacIndexedReader(fn) as reader:
+        entries = reader._index
+    with open(f"{fn}.seekidx") as f:
+        saved = json.load(f)
+    assert [tuple(entry) for entry in saved["entries"]] == entries
+    samples = [sample for sample, _, _ in entries]
+    assert samples == sorted(set(samples))
+
+    # a saved index is reused as long as the file is unchanged
+    with open(f"{fn}.seekidx", "w") as f:
+        json.dump(dict(saved, entries=entries[:3]), f)
+    with FlacIndexedReader(fn) as reader:
+        assert reader._index == entries[:3]
+        assert_reads_match(reader, fn)
+
+    os.utime(fn, ns=(0, 0))
+    with FlacIndexedReader(fn) as reader:
+        assert reader._index == entries
+
+
+def test_open_audio_falls_back_to_soundfile(tmp_path):
+    fn = write_noise(str(tmp_path / "noise.ogg"), "VORBIS", secs=1.0)
+    with open_audio(fn) as reader:
+        assert isinstance(reader, SoundFileReader)
+
+
+def test_verify_flac(tmp_path):
+    fn = write_noise(str(tmp_path / "noise.flac"), "PCM_16", secs=5.0)
+    assert verify_flac(fn) == 5 * SAMPLERATE
+    with pytest.raises(ValueError):
+        verify_flac(fn, expected_frames=5 * SAMPLERATE + 1)
+
+    with open(fn, "rb") as f:
+        data = f.read()
+    truncated = str(tmp_path / "truncated.flac")
+    with open(truncated, "wb") as f:
+        f.write(data[: len(data) * 2 // 3])
+    with pytest.raises(ValueError):
+        verify_flac(truncated)
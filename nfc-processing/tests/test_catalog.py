@@ -0,0 +1,100 @@
+import csv
+import os
+
+import pytest
+from click.testing import CliRunner
+
+import catalog
+from getsnips import cli, index_detections
+
+HEADER = "start_sec,end_sec,filename,path,group,prob_group,species,prob_species,predicted_category,prob\n"
+SEPTEMBER = "rec-NFC-2023-09-25 2200-0400"
+OCTOBER = "rec-NFC-2023-10-01 2200-0400"
+
+
+def write_detections(directory, recording, rows):
+    fn = directory / f"{recording}_detections.csv"
+    fn.write_text(HEADER + "".join(f"{row}\n" for row in rows))
+    return fn
+
+
+@pytest.fixture
+def archive(tmp_path):
+    for night, recording, rows in [
+        (
+            "2023-09-25",
+            SEPTEMBER,
+            ["10.0,11.0,x.wav,x.wav,,,bawwar,0.999,bawwar,0.999", "3600.0,3601.5,x.wav,x.wav,ZEEP,0.9,,,ZEEP,0.9"],
+        ),
+        ("2023-10-01", OCTOBER, ["20.0,21.0,x.wav,x.wav,,,bawwar,0.95,bawwar,0.95"]),
+    ]:
+        directory = tmp_path / "archive" / night
+        directory.mkdir(parents=True)
+        write_detections(directory, recording, rows)
+    return tmp_path / "archive"
+
+
+def labels(db, **filters):
+    return [(row["category"], row["utc_start"]) for row in catalog.query(db, **filters)]
+
+
+def test_index_and_query(archive, tmp_path):
+    db_path = str(tmp_path / "catalog.sqlite")
+    assert index_detections([str(archive)], db_path) == (2, 0)
+
+    db = catalog.connect(db_path)
+    # recording names carry local time and its UTC offset
+    assert labels(db) == [
+        ("bawwar", "2023-09-26 02:00:10.000"),
+        ("ZEEP", "2023-09-26 03:00:00.000"),
+        ("bawwar", "2023-10-02 02:00:20.000"),
+    ]
+    assert len(labels(db, label="bawwar")) == 2
+    assert len(labels(db, label="ZEEP")) == 1
+    assert labels(db, label="bawwar", min_prob=0.99) == [("bawwar", "2023-09-26 02:00:10.000")]
+    # a bare --until date takes in that whole day
+    assert len(labels(db, since="2023-09-26", until="2023-09-26")) == 2
+    assert len(labels(db, since="2023-09-27")) == 1
+    assert len(labels(db, recording="2023-10-01")) == 1
+    assert len(labels(db, limit=2)) == 2
+
+    row = catalog.query(db, label="ZEEP")[0]
+    assert row["group_name"] == "ZEEP" and row["species"] is None
+    assert row["recording"] == str(archive / "2023-09-25" / f"{SEPTEMBER}.wav")
+    # below the clip threshold, so never clipped
+    assert row["clip_path"] is None
+    row = catalog.query(db, label="bawwar", min_prob=0.99)[0]
+    assert row["clip_path"].startswith(str(archive / "2023-09-25" / "clips"))
+    assert row["clip_path"].endswith("bawwar.wav")
+    db.close()
+
+
+def test_reindex_only_changed_files(archive, tmp_path):
+    db_path = str(tmp_path / "catalog.sqlite")
+    index_detections([str(archive)], db_path)
+    assert index_detections([str(archive)], db_path) == (0, 2)
+
+    write_detections(archive / "2023-10-01", OCTOBER, [])
+    os.remove(archive / "2023-09-25" / f"{SEPTEMBER}_detections.csv")
+    assert index_detections([str(archive)], db_path) == (1, 0)
+    db = catalog.connect(db_path)
+    # replaced by the now-empty file, and forgotten once deleted
+    assert labels(db) == []
+    assert db.execute("SELECT COUNT(*) FROM sources").fetchone()[0] == 1
+    db.close()
+
+
+def test_export_command(archive, tmp_path):
+    db_path = str(tmp_path / "catalog.sqlite")
+    outfile = str(tmp_path / "bawwar.csv")
+    runner = CliRunner()
+    result = runner.invoke(cli, ["index", str(archive), "--db", db_path])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(cli, ["export", "--db", db_path, "-l", "bawwar", "--since", "2023-10-01", "-o", outfile])
+    assert result.exit_code == 0, result.output
+
+    with open(outfile, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == catalog.COLUMNS
+    assert [(row["category"], row["prob"], row["start_sec"]) for row in rows] == [("bawwar", "0.95", "20.0")]
+    assert rows[0]["source"] == str(archive / "2023-10-01" / f"{OCTOBER}_detections.csv")
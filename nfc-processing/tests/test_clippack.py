@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+from click.testing import CliRunner
+
+from getsnips import (
+    cli,
+    clip_file,
+    clip_manifest_filename,
+    extract_clips,
+    read_clip_index,
+)
+
+SAMPLERATE = 22050
+DETECTIONS = [
+    "start_sec,end_sec,predicted_category,prob",
+    "10.0,11.0,bawwar,0.999",
+    "10.5,11.5,norwat,0.995",  # overlaps the first: shares its audio
+    "30.2,32.0,SBUF,0.999",
+    "45.0,46.0,ZEEP,0.5",  # below the clip threshold
+]
+
+
+def write_recording(directory, subtype="PCM_16", secs=60.0):
+    rng = np.random.default_rng(2)
+    fn = str(directory / f"rec-{subtype}.wav")
+    sf.write(fn, rng.uniform(-0.5, 0.5, int(secs * SAMPLERATE)), SAMPLERATE, subtype=subtype)
+    (directory / f"rec-{subtype}_detections.csv").write_text("\n".join(DETECTIONS) + "\n")
+    return fn
+
+
+@pytest.mark.parametrize("subtype, pack_ext", [("PCM_16", ".flac"), ("PCM_32", ".wav")])
+def test_pack_holds_the_same_clips(tmp_path, subtype, pack_ext):
+    recording = write_recording(tmp_path, subtype)
+    clips = clip_file(recording, outputdir=str(tmp_path / "clips"), merge_gap=None)
+    assert len(clips) == 3
+
+    packs = clip_file(recording, outputdir=str(tmp_path / "packed"), merge_gap=None, pack=True)
+    assert [os.path.basename(fn) for fn in packs] == [f"rec-{subtype}_clippack{pack_ext}"]
+    # nothing but the pack and its index
+    assert sorted(os.listdir(tmp_path / "packed")) == sorted(
+        [os.path.basename(packs[0]), f"rec-{subtype}_clips.csv"]
+    )
+
+    fn_manifest = clip_manifest_filename(recording, str(tmp_path / "packed"))
+    index = read_clip_index(fn_manifest)
+    assert sorted(row["clip"] for row in index) == sorted(os.path.basename(fn) for fn in clips)
+    assert sum(int(row["pack_frames"]) for row in index) == sf.info(packs[0]).frames
+
+    extracted = extract_clips(fn_manifest, outputdir=str(tmp_path / "extracted"))
+    assert sorted(os.path.basename(fn) for fn in extracted) == sorted(os.path.basename(fn) for fn in clips)
+    for clip in clips:
+        out = str(tmp_path / "extracted" / os.path.basename(clip))
+        assert sf.info(out).subtype == subtype
+        np.testing.assert_array_equal(sf.read(out, dtype="int32")[0], sf.read(clip, dtype="int32")[0])
+
+
+def test_extract_command_by_pattern(tmp_path):
+    recording = write_recording(tmp_path)
+    (pack,) = clip_file(recording, merge_gap=None, pack=True)
+    result = CliRunner().invoke(cli, ["extract", pack, "*bawwar*", "*SBUF*", "-o", str(tmp_path / "out")])
+    assert result.exit_code == 0, result.output
+    assert sorted(name.split("-")[-1] for name in os.listdir(tmp_path / "out")) == ["SBUF.wav", "bawwar.wav"]
+
+    result = CliRunner().invoke(cli, ["extract", str(tmp_path / "missing_clips.csv")])
+    assert result.exit_code != 0 and "No clip index" in result.output
+
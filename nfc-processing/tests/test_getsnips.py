@@ -0,0 +1,115 @@
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from getsnips import Detection, detection_mask, load_nighthawk_csv, merge_detections, read_detections
+
+HEADER = (
+    "start_sec,end_sec,filename,path,order,prob_order,family,prob_family,"
+    "group,prob_group,species,prob_species,predicted_category,prob\n"
+)
+ROWS = [
+    '30.2,32.0,night.wav,"D:\\birds, 2023\\night.wav",Passeriformes,0.97,Parulidae,0.95,SBUF,0.93,,,SBUF,0.93\n',
+    "132.4,134.2,night.wav,night.wav,Passeriformes,0.97,Parulidae,0.96,ZEEP,0.96,norwat,0.95,norwat,0.995\n",
+    "227.4,228.8,night.wav,night.wav,Passeriformes,0.96,Parulidae,0.92,,,,,Parulidae,0.9\n",
+    "232.4,234.0,night.wav,night.wav,Passeriformes,0.97,Parulidae,0.96,,,bawwar,0.9999,bawwar,0.9999\n",
+]
+
+
+def detection(start, length, prob=0.99, description="bawwar"):
+    return Detection(timedelta(seconds=start + length / 2.0), description, length, prob)
+
+
+def span(d):
+    middle = d.timestamp.total_seconds()
+    return middle - d.length_secs / 2.0, middle + d.length_secs / 2.0
+
+
+@pytest.fixture
+def nighthawk_csv(tmp_path):
+    fn = tmp_path / "night_detections.csv"
+    fn.write_text(HEADER + "".join(ROWS))
+    return str(fn)
+
+
+def test_merge_overlapping_and_close_detections():
+    detections = [
+        detection(10.0, 3.0, 0.995, "SBUF"),
+        detection(12.0, 3.0, 0.999, "bawwar"),
+        detection(15.3, 3.0, 0.991, "ZEEP"),  # 0.3 s after the last one ends
+        detection(30.0, 3.0, 0.999, "norwat"),
+    ]
+    merged = merge_detections(detections, gap_secs=0.5)
+    assert len(merged) == 2
+    assert span(merged[0]) == pytest.approx((10.0, 18.3))
+    assert merged[0].description == "bawwar" and merged[0].prob == 0.999
+    assert merged[0].members == tuple(detections[:3])
+    assert merged[1] == detections[3]
+
+
+def test_merge_respects_gap():
+    detections = [detection(10.0, 3.0), detection(14.0, 3.0)]
+    assert len(merge_detections(detections, gap_secs=0.5)) == 2
+    assert len(merge_detections(detections, gap_secs=1.0)) == 1
+
+
+def test_merge_caps_clip_length():
+    # a steady chorus: a detection every 0.5 s for a minute
+    detections = [detection(i * 0.5, 3.0) for i in range(120)]
+    merged = merge_detections(detections, gap_secs=0.5, max_clip_secs=10.0)
+    assert all(d.length_secs <= 10.0 for d in merged)
+    assert sum(len(d.members) for d in merged) == len(detections)
+    starts = [span(d)[0] for d in merged]
+    assert starts == sorted(starts)
+
+
+def test_merge_leaves_notes_rows_alone():
+    notes = [detection(10.0, 3.0, None, "a"), detection(11.0, 3.0, None, "b")]
+    assert merge_detections(notes) == notes
+
+
+def test_load_nighthawk_csv(nighthawk_csv):
+    columns = load_nighthawk_csv(nighthawk_csv)
+    assert columns["start_sec"].dtype == np.float64
+    np.testing.assert_allclose(columns["start_sec"], [30.2, 132.4, 227.4, 232.4])
+    assert columns["path"][0] == "D:\\birds, 2023\\night.wav"
+    assert list(columns["predicted_category"]) == ["SBUF", "norwat", "Parulidae", "bawwar"]
+    assert np.isnan(columns["prob_species"][0]) and columns["prob_species"][1] == 0.95
+    assert columns["species"][0] == ""
+
+
+def test_load_nighthawk_csv_columns_by_name(tmp_path):
+    fn = tmp_path / "reordered_detections.csv"
+    fn.write_text("prob,predicted_category,end_sec,start_sec\n0.5,ZEEP,2.0,1.0\n")
+    columns = load_nighthawk_csv(str(fn), ["start_sec", "end_sec", "prob"])
+    assert sorted(columns) == ["end_sec", "prob", "start_sec"]
+    assert columns["start_sec"][0] == 1.0 and columns["prob"][0] == 0.5
+    with pytest.raises(ValueError, match="no prob_species column"):
+        load_nighthawk_csv(str(fn), ["prob_species"])
+
+
+def test_load_header_only_csv(tmp_path):
+    fn = tmp_path / "empty_detections.csv"
+    fn.write_text(HEADER)
+    columns = load_nighthawk_csv(str(fn))
+    assert len(columns["start_sec"]) == 0
+    assert not detection_mask(columns).any()
+
+
+def test_detection_mask(nighthawk_csv):
+    columns = load_nighthawk_csv(nighthawk_csv)
+    assert list(detection_mask(columns, 0.99)) == [False, True, False, True]
+    assert list(detection_mask(columns, 0.9)) == [True, True, True, True]
+    # a per-category threshold overrides min_prob for that category only
+    assert list(detection_mask(columns, 0.99, {"SBUF": 0.9})) == [True, True, False, True]
+    # a level threshold applies to rows labelled at that level
+    assert list(detection_mask(columns, 0.9, {"prob_species": 0.99})) == [True, False, True, True]
+
+
+def test_read_detections(nighthawk_csv):
+    detections = read_detections(nighthawk_csv, 0.99)
+    assert [d.description for d in detections] == ["norwat", "bawwar"]
+    # padded by a second either side, and at least 3 s
+    assert span(detections[0]) == pytest.approx((131.4, 135.2))
+    assert span(detections[1]) == pytest.approx((231.4, 235.0))
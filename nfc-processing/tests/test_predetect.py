@@ -0,0 +1,83 @@
+import csv
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from predetect import (
+    SEGMENT_GAP_SECS,
+    TimeMapEntry,
+    find_candidates,
+    read_timemap,
+    remap_detections,
+    to_original_time,
+    write_candidate_audio,
+    write_timemap,
+)
+
+SAMPLERATE = 22050
+CALL_SECS = [30.0, 95.5, 96.5, 170.0]
+TIMEMAP = [TimeMapEntry(0.0, 100.0, 5.0), TimeMapEntry(5.5, 5000.0, 5.0)]
+
+
+def write_night(fn, secs=180.0):
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0.0, 0.01, int(secs * SAMPLERATE)).astype(np.float32)
+    t = np.arange(int(0.2 * SAMPLERATE)) / SAMPLERATE
+    for start in CALL_SECS:
+        i = int(start * SAMPLERATE)
+        samples[i : i + len(t)] += 0.3 * np.sin(2 * np.pi * 5000.0 * t)
+    sf.write(fn, samples, SAMPLERATE, subtype="PCM_16")
+    return fn
+
+
+def write_detections(fn, spans):
+    with open(fn, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["start_sec", "end_sec", "filename", "path", "predicted_category", "prob"])
+        for start, end in spans:
+            writer.writerow([start, end, "night-candidates.wav", "night-candidates.wav", "bawwar", 0.99])
+
+
+def test_candidates_cover_calls(tmp_path):
+    night = write_night(str(tmp_path / "night.wav"))
+    intervals = find_candidates(night, pad_secs=1.0)
+    # the two calls a second apart share one interval
+    assert len(intervals) == 3
+    for start in CALL_SECS:
+        assert any(a <= start and start + 0.2 <= b for a, b in intervals)
+
+    compact = str(tmp_path / "night-candidates.wav")
+    timemap = write_candidate_audio(night, intervals, compact)
+    assert [entry.original_start for entry in timemap] == pytest.approx([a for a, _ in intervals], abs=1e-4)
+    assert timemap[1].compact_start == pytest.approx(timemap[0].duration + SEGMENT_GAP_SECS)
+    assert sf.info(compact).duration == pytest.approx(
+        sum(b - a for a, b in intervals) + 2 * SEGMENT_GAP_SECS, abs=1e-3
+    )
+
+    fn = str(tmp_path / "night-candidates.timemap.csv")
+    write_timemap(timemap, fn)
+    assert read_timemap(fn) == timemap
+
+
+def test_to_original_time():
+    assert to_original_time(4.6, TIMEMAP) == pytest.approx(104.6)
+    assert to_original_time(6.0, TIMEMAP) == pytest.approx(5000.5)
+    # inside the gap: the end of the region before it
+    assert to_original_time(5.2, TIMEMAP) == pytest.approx(105.0)
+
+
+def test_remap_detection_across_splice(tmp_path):
+    compact_csv = str(tmp_path / "night-candidates_detections.csv")
+    write_detections(compact_csv, [(4.6, 5.8), (6.0, 7.0)])
+    outfile = str(tmp_path / "night_detections.csv")
+    assert remap_detections(compact_csv, TIMEMAP, outfile, str(tmp_path / "night.wav")) == 2
+
+    with open(outfile, newline="") as f:
+        rows = list(csv.DictReader(f))
+    # the first detection runs into the next region; it ends where its own does
+    assert [(float(row["start_sec"]), float(row["end_sec"])) for row in rows] == pytest.approx(
+        [(104.6, 105.0), (5000.5, 5001.5)]
+    )
+    assert rows[0]["filename"] == "night.wav"
+    assert rows[0]["path"] == str(tmp_path / "night.wav")
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+from pyramid import ZOOM_FACTOR, build_pyramid, is_current, pyramid_dirname, read_range
+
+SAMPLERATE = 22050
+
+
+def write_night(fn, secs=60.0):
+    rng = np.random.default_rng(3)
+    samples = rng.normal(0.0, 0.001, int(secs * SAMPLERATE)).astype(np.float32)
+    # one short 5 kHz call at 40 s
+    t = np.arange(int(0.05 * SAMPLERATE)) / SAMPLERATE
+    i = int(40.0 * SAMPLERATE)
+    samples[i : i + len(t)] += 0.5 * np.sin(2 * np.pi * 5000.0 * t)
+    sf.write(fn, samples, SAMPLERATE, subtype="PCM_16")
+    return fn
+
+
+def test_levels_keep_short_calls(tmp_path):
+    night = write_night(str(tmp_path / "night.wav"))
+    meta = build_pyramid(night)
+    levels = meta["levels"]
+    assert levels[0] == 1 + (60 * SAMPLERATE - 256) // 256
+    assert all(after == -(-before // ZOOM_FACTOR) for before, after in zip(levels, levels[1:]))
+
+    directory = pyramid_dirname(night)
+    # zoomed right out, the call still has the loudest column
+    image = read_range(directory, width=100)
+    assert image.shape == (meta["n_bins"], 100)
+    assert image.max(axis=0).argmax() == 66
+    image = read_range(directory, 39.0, 41.0, width=100, min_frequency=4000, max_frequency=6000)
+    assert image.max() > 200
+
+
+def test_is_current(tmp_path):
+    night = write_night(str(tmp_path / "night.wav"))
+    assert not is_current(night)
+    build_pyramid(night)
+    assert is_current(night)
+
+    os.utime(night, ns=(0, 0))
+    assert not is_current(night)
+    build_pyramid(night)
+
+    # the recorder deletes the WAV; the pyramid is still served
+    os.remove(night)
+    assert is_current(night)
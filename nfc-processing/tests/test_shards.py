@@ -0,0 +1,113 @@
+import csv
+import os
+import shlex
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import shards
+
+SAMPLERATE = 8000
+SHARD_SECS = 20.0
+OVERLAP_SECS = 2.0
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_detector.py")
+DETECTOR = f"{shlex.quote(sys.executable)} {shlex.quote(STUB)}"
+# call starts: mid-shard, straddling shard boundaries (20 s, 60 s, 160 s) and
+# inside the tail that gets folded into the last shard
+CALL_SECS = [3.0, 19.8, 33.3, 59.9, 101.0, 159.7, 180.4]
+CALL_LENGTH = 0.4
+
+
+def write_night(fn, secs=9 * SHARD_SECS + 1.0):
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0.0, 0.01, int(secs * SAMPLERATE)).astype(np.float32)
+    t = np.arange(int(CALL_LENGTH * SAMPLERATE)) / SAMPLERATE
+    for start in CALL_SECS:
+        i = int(start * SAMPLERATE)
+        samples[i : i + len(t)] += 0.5 * np.sin(2 * np.pi * 1000.0 * t)
+    sf.write(fn, samples, SAMPLERATE, subtype="PCM_16")
+    return fn
+
+
+def read_rows(fn):
+    with open(fn, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.fixture
+def night(tmp_path):
+    return write_night(str(tmp_path / "night.wav"))
+
+
+def test_plan_shards_covers_every_frame_once():
+    frames = int((9 * SHARD_SECS + 1.0) * SAMPLERATE)
+    planned = shards.plan_shards(frames, SAMPLERATE, SHARD_SECS, OVERLAP_SECS)
+    assert len(planned) == 9
+    assert planned[0].core_start == 0 and planned[-1].core_end == frames
+    for before, after in zip(planned, planned[1:]):
+        assert before.core_end == after.core_start
+        assert after.start == after.core_start - OVERLAP_SECS * SAMPLERATE
+    assert [shard.index for shard in planned] == list(range(9))
+
+
+def test_plan_shards_folds_short_tail():
+    frames = int((2 * SHARD_SECS + 1.0) * SAMPLERATE)
+    planned = shards.plan_shards(frames, SAMPLERATE, SHARD_SECS, OVERLAP_SECS)
+    assert len(planned) == 2
+    assert planned[-1].core_start == SHARD_SECS * SAMPLERATE
+    assert planned[-1].core_end == planned[-1].end == frames
+
+    # a tail longer than the overlap is a shard of its own
+    frames = int((2 * SHARD_SECS + 3.0) * SAMPLERATE)
+    assert len(shards.plan_shards(frames, SAMPLERATE, SHARD_SECS, OVERLAP_SECS)) == 3
+
+
+def test_sharded_run_matches_whole_file_run(night, tmp_path):
+    subprocess.run(shlex.split(DETECTOR) + [night], check=True)
+    whole = read_rows(f"{os.path.splitext(night)[0]}_detections.csv")
+    assert len(whole) == len(CALL_SECS)
+
+    outfile = str(tmp_path / "sharded_detections.csv")
+    n = shards.detect_sharded(
+        night, DETECTOR, jobs=3, shard_secs=SHARD_SECS, overlap_secs=OVERLAP_SECS, outfile=outfile
+    )
+    sharded = read_rows(outfile)
+    assert n == len(sharded) == len(whole)
+    for row, expected in zip(sharded, whole):
+        # the stub's 50 ms frames fall on a different grid in each shard
+        assert float(row["start_sec"]) == pytest.approx(float(expected["start_sec"]), abs=0.06)
+        assert float(row["end_sec"]) == pytest.approx(float(expected["end_sec"]), abs=0.06)
+        assert row["filename"] == "night.wav"
+        assert row["path"] == os.path.abspath(night)
+    assert not os.path.exists(shards.shard_dirname(night))
+
+
+def test_merge_keeps_boundary_call_once():
+    planned = shards.plan_shards(int(40 * SAMPLERATE), SAMPLERATE, SHARD_SECS, OVERLAP_SECS)
+    header = ["start_sec", "end_sec", "predicted_category", "prob"]
+    # one call at 19.9-20.1 s: shard 0 puts its middle just before the
+    # boundary, shard 1 just after, so each owns its copy
+    first = {"start_sec": "19.85", "end_sec": "20.10", "predicted_category": "bawwar", "prob": "0.95"}
+    second = {"start_sec": "1.90", "end_sec": "2.15", "predicted_category": "bawwar", "prob": "0.99"}
+    other = {"start_sec": "1.90", "end_sec": "2.15", "predicted_category": "norwat", "prob": "0.9"}
+    results = [(header, [first]), (header, [second, other])]
+    rows = shards.merge_shard_detections(results, planned, SAMPLERATE, "night.wav")
+    assert [(row["predicted_category"], row["prob"]) for row in rows] == [
+        ("bawwar", "0.99"),
+        ("norwat", "0.9"),
+    ]
+    assert rows[0]["start_sec"] == pytest.approx(19.9)
+
+
+def test_failed_shard_fails_the_run(night, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_DETECTOR_FAIL", "shard004")
+    outfile = str(tmp_path / "sharded_detections.csv")
+    with pytest.raises(RuntimeError, match="shard 4: detector exited with 1"):
+        shards.detect_sharded(
+            night, DETECTOR, jobs=3, shard_secs=SHARD_SECS, overlap_secs=OVERLAP_SECS, outfile=outfile
+        )
+    assert not os.path.exists(outfile)
+    assert not os.path.exists(shards.shard_dirname(night))